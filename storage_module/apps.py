@@ -5,6 +5,9 @@ from edc_base.apps import AppConfig as BaseEdcBaseAppConfig
 class AppConfig(DjangoAppConfig):
     name = 'storage_module'
 
+    def ready(self):
+        from storage_module import signals  # noqa: F401
+
 
 class EdcBaseAppConfig(BaseEdcBaseAppConfig):
     project_name = 'storage_module'
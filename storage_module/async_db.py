@@ -0,0 +1,80 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    """
+    The bounded pool that async views run their database work on.
+
+    The database drivers Django 4.2 supports are all synchronous, and its
+    async queryset methods hand every query to sync_to_async's single
+    thread-sensitive thread, so queries issued together still run one after
+    another. Threads of this pool run them side by side instead. Each keeps
+    its own connection, so STORAGE_ASYNC_DB_THREADS also caps the
+    connections async views hold open.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.STORAGE_ASYNC_DB_THREADS,
+                thread_name_prefix='storage-db')
+    return _executor
+
+
+def _call(function, args, kwargs):
+    try:
+        return function(*args, **kwargs)
+    except DatabaseError:
+        # Drop a broken connection, e.g. after a database restart, so the
+        # next query on this thread reconnects.
+        close_old_connections()
+        raise
+
+
+async def run(function, *args, **kwargs):
+    """
+    Runs synchronous database code on the pool without blocking the event
+    loop. It runs in a copy of the caller's context, so the replica routing
+    of the request applies to it.
+    """
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(
+        executor(), partial(context.run, _call, function, args, kwargs))
+
+
+async def gather(*functions):
+    """
+    Runs independent database calls concurrently on the pool.
+
+    Args:
+        functions: Callables taking no arguments, such as bound count
+            methods of querysets.
+
+    Returns:
+        Their results, in order.
+    """
+    return await asyncio.gather(*(run(function) for function in functions))
+
+
+def login_required(view):
+    """
+    login_required for async views. The user is loaded on the pool, as
+    request.user reads the session and user tables on first access.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await run(lambda: request.user.is_authenticated):
+            from django.contrib.auth.views import redirect_to_login
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
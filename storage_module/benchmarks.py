@@ -0,0 +1,260 @@
+import json
+import os
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from storage_module import reference, search, slots
+from storage_module.generators import StorageDataGenerator
+from storage_module.models import BoxPosition, ContainerOccupancy, DimBox, DimFreezer, \
+    DimRack, DimShelf
+from storage_module.snapshots import restore_snapshot, save_snapshot
+
+DATASETS = {
+    'small': {'facilities': 1, 'samples': 5000},
+    'medium': {'facilities': 2, 'samples': 20000},
+    'large': {'facilities': 4, 'samples': 200000},
+}
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), 'benchmark_baselines.json')
+
+BENCHMARK_USER = 'benchmark'
+
+# Samples moved by the wizard scenarios. The wizard must cost the same
+# number of queries whatever the number of samples it moves.
+MOVE_WIZARD_SAMPLES = {'move_wizard': 2, 'move_wizard_many': 20}
+
+
+class Fixtures:
+    """The objects each scenario is pointed at, picked the same way every run."""
+
+    def __init__(self):
+        # A freezer holding loose boxes as well as shelves and racks, so every
+        # dataset exercises the same code paths and only differs in size.
+        self.freezer = DimFreezer.objects.filter(
+            boxes__shelf=None, boxes__rack=None).order_by('id').first()
+        self.facility = self.freezer.facility
+        self.shelf = DimShelf.objects.filter(freezer=self.freezer).order_by('id').first()
+        self.rack = DimRack.objects.filter(shelf=self.shelf).order_by('id').first()
+        self.box = DimBox.objects.filter(rack=self.rack).order_by('id').first()
+        positions = BoxPosition.objects.filter(box=self.box).order_by('id')
+        self.sample_id = positions.values_list('sample_id', flat=True).first()
+        self.move_sample_ids = list(positions.values_list('sample_id', flat=True)[
+            :MOVE_WIZARD_SAMPLES['move_wizard_many']])
+        # The box with the most room anywhere, so the wizard can move many
+        # samples to it, and the freezer and facility the wizard finds it in.
+        room = ContainerOccupancy.objects.filter(
+            container_type=ContainerOccupancy.BOX, container_id=OuterRef('pk')).values(
+            room=F('capacity') - F('stored_samples'))
+        self.target_box = DimBox.objects.with_location().exclude(pk=self.box.pk).annotate(
+            room=Subquery(room)).order_by('-room', 'id').first()
+        self.target_freezer = self.target_box.location['freezer']
+        self.target_facility = self.target_box.location['facility']
+        self.move_positions = self.wizard_positions()
+
+    def wizard_positions(self):
+        """
+        Free slots of the target box for the samples the wizard moves, as the
+        form offers them: 1-based columns and row letters. Repeated runs post
+        the same slots, which the samples already hold after the first run,
+        so every run does the same work. Sample i always goes to slot i, so
+        the scenarios moving a few and many of the samples agree on where
+        they go.
+        """
+        return [(x_position + 1, y_position) for x_position, y_position
+                in slots.free_slots(self.target_box)][:len(self.move_sample_ids)]
+
+
+def wizard_flow(client, fixtures, count):
+    """Walks SampleMoveWizard from the facility step to a move of count samples."""
+    positions = fixtures.move_positions[:count]
+    sample_ids = fixtures.move_sample_ids[:len(positions)]
+    url = reverse('move_samples') + '?sample_ids=' + ','.join(sample_ids)
+    step = 'sample_move_wizard-current_step'
+    client.get(url)
+    client.post(url, {step: '0', '0-facility': fixtures.target_facility.id})
+    client.post(url, {step: '1', '1-freezer': fixtures.target_freezer.id})
+    client.post(url, {step: '2', '2-box': fixtures.target_box.id})
+    data = {step: '3', 'form-TOTAL_FORMS': len(positions),
+            'form-INITIAL_FORMS': len(positions)}
+    for index, (x_position, y_position) in enumerate(positions):
+        data[f'form-{index}-new_x_position'] = x_position
+        data[f'form-{index}-new_y_position'] = y_position
+    return client.post(url, data)
+
+
+SCENARIOS = {
+    'facility_list': lambda client, f: client.get(reverse('storage_view')),
+    'facility_detail': lambda client, f: client.get(
+        reverse('facility_detail', args=[f.facility.id])),
+    'freezer_detail': lambda client, f: client.get(
+        reverse('freezer_detail', args=[f.freezer.id])),
+    'shelf_detail': lambda client, f: client.get(
+        reverse('shelf_detail', args=[f.shelf.id])),
+    'rack_detail': lambda client, f: client.get(reverse('rack_detail', args=[f.rack.id])),
+    'box_detail': lambda client, f: client.get(reverse('box_detail', args=[f.box.id])),
+    'sample_detail': lambda client, f: client.get(
+        reverse('sample_detail', args=[f.sample_id])),
+    'samples': lambda client, f: client.get(reverse('samples_url')),
+    'samples_deep_page': lambda client, f: client.get(
+        reverse('samples_url') + '?last=1'),
+    'samples_search': lambda client, f: client.get(
+        reverse('samples_url') + '?search=' + f.sample_id[-6:]),
+    'freezer_data': lambda client, f: client.get(
+        reverse('freezer_data', args=[f.freezer.id])),
+    'move_wizard': lambda client, f: wizard_flow(
+        client, f, MOVE_WIZARD_SAMPLES['move_wizard']),
+    'move_wizard_many': lambda client, f: wizard_flow(
+        client, f, MOVE_WIZARD_SAMPLES['move_wizard_many']),
+}
+
+
+def load_dataset(name, snapshot_dir=None, stdout=None):
+    """
+    Fills the current database with a named dataset, restoring its snapshot
+    when one exists and generating (then saving) it otherwise.
+    """
+    cache.clear()
+    search.reset_state()
+    try:
+        restore_snapshot(f'benchmark-{name}', snapshot_dir)
+        # Snapshots taken before a model was added lack its table.
+        call_command('migrate', run_syncdb=True, verbosity=0)
+    except FileNotFoundError:
+        call_command('flush', interactive=False, verbosity=0)
+        # flush leaves the search table alone; empty it before the generator
+        # indexes the new samples chunk by chunk.
+        search.rebuild()
+        StorageDataGenerator(seed=0, stdout=stdout, **DATASETS[name]).run()
+        User.objects.create_superuser(BENCHMARK_USER, '', BENCHMARK_USER)
+        save_snapshot(f'benchmark-{name}', snapshot_dir)
+    search.reset_state()
+
+
+def cold_caches():
+    """
+    Empties the fragment, slot and reference caches, so a request takes the
+    cache-miss path a budget has to cover. With the caches warm, an N+1 query
+    on that path would go unnoticed.
+    """
+    cache.clear()
+    reference.reset_state()
+
+
+def measure(scenario, client, fixtures, repeat=3):
+    """
+    Runs a scenario once to warm Python up, then repeat times for wall time,
+    and once more under tracemalloc for the query count and peak memory,
+    every measured run starting from cold caches.
+    """
+    SCENARIOS[scenario](client, fixtures)
+    timings = []
+    for _ in range(repeat):
+        cold_caches()
+        started = time.perf_counter()
+        response = SCENARIOS[scenario](client, fixtures)
+        timings.append(time.perf_counter() - started)
+
+    cold_caches()
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as queries:
+        SCENARIOS[scenario](client, fixtures)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        'status': response.status_code,
+        'seconds': round(min(timings), 4),
+        'queries': len(queries.captured_queries),
+        'peak_kb': round(peak / 1024),
+    }
+
+
+def run(datasets, scenarios=None, repeat=3, snapshot_dir=None, stdout=None):
+    """
+    Returns:
+        A {dataset: {scenario: result}} dict.
+    """
+    results = {}
+    for dataset in datasets:
+        load_dataset(dataset, snapshot_dir, stdout)
+        client = Client()
+        client.force_login(User.objects.get(username=BENCHMARK_USER))
+        fixtures = Fixtures()
+        results[dataset] = {
+            scenario: measure(scenario, client, fixtures, repeat)
+            for scenario in (scenarios or SCENARIOS)}
+    return results
+
+
+def check(results, baselines, time_tolerance=2.0):
+    """
+    Compares results to the stored baselines and to each other.
+
+    A scenario fails when it errors, when it issues more queries than its
+    baseline, when it is more than time_tolerance times slower than its
+    baseline, or when its query count grows with the dataset size, which is
+    the signature of an N+1 query. The wizard also fails when moving many
+    samples costs more queries than moving a few.
+
+    Returns:
+        A list of failure messages.
+    """
+    failures = []
+    for dataset, scenarios in results.items():
+        for scenario, result in scenarios.items():
+            label = f'{dataset}/{scenario}'
+            if result['status'] >= 400:
+                failures.append(f"{label} returned HTTP {result['status']}")
+            baseline = baselines.get(dataset, {}).get(scenario)
+            if not baseline:
+                continue
+            if result['queries'] > baseline['queries']:
+                failures.append(f"{label} ran {result['queries']} queries, budget is "
+                                f"{baseline['queries']}")
+            if result['seconds'] > baseline['seconds'] * time_tolerance:
+                failures.append(f"{label} took {result['seconds']}s, baseline is "
+                                f"{baseline['seconds']}s")
+
+    for dataset, scenarios in results.items():
+        few, many = scenarios.get('move_wizard'), scenarios.get('move_wizard_many')
+        if few and many and many['queries'] > few['queries']:
+            failures.append(
+                f"{dataset}/move_wizard_many ran {many['queries']} queries to move "
+                f"{MOVE_WIZARD_SAMPLES['move_wizard_many']} samples but move_wizard "
+                f"ran {few['queries']} to move {MOVE_WIZARD_SAMPLES['move_wizard']}; "
+                f"query count must not grow with the samples moved")
+
+    ordered = [dataset for dataset in DATASETS if dataset in results]
+    for smaller, larger in zip(ordered, ordered[1:]):
+        for scenario, result in results[larger].items():
+            previous = results[smaller].get(scenario)
+            if previous and result['queries'] > previous['queries']:
+                failures.append(
+                    f"{scenario} ran {previous['queries']} queries on {smaller} but "
+                    f"{result['queries']} on {larger}; query count must not grow "
+                    f"with the data")
+    return failures
+
+
+def load_baselines(path=BASELINES_PATH):
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baselines(results, path=BASELINES_PATH):
+    baselines = load_baselines(path)
+    for dataset, scenarios in results.items():
+        baselines.setdefault(dataset, {}).update(scenarios)
+    with open(path, 'w') as baseline_file:
+        json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
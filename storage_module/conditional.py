@@ -0,0 +1,127 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from storage_module import async_db, reference, versions
+
+
+def is_cacheable(request):
+    """
+    Pages are rendered in full for anonymous users, who are redirected to log
+    in, and while messages are waiting to be shown.
+    """
+    return request.user.is_authenticated and not len(get_messages(request))
+
+
+def page_version(request, version):
+    """
+    The ETag of a page at a data version. The user and the CSRF cookie are
+    part of the tag, as the page shows the user's name and embeds a CSRF
+    token that is only valid with that cookie.
+    """
+    if not is_cacheable(request):
+        return None
+    key = f"{version}:{request.user.pk}:{request.META.get('CSRF_COOKIE', '')}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def modified_at(request, modified):
+    if not is_cacheable(request):
+        return None
+    return datetime.fromtimestamp(modified / 1e9, tz=timezone.utc)
+
+
+def container_version(level, url_kwarg, reference_names=()):
+    """
+    Returns a function(request, **kwargs) giving the (version, modified)
+    pair of a container page.
+    """
+    def version(request, **kwargs):
+        container_version, modified = versions.container_version(
+            level, kwargs.get(url_kwarg))
+        # Reference versions are seeded from the clock too, so they can stand
+        # in for a modification time.
+        extra = [reference.current_version(name) for name in reference_names]
+        return '.'.join(map(str, [container_version, *extra])), max([modified, *extra])
+    return version
+
+
+def global_version(request, **kwargs):
+    return versions.global_version()
+
+
+def version_condition(version):
+    def etag(request, *args, **kwargs):
+        return page_version(request, version(request, **kwargs)[0])
+
+    def last_modified(request, *args, **kwargs):
+        return modified_at(request, version(request, **kwargs)[1])
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def container_condition(level, url_kwarg, reference_names=()):
+    """
+    Answers conditional GETs of a container page from the container's data
+    version, before the view runs.
+
+    Args:
+        level: The ContainerOccupancy level of the container.
+        url_kwarg: The URL keyword argument holding the container id.
+        reference_names: Reference lists the page also shows, such as the
+            boxes offered in a form.
+    """
+    return version_condition(container_version(level, url_kwarg, reference_names))
+
+
+def global_condition():
+    """Answers conditional GETs of pages summarising all storage data."""
+    return version_condition(global_version)
+
+
+def async_condition(version):
+    """
+    The counterpart of version_condition for async views, which Django
+    4.2's condition decorator cannot wrap. The version is read on the
+    database pool.
+    """
+    def validators(request, kwargs):
+        current, modified = version(request, **kwargs)
+        last_modified = modified_at(request, modified)
+        return (page_version(request, current),
+                int(last_modified.timestamp()) if last_modified else None)
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return await view(request, *args, **kwargs)
+            etag, last_modified = await async_db.run(validators, request, kwargs)
+            response = get_conditional_response(
+                request, etag=quote_etag(etag) if etag else None,
+                last_modified=last_modified)
+            if response is None:
+                response = await view(request, *args, **kwargs)
+                if etag and not response.has_header('ETag'):
+                    response.headers['ETag'] = quote_etag(etag)
+                if last_modified and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
+
+
+def async_container_condition(level, url_kwarg, reference_names=()):
+    """container_condition for async views."""
+    return async_condition(container_version(level, url_kwarg, reference_names))
+
+
+def conditional_view(decorator):
+    """Applies a conditional GET decorator to the dispatch of a class-based view."""
+    return method_decorator(decorator, name='dispatch')
@@ -0,0 +1,172 @@
+import csv
+import re
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+
+from storage_module import selections
+from storage_module.models import DimSample, SampleSelection
+
+EXPORT_COLUMNS = [
+    ('Sample ID', 'sample_id'),
+    ('Sample Type', 'sample_type__sample_type'),
+    ('Facility Name', 'facility_name'),
+    ('Source File Name', 'source_file__source_file_name'),
+    ('Box Name', 'box_name'),
+    ('Time Sampled', 'date_sampled'),
+    ('Sample Status', 'sample_status__name'),
+]
+
+CHUNK_SIZE = 2000
+
+# Control characters that are not allowed anywhere in an XML document.
+XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def export_rows(samples, progress=None):
+    """
+    Yields the export columns of every sample from joined queries, read from
+    the database in chunks.
+
+    Args:
+        samples: Samples from DimSample.objects.with_location(), which
+            provides the location columns, in sample_id order, or a
+            SampleSelection, whose samples are read a chunk of primary keys
+            at a time, in primary key order.
+        progress: For a selection, called with the number of samples in
+            each chunk once its rows are yielded.
+    """
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    if isinstance(samples, SampleSelection):
+        for pks in selections.chunks(samples, size=CHUNK_SIZE):
+            chunk = DimSample.objects.with_location().filter(pk__in=pks)
+            for row in chunk.values_list(*lookups).order_by('pk'):
+                yield ['' if value is None else value for value in row]
+            if progress:
+                progress(len(pks))
+        return
+    rows = samples.values_list(*lookups).order_by('sample_id')
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield ['' if value is None else value for value in row]
+
+
+class Echo:
+    """A file-like object whose write returns the value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(samples, progress=None):
+    writer = csv.writer(Echo())
+    yield writer.writerow([header for header, _ in EXPORT_COLUMNS])
+    for row in export_rows(samples, progress):
+        yield writer.writerow(row)
+
+
+class DrainingBuffer:
+    """An unseekable sink for zipfile whose contents are handed out as they arrive."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" '
+        'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/'
+        'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'relationships"><Relationship Id="rId1" Type="http://schemas.openxmlformats.org'
+        '/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Samples" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/'
+        'relationships"><Relationship Id="rId1" Type="http://schemas.openxmlformats.org'
+        '/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'),
+}
+
+
+def xml_text(value):
+    return escape(XML_ILLEGAL.sub('', str(value)))
+
+
+def xlsx_row(values):
+    cells = ''.join(f'<c t="inlineStr"><is><t>{xml_text(value)}</t></is></c>'
+                    for value in values)
+    return f'<row>{cells}</row>'
+
+
+def stream_xlsx(samples, progress=None):
+    """
+    Streams a single-sheet workbook. The sheet is written row by row into a
+    zip archive whose compressed bytes are yielded as they are produced, so
+    only one chunk of rows is ever held in memory.
+    """
+    buffer = DrainingBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS.items():
+            archive.writestr(name, content)
+        yield buffer.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/'
+                b'2006/main"><sheetData>')
+            sheet.write(xlsx_row([header for header, _ in EXPORT_COLUMNS]).encode())
+            for count, row in enumerate(export_rows(samples, progress), start=1):
+                sheet.write(xlsx_row(row).encode())
+                if count % CHUNK_SIZE == 0:
+                    yield buffer.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.drain()
+
+
+def export_response(samples, file_format='csv'):
+    """
+    Returns a StreamingHttpResponse with the samples, a queryset or a
+    SampleSelection, as a CSV or XLSX attachment.
+    """
+    timestamp_str = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    if file_format == 'xlsx':
+        response = StreamingHttpResponse(stream_xlsx(samples),
+                                         content_type=XLSX_CONTENT_TYPE)
+    else:
+        file_format = 'csv'
+        response = StreamingHttpResponse(stream_csv(samples), content_type='text/csv')
+    response['Content-Disposition'] = (
+        f'attachment; filename=samples_{timestamp_str}.{file_format}')
+    return response
@@ -1,22 +1,40 @@
 from django import forms
-from django.db.models import Q
 
+from storage_module.locations import boxes_under
 from storage_module.models import DimBox, DimFacility, DimFreezer, DimRack, \
     DimShelf
+from storage_module.slots import SlotMap
 
 
 class MoveSampleForm(forms.Form):
     box = forms.ModelChoiceField(queryset=DimBox.objects.all(),
                                  widget=forms.Select(attrs={"class": "select2"}))
+    # The 1-based column and the row letter, as labelled on the box grid.
     x_position = forms.IntegerField(
-        widget=forms.NumberInput(attrs={'class': 'form-control'}))
-    y_position = forms.IntegerField(
-        widget=forms.NumberInput(attrs={'class': 'form-control'}))
+        min_value=1, widget=forms.NumberInput(attrs={'class': 'form-control'}))
+    y_position = forms.RegexField(
+        regex=r'^[A-Za-z]$', max_length=1,
+        widget=forms.TextInput(attrs={'class': 'form-control'}))
 
     def __init__(self, *args, **kwargs):
         super(MoveSampleForm, self).__init__(*args, **kwargs)
         self.fields['box'].label_from_instance = lambda obj: "{}".format(obj.box_name)
 
+    def clean_y_position(self):
+        return self.cleaned_data['y_position'].upper()
+
+
+class SampleTransferForm(forms.Form):
+    target_box = forms.ModelChoiceField(
+        queryset=DimBox.objects.all(), required=False,
+        empty_label='---Choose positions in the wizard---',
+        widget=forms.Select(attrs={"class": "select2"}))
+
+    def __init__(self, *args, **kwargs):
+        super(SampleTransferForm, self).__init__(*args, **kwargs)
+        self.fields['target_box'].label_from_instance = lambda obj: "{}".format(
+            obj.box_name)
+
 
 class MoveBoxForm(forms.Form):
     freezer = forms.ModelChoiceField(
@@ -63,33 +81,47 @@ class BoxForm(forms.Form):
         super().__init__(*args, **kwargs)
         self.sample_ids = sample_ids
         if freezer is not None:
-            all_boxes = DimBox.objects.filter(
-                Q(shelf__freezer=freezer) |
-                Q(rack__shelf__freezer=freezer) |
-                Q(rack__freezer=freezer) |
-                Q(freezer=freezer)
-            )
-            self.fields['box'].queryset = all_boxes
+            self.fields['box'].queryset = boxes_under(freezer)
 
     box = forms.ModelChoiceField(queryset=DimBox.objects.none(),
                                  required=False, )
 
 
+def position_choices(box):
+    """
+    The (column, row) choices for positions in a box, covering its whole
+    grid as laid out by SlotMap. Columns are offered 1-based, as labelled
+    on the grid.
+    """
+    grid = SlotMap(*box.grid_dimensions)
+    rows = [grid.position(row * grid.columns)[1] for row in range(grid.rows)]
+    return ([(column, str(column)) for column in range(1, grid.columns + 1)],
+            [(row, row) for row in rows])
+
+
 class SampleMoveForm(forms.Form):
     new_x_position = forms.ChoiceField(
-        choices=[(1, '1'), (2, '2'), (3, '3'), (4, '4'), (5, '5'), (6, '6'), (7, '7'),
-                 (9, '9')],
         widget=forms.Select(attrs={"class": "form-control form-control-sm select2"}),
         required=False
     )
     new_y_position = forms.ChoiceField(
-        choices=[('A', 'A'), ('B', 'B'), ('C', 'C'), ('D', 'D'), ('E', 'E'), ('F', 'F'),
-                 ('G', 'G'), ('H', 'H'), ('I', 'I'), ('J', 'J')],
         widget=forms.Select(attrs={"class": "form-control form-control-sm select2"}),
         required=False
     )
 
     def __init__(self, *args, **kwargs):
+        """
+        Args:
+            box: The box the sample moves to, whose grid the positions are
+                offered from. When not given, that of a box of the default
+                capacity, 100 samples in a 10 x 10 grid.
+            choices: position_choices() of the box, when a formset has
+                already worked them out for all of its forms.
+        """
         self.box = kwargs.pop('box', None)
         self.sample_ids = kwargs.pop('sample_ids', None)
+        choices = kwargs.pop('choices', None)
         super().__init__(*args, **kwargs)
+        x_choices, y_choices = choices or position_choices(self.box or DimBox())
+        self.fields['new_x_position'].choices = [('', '---')] + x_choices
+        self.fields['new_y_position'].choices = [('', '---')] + y_choices
@@ -0,0 +1,38 @@
+from django.core.cache import cache
+
+from storage_module import async_db, versions
+from storage_module.routers import reading_from_primary
+
+CACHE_PREFIX = 'storage_module:fragments'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def fragment_key(level, container_id, name):
+    version, _ = versions.container_version(level, container_id)
+    return f'{CACHE_PREFIX}:{name}:{level}:{container_id}:{version}'
+
+
+def cached(level, container_id, name, build):
+    """
+    Returns the named fragment of a container, calling build only when the
+    container changed since the fragment was cached. build runs against the
+    primary, so a lagging replica cannot cache stale rows under a new version.
+    """
+    key = fragment_key(level, container_id, name)
+    value = cache.get(key)
+    if value is None:
+        with reading_from_primary():
+            value = build()
+        cache.set(key, value, CACHE_TIMEOUT)
+    return value
+
+
+async def acached(level, container_id, name, build):
+    """cached() for async views, where build is a coroutine function."""
+    key = await async_db.run(fragment_key, level, container_id, name)
+    value = await async_db.run(cache.get, key)
+    if value is None:
+        with reading_from_primary():
+            value = await build()
+        await async_db.run(cache.set, key, value, CACHE_TIMEOUT)
+    return value
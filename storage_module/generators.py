@@ -0,0 +1,204 @@
+import math
+import random
+import string
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Max
+
+from storage_module import locations, occupancy, reference, search
+from storage_module.importers import IN_STORAGE
+from storage_module.models import BoxPosition, DimBox, DimFacility, DimFreezer, DimRack, \
+    DimSample, DimSampleStatus, DimSampleType, DimShelf, DimSourceFile, Note
+
+SAMPLE_TYPES = ['Plasma', 'Plasma EDTA', 'Serum', 'Whole Blood', 'Buffy Coat', 'PBMC',
+                'Urine', 'Stool', 'Dried Blood Spot', 'CSF']
+
+VISIT_CODES = ['1000', '2000', '2010', '2020', '3000', '3010', '4000']
+
+
+class StorageDataGenerator:
+    """
+    Builds a synthetic but realistic storage hierarchy (facilities, freezers,
+    shelves, racks, boxes) and fills it with samples, positions, notes and
+    history rows, everything written with bulk_create in chunked transactions.
+
+    Primary keys are assigned up front from the current maximum, so the output
+    depends only on the seed and the options, and works on databases whose
+    bulk_create does not return primary keys.
+    """
+
+    def __init__(self, facilities=1, samples=10000, box_capacity=81, fill_ratio=0.9,
+                 shelves_per_freezer=5, racks_per_shelf=4, boxes_per_rack=20,
+                 note_ratio=0.05, history=True, seed=0, chunk_size=5000, stdout=None):
+        self.facility_count = facilities
+        self.sample_count = samples
+        self.box_capacity = box_capacity
+        self.fill_ratio = fill_ratio
+        self.shelves_per_freezer = shelves_per_freezer
+        self.racks_per_shelf = racks_per_shelf
+        self.boxes_per_rack = boxes_per_rack
+        self.note_ratio = note_ratio
+        self.history = history
+        self.chunk_size = chunk_size
+        self.stdout = stdout
+        self.random = random.Random(seed)
+        self.seed = seed
+
+    def run(self):
+        self.create_reference_data()
+        self.create_hierarchy()
+        self.create_samples()
+        self.rebuild_derived_data()
+        return {
+            'facilities': self.facility_count,
+            'freezers': len(self.freezer_ids),
+            'racks': len(self.rack_ids),
+            'boxes': len(self.box_ids),
+            'samples': self.sample_count,
+        }
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    @staticmethod
+    def next_id(model):
+        return (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+
+    def create_reference_data(self):
+        self.sample_type_ids = [
+            DimSampleType.objects.get_or_create(sample_type=name)[0].id
+            for name in SAMPLE_TYPES]
+        self.source_file_id = DimSourceFile.objects.get_or_create(
+            source_file_name=f'synthetic-seed-{self.seed}.csv')[0].id
+        self.status_id = DimSampleStatus.objects.get_or_create(name=IN_STORAGE)[0].id
+
+    def create_hierarchy(self):
+        self.box_rows, self.box_columns = DimBox(
+            box_capacity=self.box_capacity).grid_dimensions
+        slot_count = min(self.box_capacity, self.box_rows * self.box_columns)
+        self.samples_per_box = max(1, int(slot_count * self.fill_ratio))
+        box_total = math.ceil(self.sample_count / self.samples_per_box)
+        boxes_per_freezer = (self.shelves_per_freezer * self.racks_per_shelf
+                             * self.boxes_per_rack)
+        freezers_per_facility = max(1, math.ceil(
+            box_total / (self.facility_count * boxes_per_freezer)))
+
+        facility_id = self.next_id(DimFacility)
+        freezer_id = self.next_id(DimFreezer)
+        shelf_id = self.next_id(DimShelf)
+        rack_id = self.next_id(DimRack)
+
+        facilities, freezers, shelves, racks = [], [], [], []
+        for f in range(self.facility_count):
+            facilities.append(DimFacility(id=facility_id + f,
+                                          facility_name=f'Facility {facility_id + f}'))
+            for z in range(freezers_per_facility):
+                freezer = DimFreezer(id=freezer_id + len(freezers),
+                                     freezer_name=f'FREEZER {len(freezers) + 1}',
+                                     facility_id=facility_id + f)
+                freezers.append(freezer)
+                for s in range(self.shelves_per_freezer):
+                    shelf = DimShelf(id=shelf_id + len(shelves),
+                                     shelf_name=f'Shelf {s + 1}', shelf_description='',
+                                     freezer_id=freezer.id)
+                    shelves.append(shelf)
+                    for r in range(self.racks_per_shelf):
+                        # Racks on a shelf hang off the shelf, as in the LIMS export.
+                        racks.append(DimRack(id=rack_id + len(racks),
+                                             rack_name=f'Rack {r + 1}',
+                                             shelf_id=shelf.id))
+
+        with transaction.atomic():
+            DimFacility.objects.bulk_create(facilities)
+            DimFreezer.objects.bulk_create(freezers)
+            DimShelf.objects.bulk_create(shelves)
+            DimRack.objects.bulk_create(racks)
+            self.create_boxes(box_total, freezers, shelves, racks)
+
+        self.freezer_ids = [freezer.id for freezer in freezers]
+        self.rack_ids = [rack.id for rack in racks]
+        self.log(f'Created {len(freezers)} freezers, {len(shelves)} shelves, '
+                 f'{len(racks)} racks and {box_total} boxes')
+
+    def create_boxes(self, box_total, freezers, shelves, racks):
+        """Most boxes go into racks, some straight onto shelves or into freezers."""
+        first_id = self.next_id(DimBox)
+        boxes = []
+        for index in range(box_total):
+            box = DimBox(id=first_id + index, box_name=f'BX{first_id + index:08d}',
+                         box_description=f'SYN{self.seed:03d}-{index:08d}',
+                         box_capacity=self.box_capacity)
+            roll = self.random.random()
+            if roll < 0.05:
+                box.freezer_id = freezers[index % len(freezers)].id
+            elif roll < 0.15:
+                shelf = shelves[index % len(shelves)]
+                box.shelf_id, box.freezer_id = shelf.id, shelf.freezer_id
+            else:
+                rack = racks[index % len(racks)]
+                box.rack_id, box.shelf_id = rack.id, rack.shelf_id
+            boxes.append(box)
+        DimBox.objects.bulk_create(boxes, batch_size=self.chunk_size)
+        self.box_ids = [box.id for box in boxes]
+
+    def box_slots(self):
+        """Yields (box_id, x_position, y_position) for every sample to place."""
+        slot_count = min(self.box_capacity, self.box_rows * self.box_columns)
+        for box_id in self.box_ids:
+            chosen = self.random.sample(range(slot_count), self.samples_per_box)
+            for slot in sorted(chosen):
+                row, column = divmod(slot, self.box_columns)
+                yield box_id, column, chr(ord('A') + row)
+
+    def create_samples(self):
+        first_id = self.next_id(DimSample)
+        slots = self.box_slots()
+        for start in range(0, self.sample_count, self.chunk_size):
+            count = min(self.chunk_size, self.sample_count - start)
+            samples = [self.build_sample(first_id + start + i) for i in range(count)]
+            positions = [
+                BoxPosition(sample_id=sample.sample_id, box_id=box_id,
+                            x_position=x_position, y_position=y_position)
+                for sample, (box_id, x_position, y_position) in zip(samples, slots)]
+            notes = [Note(sample_id=sample.id,
+                          text=f'Synthetic note for {sample.sample_id}')
+                     for sample in samples if self.random.random() < self.note_ratio]
+            with transaction.atomic():
+                DimSample.objects.bulk_create(samples, batch_size=self.chunk_size)
+                BoxPosition.objects.bulk_create(positions, batch_size=self.chunk_size)
+                Note.objects.bulk_create(notes, batch_size=self.chunk_size)
+                if self.history:
+                    DimSample.history.bulk_history_create(
+                        samples, batch_size=self.chunk_size,
+                        default_change_reason='Synthetic data')
+                search.index_pk_range(samples[0].id, samples[-1].id)
+            self.log(f'Created {start + count} samples')
+
+    def build_sample(self, pk):
+        protocol = self.random.choice(['085', '086', '088', '092'])
+        participant = (f'{protocol}-{self.random.randint(10000000, 99999999)}-'
+                       f'{self.random.randint(0, 9)}')
+        return DimSample(
+            id=pk,
+            sample_id=f'{protocol}{self.seed % 100:02d}SYN{pk:09d}',
+            protocol_number=f'BHP{protocol}',
+            participant_id=participant,
+            date_sampled=date(2015, 1, 1) + timedelta(days=self.random.randint(0, 3650)),
+            time_sampled=(f'{self.random.randint(6, 18):02d}:'
+                          f'{self.random.randint(0, 59):02d}'),
+            visit_code=self.random.choice(VISIT_CODES),
+            requisition_id=''.join(self.random.choices(
+                string.ascii_uppercase + string.digits, k=7)),
+            sample_type_id=self.random.choice(self.sample_type_ids),
+            source_file_id=self.source_file_id,
+            sample_status_id=self.status_id,
+        )
+
+    def rebuild_derived_data(self):
+        """Brings the materialized locations, occupancy and reference caches in line."""
+        locations.rebuild()
+        occupancy.rebuild()
+        for name in reference.REFERENCE_DATA:
+            reference.invalidate(name)
@@ -0,0 +1,340 @@
+import csv
+import os
+import re
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+from django.db import connection, transaction
+
+from storage_module import occupancy, search, slots
+from storage_module.models import BoxPosition, DimBox, DimFacility, DimFreezer, \
+    DimRack, DimSample, DimSampleStatus, DimSampleType, DimShelf, DimSourceFile, Note
+from storage_module.moves import take_write_lock
+from storage_module.slots import SlotMap
+
+IN_STORAGE = 'In Storage'
+
+# Boxes in the export are 9 x 9, rows A to I and columns 1 to 9, and the export
+# has no column for their size.
+EXPORT_BOX_CAPACITY = 81
+
+SAMPLE_UPDATE_FIELDS = ['protocol_number', 'participant_id', 'date_sampled',
+                        'time_sampled', 'visit_code', 'requisition_id', 'sample_type',
+                        'source_file', 'sample_status']
+
+
+class LimsExportImporter:
+    """
+    Loads a "LIMS Storage Export" CSV in a single streaming pass.
+
+    Dimension rows (facilities, freezers, shelves, racks, boxes, sample types,
+    source files) are resolved through in-memory lookup maps that are primed
+    once from the database, so only rows for previously unseen containers are
+    created one at a time. Samples and box positions are written in bulk, one
+    transaction per chunk, which keeps memory flat regardless of file size.
+    Rows whose position cannot be taken, because it is off the box grid or
+    held by a sample that stays put, are left out and listed in conflicts.
+    A progress callable, if given, is called with the number of rows of
+    each chunk once it is written.
+    """
+
+    def __init__(self, path, chunk_size=5000, source_file_name=None, stdout=None,
+                 progress=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.source_file_name = source_file_name or os.path.basename(path)
+        self.stdout = stdout
+        self.progress = progress
+        self.stats = {'rows': 0, 'samples': 0, 'positions': 0, 'notes': 0,
+                      'skipped': 0, 'conflicts': 0}
+        # Sample id to the reason its row was left out.
+        self.conflicts = {}
+
+    def run(self):
+        self.prime_lookups()
+        with open(self.path, newline='', encoding='utf-8-sig') as csv_file:
+            reader = csv.DictReader(csv_file)
+            while True:
+                rows = list(islice(reader, self.chunk_size))
+                if not rows:
+                    break
+                self.import_chunk(rows)
+                if self.progress:
+                    self.progress(len(rows))
+                if self.stdout:
+                    self.stdout.write(f"Imported {self.stats['rows']} rows")
+        return self.stats
+
+    def prime_lookups(self):
+        self.facilities = {
+            f.facility_name: f.id for f in DimFacility.objects.only('facility_name')}
+        self.freezers = {
+            (f.facility_id, f.freezer_name): f.id
+            for f in DimFreezer.objects.only('facility_id', 'freezer_name')}
+        self.shelves = {
+            (s.freezer_id, s.shelf_name): s.id
+            for s in DimShelf.objects.only('freezer_id', 'shelf_name')}
+        self.racks = {
+            (r.freezer_id, r.shelf_id, r.rack_name): r.id
+            for r in DimRack.objects.only('freezer_id', 'shelf_id', 'rack_name')}
+        self.boxes = {
+            (b.box_name, b.box_description): b.id
+            for b in DimBox.objects.only('box_name', 'box_description')}
+        self.sample_types = dict(DimSampleType.objects.values_list('sample_type', 'id'))
+        self.source_file_id = DimSourceFile.objects.get_or_create(
+            source_file_name=self.source_file_name)[0].id
+        self.status_id = DimSampleStatus.objects.get_or_create(name=IN_STORAGE)[0].id
+
+    def import_chunk(self, rows):
+        entries = []
+        with transaction.atomic():
+            for row in rows:
+                self.stats['rows'] += 1
+                sample_id = (row.get('Sample Identifier') or '').strip()
+                if not sample_id:
+                    self.stats['skipped'] += 1
+                    continue
+                entries.append((self.build_sample(sample_id, row),
+                                self.build_position(sample_id, row),
+                                (row.get('Remarks') or '').strip()))
+
+            # A row whose position cannot be taken is left out whole, so the
+            # sample keeps its old position and status.
+            placed = self.place([position for _, position, _ in entries if position])
+            placed_ids = {id(position) for position in placed}
+            entries = [(sample, position, remarks)
+                       for sample, position, remarks in entries
+                       if position is None or id(position) in placed_ids]
+            self.write_samples([sample for sample, _, _ in entries])
+            self.write_positions(placed)
+            self.write_notes([(sample.sample_id, remarks)
+                              for sample, _, remarks in entries if remarks])
+
+    def build_sample(self, sample_id, row):
+        return DimSample(
+            sample_id=sample_id,
+            protocol_number=clean(row.get('Protocol Number')),
+            participant_id=clean(row.get('Participant Id')),
+            date_sampled=parse_date(row.get('Date Sampled')),
+            time_sampled=clean(row.get('Time Sampled')),
+            visit_code=clean(row.get('Visit')),
+            requisition_id=clean(row.get('Requisition Id')),
+            sample_type_id=self.get_sample_type(clean(row.get('Sample Type'))),
+            source_file_id=self.source_file_id,
+            sample_status_id=self.status_id,
+        )
+
+    def build_position(self, sample_id, row):
+        coordinates = parse_position(row.get('Position'))
+        box_name = clean(row.get('Box Name'))
+        if not coordinates or not box_name:
+            return None
+        freezer_id, shelf_id, rack_id = self.get_containers(
+            clean(row.get('Facility Name')), row.get('Containers') or '')
+        box_id = self.get_box(box_name, clean(row.get('Box Id')), freezer_id, shelf_id,
+                              rack_id)
+        x_position, y_position = coordinates
+        return BoxPosition(sample_id=sample_id, box_id=box_id, x_position=x_position,
+                           y_position=y_position)
+
+    def write_samples(self, samples):
+        if connection.features.supports_update_conflicts:
+            unique_fields = (['sample_id'] if connection.features
+                             .supports_update_conflicts_with_target else None)
+            DimSample.objects.bulk_create(
+                samples, batch_size=self.chunk_size, update_conflicts=True,
+                unique_fields=unique_fields, update_fields=SAMPLE_UPDATE_FIELDS)
+        else:
+            DimSample.objects.bulk_create(samples, batch_size=self.chunk_size,
+                                          ignore_conflicts=True)
+        search.index_samples([sample.sample_id for sample in samples])
+        self.stats['samples'] += len(samples)
+
+    def place(self, positions):
+        """
+        Works out which positions of a chunk can be written, with the boxes
+        involved locked. A position is refused if it lies outside its box's
+        grid, if an earlier row of the chunk took the same sample or slot, or
+        if its slot is held by a sample that stays where it is. Refused
+        positions are recorded in conflicts.
+
+        Returns:
+            The positions that can be written, in their original order.
+        """
+        target_box_ids = {position.box_id for position in positions}
+        take_write_lock(target_box_ids)
+        current = dict(BoxPosition.objects.filter(
+            sample_id__in=[position.sample_id for position in positions]).values_list(
+            'sample_id', 'box_id'))
+        box_ids = target_box_ids | set(current.values())
+        grids = {box.pk: SlotMap(*box.grid_dimensions)
+                 for box in DimBox.objects.select_for_update().filter(
+                     id__in=box_ids).order_by('id')}
+        occupied = {(box_id, x_position, y_position): sample_id
+                    for box_id, x_position, y_position, sample_id
+                    in BoxPosition.objects.filter(box_id__in=box_ids).values_list(
+                        'box_id', 'x_position', 'y_position', 'sample_id')}
+
+        placed = []
+        taken_samples, taken_slots = set(), set()
+        for position in positions:
+            slot = slot_of(position)
+            if position.sample_id in taken_samples:
+                self.refuse(position, 'is for a sample listed earlier in the chunk.')
+            elif grids[position.box_id].index(position.x_position,
+                                              position.y_position) is None:
+                self.refuse(position, 'is outside the grid of the box.')
+            elif slot in taken_slots:
+                self.refuse(position, 'was taken by an earlier row.')
+            else:
+                placed.append(position)
+                taken_slots.add(slot)
+            taken_samples.add(position.sample_id)
+
+        # A slot frees up only if its sample is placed elsewhere, and refusing
+        # one sample may keep another out of its slot in turn.
+        while True:
+            moving = {position.sample_id for position in placed}
+            blocked = {id(position) for position in placed
+                       if occupied.get(slot_of(position), position.sample_id)
+                       not in moving}
+            if not blocked:
+                return placed
+            for position in placed:
+                if id(position) in blocked:
+                    self.refuse(position,
+                                f'is held by {occupied[slot_of(position)]}.')
+            placed = [position for position in placed if id(position) not in blocked]
+
+    def refuse(self, position, message):
+        self.conflicts[position.sample_id] = (
+            f'Position {position.y_position}{position.x_position + 1} {message}')
+        self.stats['conflicts'] += 1
+
+    def write_positions(self, positions):
+        """
+        The export is the source of truth for where a sample lives, so the
+        previous placement of every sample placed by place() is replaced.
+        """
+        sample_ids = [position.sample_id for position in positions]
+        existing = BoxPosition.objects.filter(sample_id__in=sample_ids)
+        box_deltas = Counter()
+        box_deltas.subtract(existing.values_list('box_id', flat=True))
+        with occupancy.muted():
+            existing.delete()
+            BoxPosition.objects.bulk_create(positions, batch_size=self.chunk_size)
+        box_deltas.update(position.box_id for position in positions)
+        slots.invalidate(box_deltas.keys())
+        occupancy.record_sample_changes(box_deltas)
+        self.stats['positions'] += len(positions)
+
+    def write_notes(self, notes):
+        if not notes:
+            return
+        pks = dict(DimSample.objects.filter(
+            sample_id__in=[sample_id for sample_id, _ in notes]).values_list(
+            'sample_id', 'id'))
+        existing = set(Note.objects.filter(sample_id__in=pks.values()).values_list(
+            'sample_id', 'text'))
+        new_notes = [Note(sample_id=pks[sample_id], text=text)
+                     for sample_id, text in notes
+                     if (pks[sample_id], text) not in existing]
+        Note.objects.bulk_create(new_notes, batch_size=self.chunk_size)
+        self.stats['notes'] += len(new_notes)
+
+    def get_sample_type(self, name):
+        if not name:
+            return None
+        name = 'Plasma' if 'Plasama' in name else name
+        if name not in self.sample_types:
+            self.sample_types[name] = DimSampleType.objects.create(sample_type=name).id
+        return self.sample_types[name]
+
+    def get_facility(self, name):
+        if name not in self.facilities:
+            self.facilities[name] = DimFacility.objects.create(facility_name=name).id
+        return self.facilities[name]
+
+    def get_containers(self, facility_name, containers):
+        """
+        Resolves a "Containers" path such as "Rack 2 < Shelf 2 < FREEZER 56",
+        read from the outermost container (always the freezer) inwards.
+        """
+        names = [name.strip() for name in containers.split('<') if name.strip()]
+        if not names:
+            return None, None, None
+        facility_id = self.get_facility(facility_name) if facility_name else None
+        freezer_name = names.pop()
+        shelf_name = next((n for n in reversed(names) if is_shelf(n)), None)
+        rack_name = next((n for n in reversed(names) if is_rack(n)), None)
+
+        key = (facility_id, freezer_name)
+        if key not in self.freezers:
+            self.freezers[key] = DimFreezer.objects.create(
+                freezer_name=freezer_name, facility_id=facility_id).id
+        freezer_id = self.freezers[key]
+
+        shelf_id = None
+        if shelf_name:
+            key = (freezer_id, shelf_name)
+            if key not in self.shelves:
+                self.shelves[key] = DimShelf.objects.create(
+                    shelf_name=shelf_name, shelf_description='', freezer_id=freezer_id).id
+            shelf_id = self.shelves[key]
+
+        rack_id = None
+        if rack_name:
+            # Racks standing on a shelf hang off the shelf, not the freezer.
+            key = (None if shelf_id else freezer_id, shelf_id, rack_name)
+            if key not in self.racks:
+                self.racks[key] = DimRack.objects.create(
+                    rack_name=rack_name, shelf_id=shelf_id,
+                    freezer_id=None if shelf_id else freezer_id).id
+            rack_id = self.racks[key]
+
+        return freezer_id, shelf_id, rack_id
+
+    def get_box(self, box_name, box_reference, freezer_id, shelf_id, rack_id):
+        key = (box_name, box_reference)
+        if key not in self.boxes:
+            self.boxes[key] = DimBox.objects.create(
+                box_name=box_name, box_description=box_reference,
+                box_capacity=EXPORT_BOX_CAPACITY, freezer_id=freezer_id,
+                shelf_id=shelf_id, rack_id=rack_id).id
+        return self.boxes[key]
+
+
+def slot_of(position):
+    return position.box_id, position.x_position, position.y_position
+
+
+def clean(value):
+    value = (value or '').strip()
+    return value or None
+
+
+def parse_date(value):
+    value = clean(value)
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def parse_position(value):
+    """Maps an export position such as "C1" to (x_position, y_position) = (0, 'C')."""
+    match = re.match(r'^\s*([A-Za-z])\s*(\d+)\s*$', value or '')
+    if not match:
+        return None
+    return int(match.group(2)) - 1, match.group(1).upper()
+
+
+def is_shelf(name):
+    return name.lower().startswith('shelf')
+
+
+def is_rack(name):
+    return 'rack' in name.lower()
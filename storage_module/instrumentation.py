@@ -0,0 +1,190 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+import time
+from collections import deque
+from contextlib import ExitStack
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Call sites inside these files are skipped when attributing a statement.
+IGNORED_FILES = {os.path.join(PACKAGE_DIR, name) for name in (
+    'instrumentation.py', 'benchmarks.py')}
+
+STRINGS = re.compile(r"'(?:[^']|'')*'")
+NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LISTS = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|NULL)\s*,?)+\)', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+')
+
+logger = logging.getLogger('storage_module.sql')
+logger.propagate = False
+
+# The most recent reports of this process, for quick inspection without the log.
+recent_reports = deque(maxlen=100)
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def log_path():
+    return setting('STORAGE_SQL_LOG', os.path.join(settings.BASE_DIR, 'logs',
+                                                   'sql_reports.log'))
+
+
+def normalize(sql):
+    """
+    Reduces a statement to its shape: literals become placeholders and IN
+    lists of any length collapse to one, so the same query issued for
+    different rows groups together.
+    """
+    sql = STRINGS.sub('%s', sql)
+    sql = NUMBERS.sub('%s', sql)
+    sql = IN_LISTS.sub('IN (...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def call_site():
+    """The innermost frame of this project's code that led to the statement."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(PACKAGE_DIR) and filename not in IGNORED_FILES:
+            return (f'{os.path.relpath(filename, PACKAGE_DIR)}:{frame.f_lineno} '
+                    f'{frame.f_code.co_name}')
+        frame = frame.f_back
+    return 'unknown'
+
+
+class QueryRecorder:
+    """
+    An execute wrapper that counts and times every statement, grouped by
+    normalized shape and call site.
+    """
+
+    def __init__(self):
+        self.statements = {}
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            key = (context['connection'].alias, normalize(sql), call_site())
+            entry = self.statements.setdefault(key, [0, 0.0])
+            entry[0] += 1
+            entry[1] += elapsed
+            self.count += 1
+            self.duration += elapsed
+
+    def report(self, threshold):
+        """
+        Returns:
+            A dict with the totals and one entry per statement group, the
+            groups issued at least threshold times flagged as suspected N+1.
+        """
+        groups = [{
+            'database': alias,
+            'sql': sql,
+            'site': site,
+            'count': count,
+            'ms': round(duration * 1000, 2),
+            'n_plus_one': count >= threshold,
+        } for (alias, sql, site), (count, duration) in self.statements.items()]
+        groups.sort(key=lambda group: (-group['count'], -group['ms']))
+        return {
+            'queries': self.count,
+            'sql_ms': round(self.duration * 1000, 2),
+            'n_plus_one': sum(group['n_plus_one'] for group in groups),
+            'groups': groups,
+        }
+
+
+def get_handler():
+    if not logger.handlers:
+        path = log_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = RotatingFileHandler(
+            path, maxBytes=setting('STORAGE_SQL_LOG_BYTES', 5 * 1024 * 1024),
+            backupCount=setting('STORAGE_SQL_LOG_BACKUPS', 5))
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+    return logger.handlers[0]
+
+
+def write_report(report):
+    recent_reports.append(report)
+    get_handler()
+    logger.info(json.dumps(report))
+
+
+def read_reports(limit=50):
+    """
+    The latest reports from the log file, newest first. Reading the file
+    rather than recent_reports shows the requests served by every process.
+    """
+    path = log_path()
+    if not os.path.isfile(path):
+        return []
+    with open(path, 'rb') as log_file:
+        lines = deque(log_file, maxlen=limit)
+    return [json.loads(line) for line in reversed(lines) if line.strip()]
+
+
+class SqlInstrumentationMiddleware:
+    """
+    Captures every SQL statement of a sampled share of requests and writes a
+    report per request to a rotating log.
+
+    Enabled with STORAGE_SQL_INSTRUMENTATION; STORAGE_SQL_SAMPLE_RATE sets the
+    share of requests recorded and STORAGE_SQL_REPEAT_THRESHOLD how often a
+    statement shape must repeat from one call site to count as an N+1.
+    Requests that are not sampled pay for one random number.
+
+    It is sync only: the queries of async views run on pool threads whose
+    connections it cannot wrap, so under ASGI enabling it runs the requests
+    below it on a thread.
+    """
+
+    def __init__(self, get_response):
+        if not setting('STORAGE_SQL_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = setting('STORAGE_SQL_SAMPLE_RATE', 0.05)
+        self.threshold = setting('STORAGE_SQL_REPEAT_THRESHOLD', 5)
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        report = recorder.report(self.threshold)
+        match = getattr(request, 'resolver_match', None)
+        report.update({
+            'time': round(time.time(), 3),
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round((time.perf_counter() - started) * 1000, 2),
+        })
+        write_report(report)
+        return response
@@ -0,0 +1,326 @@
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, connections
+from django.urls import reverse
+from django.utils import timezone
+
+from storage_module import exports, reference, reservations, selections
+from storage_module.importers import LimsExportImporter
+from storage_module.models import StorageJob
+from storage_module.moves import move_in_chunks
+
+logger = logging.getLogger('storage_module.jobs')
+
+# Conflicts listed in the message of a failed move; the rest are counted.
+MAX_CONFLICTS_SHOWN = 20
+
+
+class JobCancelled(Exception):
+    """Raised in a running job once a cancellation has been requested."""
+
+
+class JobFailed(Exception):
+    """Raised by a job handler to fail its job with a message for the user."""
+
+
+class Progress:
+    """
+    Handed to a job handler to record how far it got. Every report is one
+    UPDATE, which also refreshes the heartbeat and notices a cancellation,
+    so handlers report once per chunk rather than per sample.
+    """
+
+    def __init__(self, job):
+        self.job = job
+
+    def start(self, total):
+        """Records how many units of work the job has, if it is known."""
+        self.job.total = total
+        StorageJob.objects.filter(pk=self.job.pk).update(total=total,
+                                                         heartbeat=timezone.now())
+
+    def advance(self, count):
+        self.job.done += count
+        updated = StorageJob.objects.filter(
+            pk=self.job.pk, cancel_requested=False).update(done=self.job.done,
+                                                           heartbeat=timezone.now())
+        if not updated:
+            raise JobCancelled()
+
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """
+    Registers the function(job, progress) that runs jobs of a kind. It
+    returns the message shown once the job is done.
+    """
+    def register(function):
+        HANDLERS[kind] = function
+        return function
+    return register
+
+
+def enqueue(kind, owner=None, selection=None, description='', **params):
+    """
+    Queues a job for the worker.
+
+    Args:
+        kind: One of the kinds in HANDLERS.
+        owner: The user who asked for it and may follow and cancel it.
+        selection: The SampleSelection the job works through, if any.
+        params: JSON-serialisable arguments of the handler.
+
+    Returns:
+        The new StorageJob.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f'Unknown job kind {kind}')
+    return StorageJob.objects.create(
+        kind=kind, owner=owner if getattr(owner, 'is_authenticated', False) else None,
+        selection=selection, description=description[:255], params=params,
+        total=selection.size if selection is not None else None)
+
+
+def should_queue(count):
+    """Whether an operation on count samples is too slow to run in a request."""
+    return count > settings.STORAGE_JOB_THRESHOLD
+
+
+def job_url(job):
+    return reverse('job_detail', args=[job.pk])
+
+
+def visible_to(user):
+    """The jobs a user may follow and cancel: their own, or every job for staff."""
+    if user.is_staff:
+        return StorageJob.objects.all()
+    return StorageJob.objects.filter(owner=user)
+
+
+def state(job):
+    """What the job page polls for."""
+    return {
+        'id': job.pk,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'done': job.done,
+        'total': job.total,
+        'percent': job.percent,
+        'message': job.message,
+        'finished': job.finished,
+        'cancel_requested': job.cancel_requested,
+        'download_url': (reverse('download_job_result', args=[job.pk])
+                         if job.result_path else None),
+    }
+
+
+def cancel(job):
+    """
+    Cancels a queued job at once. A running job is asked to stop, which it
+    does at its next progress report; chunks already done stay done.
+    """
+    StorageJob.objects.filter(pk=job.pk, status=StorageJob.QUEUED).update(
+        status=StorageJob.CANCELLED, cancel_requested=True,
+        finished_date=timezone.now(), message='Cancelled before it started.')
+    StorageJob.objects.filter(pk=job.pk, status=StorageJob.RUNNING).update(
+        cancel_requested=True)
+    job.refresh_from_db()
+
+
+def claim(worker):
+    """
+    Takes the oldest queued job for a worker. The status only changes if the
+    job is still queued, so two workers never both take a job.
+
+    Returns:
+        The claimed StorageJob, or None when the queue is empty.
+    """
+    now = timezone.now()
+    queued = StorageJob.objects.filter(status=StorageJob.QUEUED).order_by('id')
+    for pk in queued.values_list('pk', flat=True)[:10]:
+        if StorageJob.objects.filter(pk=pk, status=StorageJob.QUEUED).update(
+                status=StorageJob.RUNNING, worker=worker, started_date=now,
+                heartbeat=now):
+            return StorageJob.objects.get(pk=pk)
+    return None
+
+
+def run(job):
+    """Runs a claimed job to the end and records how it finished."""
+    try:
+        message = HANDLERS[job.kind](job, Progress(job))
+    except JobCancelled:
+        finish(job, StorageJob.CANCELLED, f'Cancelled after {job.done} of '
+                                          f'{job.total or "?"}.')
+    except JobFailed as error:
+        finish(job, StorageJob.FAILED, str(error))
+    except Exception as error:
+        logger.exception('Storage job %s (%s) failed', job.pk, job.kind)
+        finish(job, StorageJob.FAILED, f'{type(error).__name__}: {error}')
+    else:
+        finish(job, StorageJob.DONE, message or '')
+    finally:
+        # Worker threads keep their own connections; do not leave them open.
+        connections.close_all()
+
+
+def finish(job, status, message):
+    fields = {'status': status, 'message': message, 'finished_date': timezone.now(),
+              'done': job.done}
+    if status == StorageJob.DONE and job.total is not None:
+        fields['done'] = job.total
+    if status == StorageJob.DONE:
+        fields['result_path'] = job.result_path
+    elif job.result_path and os.path.isfile(job.result_path):
+        # Only a finished export is worth downloading.
+        os.remove(job.result_path)
+    StorageJob.objects.filter(pk=job.pk).update(**fields)
+
+
+def recover():
+    """
+    Fails running jobs whose worker stopped reporting, e.g. because it was
+    killed, so their pages stop showing them as running.
+
+    Returns:
+        The number of jobs failed.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.STORAGE_JOB_STALE_SECONDS)
+    return StorageJob.objects.filter(status=StorageJob.RUNNING,
+                                     heartbeat__lt=stale).update(
+        status=StorageJob.FAILED, finished_date=timezone.now(),
+        message='The worker running this job stopped.')
+
+
+def work(workers=2, interval=1.0, once=False, stdout=None):
+    """
+    Runs queued jobs on a pool of threads until interrupted, polling the
+    queue every interval seconds, or with once until the queue is empty.
+
+    SQLite admits one writer at a time, and jobs that read before they
+    write would fail to take its lock from each other, so there jobs run
+    one at a time.
+    """
+    if connection.vendor == 'sqlite':
+        workers = 1
+    name = f'{socket.gethostname()}:{os.getpid()}'
+    running = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            recover()
+            running = {future for future in running if not future.done()}
+            while len(running) < workers:
+                job = claim(name)
+                if job is None:
+                    break
+                if stdout:
+                    stdout.write(f'Running job {job.pk}: {job}')
+                running.add(pool.submit(run, job))
+            if once and not running:
+                return
+            time.sleep(interval)
+
+
+def result_dir():
+    return settings.STORAGE_JOB_DIR
+
+
+def prune_results():
+    """Deletes the result files of all but the newest STORAGE_JOB_KEEP jobs."""
+    stale = StorageJob.objects.exclude(result_path='').order_by('-id')[
+        settings.STORAGE_JOB_KEEP:]
+    for job in stale:
+        if os.path.isfile(job.result_path):
+            os.remove(job.result_path)
+    StorageJob.objects.filter(pk__in=[job.pk for job in stale]).update(result_path='')
+
+
+def job_selection(job):
+    if job.selection is None:
+        raise JobFailed('The selection of this job no longer exists.')
+    return job.selection
+
+
+@handler('transition')
+def run_transition(job, progress):
+    status = reference.sample_status(job.params['status'])
+    if status is None:
+        raise JobFailed('The sample status no longer exists.')
+    changed = selections.transition(job_selection(job), status, user=job.owner,
+                                    progress=progress.advance)
+    return f'{changed} samples are now {status.name}.'
+
+
+@handler('note')
+def run_note(job, progress):
+    added = selections.add_note(job_selection(job), job.params['text'],
+                                author=job.owner, progress=progress.advance)
+    return f'Added the note to {added} samples.'
+
+
+@handler('export')
+def run_export(job, progress):
+    """Writes the export to a file that the job page offers for download."""
+    file_format = 'xlsx' if job.params.get('file_format') == 'xlsx' else 'csv'
+    os.makedirs(result_dir(), exist_ok=True)
+    job.result_path = os.path.join(result_dir(), f'job-{job.pk}.{file_format}')
+    stream = (exports.stream_xlsx if file_format == 'xlsx' else exports.stream_csv)(
+        job_selection(job), progress.advance)
+    with open(job.result_path, 'wb') as result:
+        for data in stream:
+            result.write(data.encode() if isinstance(data, str) else data)
+    prune_results()
+    return f'Exported {job.selection.size} samples.'
+
+
+@handler('move')
+def run_move(job, progress):
+    """
+    Applies the positions chosen in the move wizard a chunk at a time. A move
+    with conflicts moves nothing; a cancelled one keeps the chunks it moved.
+    """
+    targets = job.params['targets']
+    progress.start(len(targets))
+    holder = job.params.get('holder')
+    try:
+        moved, conflicts = move_in_chunks(targets, holder, progress=progress.advance)
+    finally:
+        if holder:
+            reservations.release(holder)
+    if conflicts:
+        raise JobFailed(conflict_message(conflicts, moved))
+    return f'Moved {moved} samples.'
+
+
+@handler('import')
+def run_import(job, progress):
+    path = job.params['path']
+    if not os.path.isfile(path):
+        raise JobFailed(f'File not found: {path}')
+    with open(path, 'rb') as csv_file:
+        # Lines less the header; rows with quoted line breaks make it an estimate.
+        progress.start(max(sum(1 for _ in csv_file) - 1, 0))
+    stats = LimsExportImporter(path, chunk_size=job.params.get('chunk_size', 5000),
+                               source_file_name=job.params.get('source_file_name'),
+                               progress=progress.advance).run()
+    return (f"Imported {stats['samples']} samples, {stats['positions']} positions and "
+            f"{stats['notes']} notes from {stats['rows']} rows "
+            f"({stats['skipped']} skipped, {stats['conflicts']} not placed).")
+
+
+def conflict_message(conflicts, moved=0):
+    heading = (f'Moved {moved} samples, then stopped:' if moved
+               else 'Nothing was moved:')
+    lines = [f'{sample_id}: {message}' for sample_id, message
+             in list(conflicts.items())[:MAX_CONFLICTS_SHOWN]]
+    if len(conflicts) > MAX_CONFLICTS_SHOWN:
+        lines.append(f'... and {len(conflicts) - MAX_CONFLICTS_SHOWN} more.')
+    return '\n'.join([heading] + lines)
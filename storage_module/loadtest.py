@@ -0,0 +1,119 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from storage_module.benchmarks import BENCHMARK_USER, Fixtures, load_dataset
+
+# Each endpoint as (sync url name, async url name, url builder).
+ENDPOINTS = {
+    'dashboard': ('home_url', 'async_home', lambda name, f: reverse(name)),
+    'freezer_data': ('freezer_data', 'async_freezer_data',
+                     lambda name, f: reverse(name, args=[f.freezer.id])),
+    'get_shelves': ('get_shelves', 'async_get_shelves',
+                    lambda name, f: f'{reverse(name)}?freezer_id={f.freezer.id}'),
+    'get_racks': ('get_racks', 'async_get_racks',
+                  lambda name, f: f'{reverse(name)}?freezer_id={f.freezer.id}'),
+}
+
+MODES = ('sync', 'async')
+
+
+def sync_load(url, cookies, clients, requests):
+    """
+    Serves requests through the WSGI handler from clients threads at once,
+    as a threaded WSGI server would.
+
+    Returns:
+        The latency of every request, in seconds, and the failed count.
+    """
+    def session(count):
+        client = Client()
+        client.cookies = cookies
+        latencies, failed = [], 0
+        for _ in range(count):
+            started = time.perf_counter()
+            response = client.get(url)
+            latencies.append(time.perf_counter() - started)
+            failed += response.status_code >= 400
+        # Every thread opened its own connection.
+        connections.close_all()
+        return latencies, failed
+
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(session, share(requests, clients)))
+    return [latency for latencies, _ in results for latency in latencies], \
+        sum(failed for _, failed in results)
+
+
+def async_load(url, cookies, clients, requests):
+    """Serves requests through the ASGI handler from clients tasks at once."""
+    async def session(count):
+        client = AsyncClient()
+        client.cookies = cookies
+        latencies, failed = [], 0
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await client.get(url)
+            latencies.append(time.perf_counter() - started)
+            failed += response.status_code >= 400
+        return latencies, failed
+
+    async def sessions():
+        return await asyncio.gather(*(session(count)
+                                      for count in share(requests, clients)))
+
+    results = asyncio.run(sessions())
+    return [latency for latencies, _ in results for latency in latencies], \
+        sum(failed for _, failed in results)
+
+
+def share(requests, clients):
+    """Splits requests as evenly as possible between clients."""
+    return [requests // clients + (index < requests % clients)
+            for index in range(clients)]
+
+
+def measure(mode, url, cookies, clients, requests):
+    load = sync_load if mode == 'sync' else async_load
+    # One short round first, so caches and connections are warm for both modes.
+    load(url, cookies, clients, clients)
+    started = time.perf_counter()
+    latencies, failed = load(url, cookies, clients, requests)
+    seconds = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'failed': failed,
+        'per_second': round(len(latencies) / seconds, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def run(dataset, endpoints=None, modes=MODES, clients=16, requests=200,
+        snapshot_dir=None, stdout=None):
+    """
+    Loads a benchmark dataset and drives every endpoint in every mode with
+    clients concurrent clients.
+
+    Returns:
+        A {endpoint: {mode: result}} dict.
+    """
+    load_dataset(dataset, snapshot_dir, stdout)
+    client = Client()
+    client.force_login(User.objects.get(username=BENCHMARK_USER))
+    fixtures = Fixtures()
+    results = {}
+    for endpoint in endpoints or ENDPOINTS:
+        sync_name, async_name, url = ENDPOINTS[endpoint]
+        results[endpoint] = {
+            mode: measure(mode, url(sync_name if mode == 'sync' else async_name,
+                                    fixtures), client.cookies, clients, requests)
+            for mode in modes}
+    return results
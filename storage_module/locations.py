@@ -0,0 +1,161 @@
+from django.db import transaction
+
+from storage_module.models import BoxLocation, ContainerOccupancy, DimBox, \
+    DimFacility, DimFreezer, DimRack, DimSample, DimShelf
+
+LEVELS = (
+    (ContainerOccupancy.FACILITY, 'F', DimFacility),
+    (ContainerOccupancy.FREEZER, 'Z', DimFreezer),
+    (ContainerOccupancy.SHELF, 'S', DimShelf),
+    (ContainerOccupancy.RACK, 'R', DimRack),
+    (ContainerOccupancy.BOX, 'B', DimBox),
+)
+
+
+def resolve_chain(box_ids=None):
+    """
+    Resolves the containers each box sits in from the foreign key chain,
+    whichever of rack, shelf or freezer the box hangs off. The most specific
+    container wins when the denormalized keys disagree. Passing None resolves
+    every box.
+
+    Returns:
+        A dict of box id to a {level: container id or None} mapping.
+    """
+    boxes = DimBox.objects.all()
+    if box_ids is not None:
+        boxes = boxes.filter(id__in=list(box_ids))
+    rows = boxes.values(
+        'id', 'rack_id', 'shelf_id', 'freezer_id', 'rack__shelf_id', 'rack__freezer_id',
+        'shelf__freezer_id', 'rack__shelf__freezer_id', 'freezer__facility_id',
+        'rack__freezer__facility_id', 'shelf__freezer__facility_id',
+        'rack__shelf__freezer__facility_id')
+    return {row['id']: _resolve(row) for row in rows.iterator(chunk_size=2000)}
+
+
+def _first(*values):
+    return next((value for value in values if value is not None), None)
+
+
+def _resolve(row):
+    return {
+        ContainerOccupancy.BOX: row['id'],
+        ContainerOccupancy.RACK: row['rack_id'],
+        ContainerOccupancy.SHELF: _first(row['rack__shelf_id'], row['shelf_id']),
+        ContainerOccupancy.FREEZER: _first(
+            row['rack__freezer_id'], row['rack__shelf__freezer_id'],
+            row['shelf__freezer_id'], row['freezer_id']),
+        ContainerOccupancy.FACILITY: _first(
+            row['rack__freezer__facility_id'], row['rack__shelf__freezer__facility_id'],
+            row['shelf__freezer__facility_id'], row['freezer__facility_id']),
+    }
+
+
+def build_path(ancestors):
+    """
+    Builds a sortable path such as "F0000000001/Z0000000004/R0000000007/B0000000123",
+    so every box under a container shares that container's path as a prefix.
+    """
+    return '/'.join(f'{prefix}{ancestors[level]:010d}'
+                    for level, prefix, _ in LEVELS if ancestors.get(level) is not None)
+
+
+def stored_ancestors(box_ids):
+    """Reads the materialized ancestors of each box from BoxLocation."""
+    rows = BoxLocation.objects.filter(box_id__in=list(box_ids)).values_list(
+        'box_id', 'facility_id', 'freezer_id', 'shelf_id', 'rack_id')
+    return {
+        box_id: {
+            ContainerOccupancy.BOX: box_id,
+            ContainerOccupancy.RACK: rack_id,
+            ContainerOccupancy.SHELF: shelf_id,
+            ContainerOccupancy.FREEZER: freezer_id,
+            ContainerOccupancy.FACILITY: facility_id,
+        } for box_id, facility_id, freezer_id, shelf_id, rack_id in rows}
+
+
+def sync(box_ids):
+    """
+    Brings the BoxLocation records of the given boxes in line with their
+    foreign keys.
+
+    Returns:
+        A list of (box_id, old ancestors or None, new ancestors) for every box
+        whose location changed or was recorded for the first time.
+    """
+    resolved = resolve_chain(box_ids)
+    stored = stored_ancestors(resolved.keys())
+    changes = [(box_id, stored.get(box_id), ancestors)
+               for box_id, ancestors in resolved.items()
+               if stored.get(box_id) != ancestors]
+    if not changes:
+        return changes
+
+    records = [_record(box_id, ancestors) for box_id, _, ancestors in changes]
+    with transaction.atomic():
+        BoxLocation.objects.bulk_create(
+            [record for record, (_, old, _) in zip(records, changes) if old is None])
+        BoxLocation.objects.bulk_update(
+            [record for record, (_, old, _) in zip(records, changes) if old is not None],
+            ['facility', 'freezer', 'shelf', 'rack', 'path'], batch_size=500)
+    return changes
+
+
+def _record(box_id, ancestors):
+    return BoxLocation(
+        box_id=box_id,
+        facility_id=ancestors[ContainerOccupancy.FACILITY],
+        freezer_id=ancestors[ContainerOccupancy.FREEZER],
+        shelf_id=ancestors[ContainerOccupancy.SHELF],
+        rack_id=ancestors[ContainerOccupancy.RACK],
+        path=build_path(ancestors))
+
+
+def rebuild():
+    """Recreates every BoxLocation record from the foreign key chain."""
+    resolved = resolve_chain()
+    with transaction.atomic():
+        BoxLocation.objects.all().delete()
+        BoxLocation.objects.bulk_create(
+            [_record(box_id, ancestors) for box_id, ancestors in resolved.items()],
+            batch_size=1000)
+    return len(resolved)
+
+
+def container_level(container):
+    return next(level for level, _, model in LEVELS if isinstance(container, model))
+
+
+def boxes_under(container):
+    """All boxes anywhere beneath a facility, freezer, shelf or rack."""
+    level = container_level(container)
+    return DimBox.objects.filter(**{f'resolved_location__{level}_id': container.pk})
+
+
+def samples_under(container):
+    """All samples stored anywhere beneath a facility, freezer, shelf or rack."""
+    level = container_level(container)
+    return DimSample.objects.filter(
+        **{f'box_position__box__resolved_location__{level}_id': container.pk})
+
+
+def boxes_for_containers(level, container_ids):
+    """Ids of boxes placed beneath any of the given containers, by either route."""
+    container_ids = list(container_ids)
+    box_ids = set(BoxLocation.objects.filter(
+        **{f'{level}_id__in': container_ids}).values_list('box_id', flat=True))
+    chain_filters = {
+        ContainerOccupancy.RACK: ['rack_id__in'],
+        ContainerOccupancy.SHELF: ['shelf_id__in', 'rack__shelf_id__in'],
+        ContainerOccupancy.FREEZER: ['freezer_id__in', 'rack__freezer_id__in',
+                                     'shelf__freezer_id__in',
+                                     'rack__shelf__freezer_id__in'],
+        ContainerOccupancy.FACILITY: ['freezer__facility_id__in',
+                                      'rack__freezer__facility_id__in',
+                                      'shelf__freezer__facility_id__in',
+                                      'rack__shelf__freezer__facility_id__in'],
+    }
+    for lookup in chain_filters[level]:
+        box_ids.update(DimBox.objects.filter(**{lookup: container_ids}).values_list(
+            'id', flat=True))
+    return box_ids
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from storage_module import benchmarks, loadtest
+
+
+class Command(BaseCommand):
+    help = ('Drives the dashboard and storage tree endpoints with concurrent clients, '
+            'comparing the throughput and latency of the sync views under WSGI with '
+            'the async views under ASGI.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', choices=list(benchmarks.DATASETS),
+                            default='small')
+        parser.add_argument('--endpoints', nargs='+', choices=list(loadtest.ENDPOINTS),
+                            help='Only load these endpoints (defaults to all).')
+        parser.add_argument('--modes', nargs='+', choices=loadtest.MODES,
+                            default=list(loadtest.MODES))
+        parser.add_argument('--clients', type=int, default=16,
+                            help='Concurrent clients: threads for sync, tasks for async.')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Requests per endpoint and mode, shared by the clients.')
+        parser.add_argument('--snapshot-dir',
+                            help='Directory holding the dataset snapshots (defaults to '
+                                 'STORAGE_SNAPSHOT_DIR or BASE_DIR/snapshots).')
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['requests'] < options['clients']:
+            raise CommandError('Need at least one client and a request per client.')
+        # Like benchmark_views, run against a throwaway test database.
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = loadtest.run(
+                options['dataset'], options['endpoints'], options['modes'],
+                options['clients'], options['requests'], options['snapshot_dir'],
+                self.stdout)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f"{'endpoint':<14} {'mode':<6} {'requests':>8} {'failed':>6} "
+                          f"{'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        failed = 0
+        for endpoint, modes in results.items():
+            for mode, result in modes.items():
+                failed += result['failed']
+                self.stdout.write(
+                    f"{endpoint:<14} {mode:<6} {result['requests']:>8} "
+                    f"{result['failed']:>6} {result['per_second']:>8} "
+                    f"{result['p50_ms']:>8} {result['p95_ms']:>8}")
+        if failed:
+            raise CommandError(f'{failed} requests failed')
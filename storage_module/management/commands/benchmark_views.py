@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from storage_module import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the storage views against generated datasets of growing size, '
+            'recording wall time, query count and peak memory, and fails when a view '
+            'exceeds its stored baseline or its query count grows with the data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--datasets', nargs='+', choices=list(benchmarks.DATASETS),
+                            default=['small', 'medium', 'large'])
+        parser.add_argument('--scenarios', nargs='+', choices=list(benchmarks.SCENARIOS),
+                            help='Only run these scenarios (defaults to all).')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Timed runs per scenario; the fastest is reported.')
+        parser.add_argument('--baseline', default=benchmarks.BASELINES_PATH,
+                            help='JSON file of baselines to compare against.')
+        parser.add_argument('--update-baselines', action='store_true',
+                            help='Write the results to the baseline file instead of '
+                                 'comparing against it.')
+        parser.add_argument('--time-tolerance', type=float, default=2.0,
+                            help='How many times slower than its baseline a view may be.')
+        parser.add_argument('--snapshot-dir',
+                            help='Directory holding the dataset snapshots (defaults to '
+                                 'STORAGE_SNAPSHOT_DIR or BASE_DIR/snapshots).')
+
+    def handle(self, *args, **options):
+        # Benchmarks run against a throwaway test database, never the real one.
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = benchmarks.run(
+                options['datasets'], options['scenarios'], options['repeat'],
+                options['snapshot_dir'], self.stdout)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.write_table(results)
+        if options['update_baselines']:
+            benchmarks.save_baselines(results, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Saved baselines to {options['baseline']}"))
+            failures = benchmarks.check(results, {})
+        else:
+            failures = benchmarks.check(results, benchmarks.load_baselines(
+                options['baseline']), options['time_tolerance'])
+        if failures:
+            raise CommandError('\n'.join(['Benchmark failures:'] + failures))
+        self.stdout.write(self.style.SUCCESS('All views are within budget'))
+
+    def write_table(self, results):
+        self.stdout.write(f"{'dataset':<8} {'scenario':<18} {'status':>6} "
+                          f"{'queries':>7} {'seconds':>8} {'peak KB':>8}")
+        for dataset, scenarios in results.items():
+            for scenario, result in scenarios.items():
+                self.stdout.write(
+                    f"{dataset:<8} {scenario:<18} {result['status']:>6} "
+                    f"{result['queries']:>7} {result['seconds']:>8.4f} "
+                    f"{result['peak_kb']:>8}")
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from storage_module.generators import StorageDataGenerator
+from storage_module.snapshots import restore_snapshot, save_snapshot
+
+
+class Command(BaseCommand):
+    help = ('Generates a deterministic synthetic storage hierarchy with samples, '
+            'positions, notes and history, and saves or restores named SQLite '
+            'snapshots of it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--facilities', type=int, default=1)
+        parser.add_argument('--samples', type=int, default=10000)
+        parser.add_argument('--box-capacity', type=int, default=81,
+                            help='Slots per box; 81, 96 and 100 map to real layouts.')
+        parser.add_argument('--fill-ratio', type=float, default=0.9,
+                            help='Share of each box filled with samples.')
+        parser.add_argument('--shelves-per-freezer', type=int, default=5)
+        parser.add_argument('--racks-per-shelf', type=int, default=4)
+        parser.add_argument('--boxes-per-rack', type=int, default=20)
+        parser.add_argument('--note-ratio', type=float, default=0.05,
+                            help='Share of samples given a note.')
+        parser.add_argument('--no-history', action='store_true',
+                            help='Skip writing HistoricalDimSample rows.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Samples written per transaction.')
+        parser.add_argument('--save-snapshot', metavar='NAME',
+                            help='Save the database as a named snapshot afterwards.')
+        parser.add_argument('--load-snapshot', metavar='NAME',
+                            help='Restore a named snapshot instead of generating data.')
+        parser.add_argument('--snapshot-dir',
+                            help='Directory holding snapshots (defaults to '
+                                 'STORAGE_SNAPSHOT_DIR or BASE_DIR/snapshots).')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['load_snapshot']:
+            try:
+                path = restore_snapshot(options['load_snapshot'], options['snapshot_dir'])
+            except FileNotFoundError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(
+                f'Restored snapshot {path} in {time.monotonic() - started:.1f}s'))
+            return
+
+        generator = StorageDataGenerator(
+            facilities=options['facilities'], samples=options['samples'],
+            box_capacity=options['box_capacity'], fill_ratio=options['fill_ratio'],
+            shelves_per_freezer=options['shelves_per_freezer'],
+            racks_per_shelf=options['racks_per_shelf'],
+            boxes_per_rack=options['boxes_per_rack'], note_ratio=options['note_ratio'],
+            history=not options['no_history'], seed=options['seed'],
+            chunk_size=options['chunk_size'], stdout=self.stdout)
+        stats = generator.run()
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {stats['samples']} samples in {stats['boxes']} boxes, "
+            f"{stats['racks']} racks and {stats['freezers']} freezers across "
+            f"{stats['facilities']} facilities in {time.monotonic() - started:.1f}s"))
+
+        if options['save_snapshot']:
+            path = save_snapshot(options['save_snapshot'], options['snapshot_dir'])
+            self.stdout.write(self.style.SUCCESS(f'Saved snapshot {path}'))
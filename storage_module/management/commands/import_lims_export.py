@@ -0,0 +1,52 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from storage_module import jobs
+from storage_module.importers import LimsExportImporter
+
+
+class Command(BaseCommand):
+    help = 'Imports a "LIMS Storage Export" CSV file into the storage tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the exported CSV file.')
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help='Rows written per transaction.')
+        parser.add_argument('--source-file-name',
+                            help='Name recorded on DimSourceFile (defaults to the '
+                                 'CSV file name).')
+        parser.add_argument('--background', action='store_true',
+                            help='Queue the import for run_storage_jobs instead of '
+                                 'running it here.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'File not found: {path}')
+
+        if options['background']:
+            job = jobs.enqueue('import', description=f'Import {os.path.basename(path)}',
+                               path=os.path.abspath(path),
+                               chunk_size=options['chunk_size'],
+                               source_file_name=options['source_file_name'])
+            self.stdout.write(f'Queued import job {job.pk}')
+            return
+
+        started = time.monotonic()
+        importer = LimsExportImporter(path, chunk_size=options['chunk_size'],
+                                      source_file_name=options['source_file_name'],
+                                      stdout=self.stdout)
+        stats = importer.run()
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats['samples']} samples, {stats['positions']} positions and "
+            f"{stats['notes']} notes from {stats['rows']} rows "
+            f"({stats['skipped']} skipped, {stats['conflicts']} not placed) in "
+            f"{time.monotonic() - started:.1f}s"))
+        shown = list(importer.conflicts.items())[:jobs.MAX_CONFLICTS_SHOWN]
+        for sample_id, message in shown:
+            self.stdout.write(self.style.WARNING(f'{sample_id}: {message}'))
+        if len(importer.conflicts) > len(shown):
+            self.stdout.write(self.style.WARNING(
+                f'... and {len(importer.conflicts) - len(shown)} more.'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from storage_module import locations, occupancy
+
+
+class Command(BaseCommand):
+    help = ('Re-resolves every box location and recomputes the stored-sample and '
+            'capacity rollup for every container.')
+
+    def handle(self, *args, **options):
+        boxes = locations.rebuild()
+        containers = occupancy.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt locations for {boxes} boxes and occupancy counters for '
+            f'{containers} containers.'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from storage_module import search
+
+
+class Command(BaseCommand):
+    help = ('Creates the sample search index (FTS5 on SQLite, an ngram FULLTEXT '
+            'index on MySQL) if needed and re-indexes every sample.')
+
+    def handle(self, *args, **options):
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} samples for search.'))
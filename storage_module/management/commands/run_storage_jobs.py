@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from storage_module import jobs
+
+
+class Command(BaseCommand):
+    help = ('Runs queued storage jobs (bulk status changes, notes, exports, moves and '
+            'imports) on a pool of threads, polling the job table for new ones.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Jobs run at the same time.')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between looks at the queue.')
+        parser.add_argument('--once', action='store_true',
+                            help='Stop once the queue is empty instead of waiting '
+                                 'for more jobs.')
+
+    def handle(self, *args, **options):
+        jobs.work(options['workers'], options['interval'], options['once'],
+                  stdout=self.stdout)
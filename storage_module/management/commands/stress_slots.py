@@ -0,0 +1,62 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from storage_module import stress
+
+
+class Command(BaseCommand):
+    help = ('Fills one box from many threads at once and checks that no placement is '
+            'lost or duplicated, reporting throughput and how often moves had to be '
+            'retried.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Threads moving samples at the same time.')
+        parser.add_argument('--capacity', type=int, default=100,
+                            help='Capacity of the box being filled.')
+        parser.add_argument('--samples', type=int,
+                            help='Samples to place; defaults to 20%% more than fit, so '
+                                 'the box fills up and the rest are turned away.')
+        parser.add_argument('--batch', type=int, default=1,
+                            help='Samples each move places at once.')
+        parser.add_argument('--mode', choices=stress.MODES, default='fill',
+                            help="'fill' sends every move to the first free slots; "
+                                 "'random' sends each sample to a random slot.")
+
+    def handle(self, *args, **options):
+        samples = options['samples'] or options['capacity'] * 6 // 5
+        test_settings = connection.settings_dict['TEST']
+        temporary = None
+        if connection.vendor == 'sqlite' and not test_settings.get('NAME'):
+            # The in-memory test database is shared between threads in a way
+            # that bypasses SQLite's locking, so the workers get a real file.
+            temporary = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+            temporary.close()
+            test_settings['NAME'] = temporary.name
+        # Stress tests run against a throwaway test database, never the real one.
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            result = stress.run(options['workers'], samples, options['capacity'],
+                                options['batch'], options['mode'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if temporary:
+                test_settings['NAME'] = None
+                if os.path.exists(temporary.name):
+                    os.remove(temporary.name)
+
+        self.stdout.write(
+            f"{result['workers']} workers made {result['moves']} moves in "
+            f"{result['seconds']:.2f}s: {result['placed']} samples placed "
+            f"({result['placements_per_second']:.1f}/s), "
+            f"{result['free_slots']} slots left free.")
+        self.stdout.write(f"Rejected: {result['rejected'] or 'none'}")
+        self.stdout.write(f"Moves by attempts needed: {result['attempts']} "
+                          f"({result['retried']} retried)")
+        if result['problems']:
+            raise CommandError('\n'.join(['Stress test failures:'] + result['problems']))
+        self.stdout.write(self.style.SUCCESS('No placements were lost or duplicated'))
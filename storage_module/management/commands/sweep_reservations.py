@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from storage_module import selections
+from storage_module.reservations import sweep
+
+
+class Command(BaseCommand):
+    help = ('Deletes expired slot reservations and old sample selections, once or '
+            'every --interval seconds. Expired reservations are already ignored; '
+            'this keeps the tables small.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep sweeping, waiting this many seconds in between.')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = sweep()
+            pruned = selections.prune()
+            self.stdout.write(f'Deleted {deleted} expired reservations and {pruned} '
+                              f'old selections')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from storage_module.routers import REPLICA_DB_ALIAS, replica_configured
+from storage_module.snapshots import copy_database
+
+
+class Command(BaseCommand):
+    help = ('Copies the primary SQLite database over the local replica, once or every '
+            '--interval seconds, so the read/write split can be exercised without a '
+            'real replication setup.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep copying, waiting this many seconds in between; '
+                                 'the wait doubles as simulated replication lag.')
+
+    def handle(self, *args, **options):
+        if not replica_configured():
+            raise CommandError(
+                f'No {REPLICA_DB_ALIAS!r} database is configured; set '
+                f'STORAGE_REPLICA_NAME.')
+        while True:
+            started = time.monotonic()
+            copy_database(DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS)
+            self.stdout.write(f'Synced the replica in {time.monotonic() - started:.2f}s')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -1,7 +1,89 @@
+import math
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import F
+from django.utils.functional import cached_property
 from simple_history.models import HistoricalRecords
 
+# Samples in any other status have left storage and give up their box position.
+STORAGE_STATUSES = ('In Storage', 'Archived')
+
+# Rows x columns of the box formats in use, keyed by capacity.
+BOX_LAYOUTS = {
+    81: (9, 9),
+    96: (8, 12),
+    100: (10, 10),
+}
+
+
+# The containers a box resolves to, loaded alongside it by with_location().
+BOX_LOCATION_RELATIONS = ['resolved_location__facility', 'resolved_location__freezer',
+                          'resolved_location__shelf', 'resolved_location__rack']
+
+# Location columns annotated onto samples by with_location(), for values() and
+# values_list() callers such as the samples table and exports.
+SAMPLE_LOCATION_FIELDS = {
+    'facility_id': 'box_position__box__resolved_location__facility_id',
+    'facility_name': 'box_position__box__resolved_location__facility__facility_name',
+    'freezer_id': 'box_position__box__resolved_location__freezer_id',
+    'freezer_name': 'box_position__box__resolved_location__freezer__freezer_name',
+    'shelf_id': 'box_position__box__resolved_location__shelf_id',
+    'shelf_name': 'box_position__box__resolved_location__shelf__shelf_name',
+    'rack_id': 'box_position__box__resolved_location__rack_id',
+    'rack_name': 'box_position__box__resolved_location__rack__rack_name',
+    'box_id': 'box_position__box_id',
+    'box_name': 'box_position__box__box_name',
+    'x_position': 'box_position__x_position',
+    'y_position': 'box_position__y_position',
+}
+
+
+class AtomicSaveMixin:
+    """
+    Saves the row in one transaction with its post_save signal handlers,
+    which keep the occupancy rollup and BoxLocation records in step. Django
+    sends post_save after its own transaction, so without this a failure in
+    a handler would leave the row written and the counters behind. Deletes
+    need no help: Django already sends post_delete inside the transaction
+    of the delete.
+    """
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            return super().save(*args, **kwargs)
+
+
+class DimBoxQuerySet(models.QuerySet):
+
+    def with_location(self):
+        """
+        Loads the BoxLocation of each box, and the containers it names, in the
+        same query, so DimBox.location needs no further queries.
+        """
+        return self.select_related(*BOX_LOCATION_RELATIONS)
+
+
+class DimSampleQuerySet(models.QuerySet):
+
+    def with_location(self, *fields):
+        """
+        Loads the box position, box and resolved containers of each sample in
+        the same query, so the location properties of DimSample need no
+        further queries, and annotates location columns.
+
+        Args:
+            fields: The SAMPLE_LOCATION_FIELDS to annotate, all of them by
+                default. values() callers name only the columns they show, as
+                every column joins in another table.
+        """
+        fields = fields or SAMPLE_LOCATION_FIELDS
+        return self.select_related(
+            'box_position__box',
+            *[f'box_position__box__{relation}' for relation in BOX_LOCATION_RELATIONS]
+        ).annotate(**{name: F(SAMPLE_LOCATION_FIELDS[name]) for name in fields})
+
 
 class DimFacility(models.Model):
     facility_name = models.CharField(max_length=255)
@@ -31,7 +113,7 @@ class DimSourceFile(models.Model):
         db_table = 'dimsourcefile'
 
 
-class BoxPosition(models.Model):
+class BoxPosition(AtomicSaveMixin, models.Model):
     sample = models.OneToOneField('DimSample', on_delete=models.CASCADE,
                                   related_name="box_position", to_field='sample_id')
     box = models.ForeignKey('DimBox', on_delete=models.CASCADE)
@@ -47,7 +129,7 @@ class BoxPosition(models.Model):
         unique_together = ('box', 'x_position', 'y_position')
 
 
-class DimBox(models.Model):
+class DimBox(AtomicSaveMixin, models.Model):
     box_name = models.CharField(max_length=255)
     box_description = models.TextField(null=True, )
     box_capacity = models.IntegerField(default=100, null=True, )
@@ -58,6 +140,8 @@ class DimBox(models.Model):
     freezer = models.ForeignKey('DimFreezer', on_delete=models.CASCADE,
                                 related_name='boxes', null=True, blank=True)
 
+    objects = DimBoxQuerySet.as_manager()
+
     def __str__(self):
         return self.box_name
 
@@ -70,31 +154,157 @@ class DimBox(models.Model):
     def positions(self):
         return self.boxposition_set.all()
 
+    @property
+    def grid_dimensions(self):
+        """(rows, columns) of the box grid, derived from its capacity."""
+        capacity = self.box_capacity or 81
+        if capacity in BOX_LAYOUTS:
+            return BOX_LAYOUTS[capacity]
+        columns = math.ceil(math.sqrt(capacity))
+        return math.ceil(capacity / columns), columns
+
     def get_samples(self):
         return [position.sample for position in self.positions]
 
-    @property
+    @cached_property
     def location(self):
-        if self.rack:
-            return {
-                'facility': getattr(getattr(self.rack, 'freezer', None), 'facility',
-                                    None),
-                'freezer': getattr(self.rack, 'freezer', None),
-                'shelf': getattr(self.rack, 'shelf', None),
-                'rack': self.rack
-            }
-        if self.shelf:
-            return {
-                'facility': getattr(getattr(self.shelf, 'freezer', None), 'facility',
-                                    None),
-                'freezer': getattr(self.shelf, 'freezer', None),
-                'shelf': self.shelf
-            }
-        if self.freezer:
-            return {
-                'facility': self.freezer.facility,
-                'freezer': self.freezer
-            }
+        """
+        The containers this box sits in, read from its materialized
+        BoxLocation record, which is queried unless loaded by with_location().
+        """
+        if DimBox.resolved_location.is_cached(self):
+            record = getattr(self, 'resolved_location', None)
+        else:
+            record = BoxLocation.objects.select_related(
+                'facility', 'freezer', 'shelf', 'rack').filter(box_id=self.pk).first()
+        return {
+            'facility': getattr(record, 'facility', None),
+            'freezer': getattr(record, 'freezer', None),
+            'shelf': getattr(record, 'shelf', None),
+            'rack': getattr(record, 'rack', None),
+        }
+
+
+class BoxLocation(models.Model):
+    """
+    Denormalized location of a box: the facility, freezer, shelf and rack it
+    resolves to, whichever container it hangs off, plus a sortable path.
+    Kept in sync by storage_module.locations.
+    """
+    box = models.OneToOneField('DimBox', on_delete=models.CASCADE, primary_key=True,
+                               related_name='resolved_location')
+    facility = models.ForeignKey('DimFacility', on_delete=models.CASCADE, null=True,
+                                 related_name='+')
+    freezer = models.ForeignKey('DimFreezer', on_delete=models.CASCADE, null=True,
+                                related_name='+')
+    shelf = models.ForeignKey('DimShelf', on_delete=models.CASCADE, null=True,
+                              related_name='+')
+    rack = models.ForeignKey('DimRack', on_delete=models.CASCADE, null=True,
+                             related_name='+')
+    path = models.CharField(max_length=64, db_index=True)
+
+    class Meta:
+        app_label = 'storage_module'
+        db_table = 'boxlocation'
+
+
+class SlotReservation(models.Model):
+    """
+    A box slot held for a move session until expires_at, so that no other
+    session picks it meanwhile. Expired rows are ignored everywhere and are
+    removed in bulk by storage_module.reservations.sweep.
+    """
+    box = models.ForeignKey('DimBox', on_delete=models.CASCADE,
+                            related_name='reservations')
+    x_position = models.IntegerField()
+    y_position = models.CharField(max_length=255)
+    holder = models.CharField(max_length=255, db_index=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        app_label = 'storage_module'
+        db_table = 'slotreservation'
+        unique_together = ('box', 'x_position', 'y_position')
+
+
+class SampleSelection(models.Model):
+    """
+    A saved set of samples that bulk operations refer to by id instead of
+    carrying sample ids from request to request. The primary keys of the
+    samples are stored sorted and packed by storage_module.selections.
+    """
+    owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    description = models.CharField(max_length=255, blank=True)
+    size = models.IntegerField(default=0)
+    sample_pks = models.BinaryField()
+    created_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = 'storage_module'
+        db_table = 'sampleselection'
+
+    def __str__(self):
+        return self.description or f'{self.size} samples'
+
+
+class StorageJob(models.Model):
+    """
+    A long storage operation, queued by a request and run outside it by
+    `manage.py run_storage_jobs`, which records its progress here for the
+    page that polls it. See storage_module.jobs.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUSES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    )
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+    kind = models.CharField(max_length=50)
+    description = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED,
+                              db_index=True)
+    params = models.JSONField(default=dict)
+    selection = models.ForeignKey('SampleSelection', on_delete=models.SET_NULL,
+                                  null=True, blank=True)
+    owner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    total = models.IntegerField(null=True, blank=True)
+    done = models.IntegerField(default=0)
+    message = models.TextField(blank=True)
+    result_path = models.CharField(max_length=255, blank=True)
+    cancel_requested = models.BooleanField(default=False)
+    worker = models.CharField(max_length=100, blank=True)
+    created_date = models.DateTimeField(auto_now_add=True)
+    started_date = models.DateTimeField(null=True, blank=True)
+    finished_date = models.DateTimeField(null=True, blank=True)
+    heartbeat = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        app_label = 'storage_module'
+        db_table = 'storagejob'
+
+    def __str__(self):
+        return self.description or self.kind
+
+    @property
+    def finished(self):
+        return self.status in self.FINISHED
+
+    @property
+    def percent(self):
+        """How far the job got, or None while its size is unknown."""
+        if self.status == self.DONE:
+            return 100
+        if not self.total:
+            return None
+        return min(100, self.done * 100 // self.total)
 
 
 class DimTime(models.Model):
@@ -131,7 +341,7 @@ class Note(models.Model):
         return self.text
 
 
-class DimSample(models.Model):
+class DimSample(AtomicSaveMixin, models.Model):
     sample_id = models.CharField(max_length=255, unique=True)
     protocol_number = models.CharField(max_length=255, null=True, )
     tid = models.CharField(max_length=255, null=True, )
@@ -152,9 +362,10 @@ class DimSample(models.Model):
 
     history = HistoricalRecords()
 
+    objects = DimSampleQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
-        if self.sample_status and self.sample_status.name not in ['In Storage',
-                                                                  'Archived']:
+        if self.sample_status and self.sample_status.name not in STORAGE_STATUSES:
             BoxPosition.objects.filter(sample_id=self.sample_id).delete()
 
         return super().save(*args, **kwargs)
@@ -163,28 +374,36 @@ class DimSample(models.Model):
         app_label = 'storage_module'
         db_table = 'dimsample'
 
+    @property
+    def position(self):
+        """The BoxPosition of the sample, or None when it is not in a box."""
+        return getattr(self, 'box_position', None)
+
     @property
     def box(self):
-        return self.box_position.box if hasattr(self, 'box_position') else None
+        return self.position.box if self.position else None
+
+    # The containers below are those the box resolves to, so a box hanging off
+    # a rack still reports its shelf, freezer and facility.
 
     @property
     def rack(self):
-        return self.box.rack if self.box and self.box.rack else None
+        return self.box.location['rack'] if self.box else None
 
     @property
     def shelf(self):
-        return self.box.shelf if self.box and self.box.shelf else None
+        return self.box.location['shelf'] if self.box else None
 
     @property
     def freezer(self):
-        return self.box.freezer if self.box and self.box.freezer else None
+        return self.box.location['freezer'] if self.box else None
 
     @property
     def facility(self):
-        return self.freezer.facility if self.freezer else None
+        return self.box.location['facility'] if self.box else None
 
 
-class DimRack(models.Model):
+class DimRack(AtomicSaveMixin, models.Model):
     rack_name = models.CharField(max_length=50, null=True)
     rack_description = models.TextField(null=True)
     shelf = models.ForeignKey('DimShelf', on_delete=models.CASCADE, related_name='racks',
@@ -200,7 +419,7 @@ class DimRack(models.Model):
         db_table = 'dimrack'
 
 
-class DimShelf(models.Model):
+class DimShelf(AtomicSaveMixin, models.Model):
     shelf_name = models.CharField(max_length=50)
     shelf_description = models.TextField()
     freezer = models.ForeignKey('DimFreezer', on_delete=models.CASCADE,
@@ -214,7 +433,7 @@ class DimShelf(models.Model):
         db_table = 'dimshelf'
 
 
-class DimFreezer(models.Model):
+class DimFreezer(AtomicSaveMixin, models.Model):
     freezer_name = models.CharField(max_length=255)
     freezer_description = models.TextField(null=True)
     facility = models.ForeignKey('DimFacility', on_delete=models.CASCADE, null=True)
@@ -255,3 +474,34 @@ class MeasureSampleTypeCountsByFacility(models.Model):
     class Meta:
         app_label = 'storage_module'
         db_table = 'measuresampletypecounts'
+
+
+class ContainerOccupancy(models.Model):
+    """Stored-sample and capacity counters rolled up per storage container."""
+    BOX = 'box'
+    RACK = 'rack'
+    SHELF = 'shelf'
+    FREEZER = 'freezer'
+    FACILITY = 'facility'
+    CONTAINER_TYPES = (
+        (BOX, 'Box'),
+        (RACK, 'Rack'),
+        (SHELF, 'Shelf'),
+        (FREEZER, 'Freezer'),
+        (FACILITY, 'Facility'),
+    )
+
+    container_type = models.CharField(max_length=10, choices=CONTAINER_TYPES)
+    container_id = models.BigIntegerField()
+    stored_samples = models.IntegerField(default=0)
+    capacity = models.IntegerField(default=0)
+    box_count = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = 'storage_module'
+        db_table = 'containeroccupancy'
+        unique_together = ('container_type', 'container_id')
+
+    @property
+    def available_capacity(self):
+        return self.capacity - self.stored_samples
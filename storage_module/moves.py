@@ -0,0 +1,343 @@
+import random
+import time
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F, Q
+
+from storage_module import occupancy, slots
+from storage_module.models import BoxPosition, DimBox, DimSample, SlotReservation
+
+# Attempts at a move that collides with a concurrent one, and the base of the
+# randomised exponential backoff between attempts.
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 0.02
+
+BUSY_MESSAGE = 'The boxes are busy with other moves; please try again.'
+
+# Samples moved per transaction by move_in_chunks.
+CHUNK_SIZE = 2000
+
+# Fragments of the errors databases raise when a transaction lost a race for
+# a lock rather than failed outright.
+CONTENTION_ERRORS = ('lock', 'deadlock', 'serialize')
+
+
+def is_contention(error):
+    if isinstance(error, IntegrityError):
+        # The unique slot constraint: a concurrent move took the slot first.
+        return True
+    return any(fragment in str(error).lower() for fragment in CONTENTION_ERRORS)
+
+
+def take_write_lock(box_ids):
+    """
+    SQLite has no row locks. Writing before the first read of a transaction
+    takes its database lock at once, so concurrent writers queue on the busy
+    timeout instead of failing to upgrade a read lock. Elsewhere the boxes
+    are locked with select_for_update.
+    """
+    if not connection.features.has_select_for_update:
+        DimBox.objects.filter(id__in=box_ids).update(box_capacity=F('box_capacity'))
+
+
+class SampleMover:
+    """
+    Moves a batch of samples to new box positions in a single transaction.
+
+    Every target is checked up front: unknown samples, unknown boxes, slots
+    outside the box grid, a sample given two slots, two samples sent to the
+    same slot and slots held by samples outside the batch are all reported as
+    conflicts, and nothing is written unless the whole batch is clean. Samples
+    in the batch may swap or shuffle between each other's slots. The affected
+    boxes are locked for the duration, and the moves themselves are one delete
+    and one bulk insert, so the cost does not grow with the number of samples
+    moved.
+
+    A batch that collides with a concurrent move, on a lock or on the unique
+    slot constraint, is retried with backoff. The retry reads the slots
+    afresh, so it either goes through or reports the slots as occupied.
+
+    Slots reserved by another session are conflicts too. The mover's own
+    reservations on the slots it fills are released once the move is made.
+    """
+
+    def __init__(self, targets, holder=None):
+        """
+        Args:
+            targets: An iterable of (sample_id, box, x_position, y_position),
+                where box is a DimBox or its id, x_position is the 0-based
+                column and y_position the row letter.
+            holder: The reservation holder the move is made for, if any.
+        """
+        self.targets = [
+            (sample_id, getattr(box, 'pk', box), int(x_position),
+             (y_position or '').upper())
+            for sample_id, box, x_position, y_position in targets]
+        self.sample_ids = [target[0] for target in self.targets]
+        self.box_ids = {target[1] for target in self.targets}
+        self.holder = holder
+        self.conflicts = {}
+        self.attempts = 0
+
+    def run(self):
+        """
+        Returns:
+            A dict of sample id to a conflict message. The batch was applied
+            only if it is empty.
+        """
+        if not self.sample_ids:
+            return self.conflicts
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.attempts = attempt
+            self.conflicts = {}
+            try:
+                with transaction.atomic():
+                    self.move()
+                return self.conflicts
+            except (IntegrityError, OperationalError) as error:
+                if not is_contention(error):
+                    raise
+            if attempt < MAX_ATTEMPTS:
+                time.sleep(random.uniform(0, BACKOFF_SECONDS * 2 ** attempt))
+        return {sample_id: BUSY_MESSAGE for sample_id in self.sample_ids}
+
+    def validate(self):
+        """
+        Returns:
+            A dict of sample id to the conflict the batch would meet now.
+            Nothing is moved.
+        """
+        self.conflicts = {}
+        if self.sample_ids:
+            with transaction.atomic():
+                self.inspect()
+        return self.conflicts
+
+    def move(self):
+        take_write_lock(self.box_ids)
+        current = self.inspect()
+        if not self.conflicts:
+            self.apply(current)
+
+    def inspect(self):
+        """
+        Locks the boxes, plans the targets and records their conflicts.
+
+        Returns:
+            A dict of sample id to box id for the samples now in a box.
+        """
+        current = dict(BoxPosition.objects.filter(
+            sample_id__in=self.sample_ids).values_list('sample_id', 'box_id'))
+        boxes = self.lock_boxes(set(current.values()) | self.box_ids)
+        self.plan(boxes)
+        if not self.conflicts:
+            self.check(boxes, current)
+        return current
+
+    def lock_boxes(self, box_ids):
+        """Locks the source and target boxes in id order, so movers never deadlock."""
+        return {box.pk: box for box in DimBox.objects.select_for_update().filter(
+            id__in=box_ids).order_by('id')}
+
+    def plan(self, boxes):
+        """Chooses the targets once the boxes are locked; they are given up front here."""
+
+    def check(self, boxes, current):
+        sample_ids = set(DimSample.objects.filter(
+            sample_id__in=[target[0] for target in self.targets]).values_list(
+            'sample_id', flat=True))
+        moving = Counter(target[0] for target in self.targets)
+
+        requested = Counter((box_id, x_position, y_position)
+                            for _, box_id, x_position, y_position in self.targets)
+        occupied = self.occupied_slots(requested.keys())
+        reserved = slots.reserved_slots(self.box_ids, self.holder)
+
+        for sample_id, box_id, x_position, y_position in self.targets:
+            slot = (box_id, x_position, y_position)
+            label = f'{y_position}{x_position + 1}'
+            if sample_id not in sample_ids:
+                self.conflicts[sample_id] = 'Sample does not exist.'
+            elif moving[sample_id] > 1:
+                self.conflicts[sample_id] = 'Sample was given more than one position.'
+            elif box_id not in boxes:
+                self.conflicts[sample_id] = 'Box does not exist.'
+            elif slots.SlotMap(*boxes[box_id].grid_dimensions).index(
+                    x_position, y_position) is None:
+                self.conflicts[sample_id] = (
+                    f'Position {label} is outside the grid of box '
+                    f'{boxes[box_id].box_name}.')
+            elif requested[slot] > 1:
+                self.conflicts[sample_id] = (
+                    f'Position {label} was chosen for more than one sample.')
+            elif slot in occupied and occupied[slot] not in moving:
+                self.conflicts[sample_id] = (
+                    f'Position {label} of box {boxes[box_id].box_name} is already '
+                    f'occupied by {occupied[slot]}.')
+            elif slot in reserved:
+                self.conflicts[sample_id] = (
+                    f'Position {label} of box {boxes[box_id].box_name} is held for '
+                    f'another move in progress.')
+
+    def occupied_slots(self, requested):
+        """The current holder of every requested slot, read in one query."""
+        box_ids = {box_id for box_id, _, _ in requested}
+        rows = BoxPosition.objects.filter(
+            box_id__in=box_ids,
+            x_position__in={x_position for _, x_position, _ in requested},
+            y_position__in={y_position for _, _, y_position in requested}).values_list(
+            'box_id', 'x_position', 'y_position', 'sample_id')
+        return {(box_id, x_position, y_position): sample_id
+                for box_id, x_position, y_position, sample_id in rows
+                if (box_id, x_position, y_position) in requested}
+
+    def apply(self, current):
+        box_deltas = Counter()
+        box_deltas.subtract(current.values())
+        box_deltas.update(target[1] for target in self.targets)
+        with occupancy.muted():
+            # Clearing the old slots first lets samples in the batch take each
+            # other's places without tripping the unique slot constraint.
+            BoxPosition.objects.filter(sample_id__in=list(current)).delete()
+            BoxPosition.objects.bulk_create([
+                BoxPosition(sample_id=sample_id, box_id=box_id, x_position=x_position,
+                            y_position=y_position)
+                for sample_id, box_id, x_position, y_position in self.targets])
+        if self.holder is not None:
+            self.release_reservations()
+        slots.invalidate(box_deltas.keys())
+        occupancy.record_sample_changes(box_deltas)
+
+    def release_reservations(self):
+        """Releases the holder's reservations on the slots just filled."""
+        filled = Q()
+        for _, box_id, x_position, y_position in self.targets:
+            filled |= Q(box_id=box_id, x_position=x_position, y_position=y_position)
+        SlotReservation.objects.filter(filled, holder=self.holder).delete()
+
+
+class BoxFiller(SampleMover):
+    """
+    Moves samples into the first free slots of a box, in reading order. The
+    slots are chosen from the database while the box is locked, so movers
+    filling the same box at once never pick the same slot.
+    """
+
+    def __init__(self, sample_ids, box, holder=None):
+        super().__init__([], holder)
+        self.sample_ids = list(dict.fromkeys(sample_ids))
+        self.box_ids = {box.pk}
+        self.box = box
+
+    def plan(self, boxes):
+        box = boxes.get(self.box.pk)
+        if box is None:
+            self.conflicts = dict.fromkeys(self.sample_ids, 'Box does not exist.')
+            return
+        available = slots.load(box)
+        available.mark((x_position, y_position) for _, x_position, y_position
+                       in slots.reserved_slots([box.pk], self.holder))
+        free = available.free_slots()
+        if len(free) < len(self.sample_ids):
+            self.conflicts = dict.fromkeys(
+                self.sample_ids,
+                f'Box {box.box_name} has only {len(free)} free positions.')
+            return
+        self.targets = [(sample_id, box.pk, x_position, y_position)
+                        for sample_id, (x_position, y_position)
+                        in zip(self.sample_ids, free)]
+
+
+def move_samples(targets, holder=None):
+    """
+    Moves samples to the given positions, all or nothing. Slots reserved by
+    anyone but holder are refused.
+
+    Returns:
+        A dict of sample id to conflict message, empty when the move was applied.
+    """
+    return SampleMover(targets, holder).run()
+
+
+def chunk_targets(targets, size=CHUNK_SIZE):
+    """
+    Splits targets into chunks of about size samples that can be moved one
+    after another. A sample sent to a slot another sample of the batch holds
+    goes in the same chunk as that sample, so swaps and shuffles stay whole
+    even when that makes a chunk larger.
+
+    Yields:
+        Lists of targets, as normalised by SampleMover.
+    """
+    mover = SampleMover(targets)
+    holders = {(box_id, x_position, y_position): sample_id
+               for sample_id, box_id, x_position, y_position
+               in BoxPosition.objects.filter(sample_id__in=mover.sample_ids).values_list(
+                   'sample_id', 'box_id', 'x_position', 'y_position')}
+    groups = {sample_id: sample_id for sample_id in mover.sample_ids}
+
+    def group_of(sample_id):
+        while groups[sample_id] != sample_id:
+            groups[sample_id] = groups[groups[sample_id]]
+            sample_id = groups[sample_id]
+        return sample_id
+
+    for sample_id, box_id, x_position, y_position in mover.targets:
+        holder = holders.get((box_id, x_position, y_position))
+        if holder is not None:
+            groups[group_of(holder)] = group_of(sample_id)
+    members = defaultdict(list)
+    for target in mover.targets:
+        members[group_of(target[0])].append(target)
+
+    chunk = []
+    for group in members.values():
+        chunk.extend(group)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def move_in_chunks(targets, holder=None, size=CHUNK_SIZE, progress=None):
+    """
+    Moves samples to the given positions a chunk at a time, each chunk in its
+    own transaction, so a large move never holds its locks all at once. The
+    whole batch is checked first and a batch with conflicts moves nothing. A
+    chunk that then loses a slot to a concurrent move stops the batch, and
+    the chunks before it stay moved.
+
+    Args:
+        progress: Called with the number of samples in each chunk once it
+            is moved. It may raise to stop the move after that chunk.
+
+    Returns:
+        (moved, conflicts): the number of samples moved and a dict of sample
+        id to conflict message, empty when every chunk was moved.
+    """
+    targets = list(targets)
+    conflicts = SampleMover(targets, holder).validate()
+    if conflicts:
+        return 0, conflicts
+    moved = 0
+    for chunk in chunk_targets(targets, size):
+        conflicts = move_samples(chunk, holder)
+        if conflicts:
+            return moved, conflicts
+        moved += len(chunk)
+        if progress:
+            progress(len(chunk))
+    return moved, {}
+
+
+def move_samples_to_box(sample_ids, box, holder=None):
+    """
+    Moves samples into the first free slots of a box, in reading order,
+    passing over slots reserved by anyone but holder.
+
+    Returns:
+        A dict of sample id to conflict message, empty when the move was applied.
+    """
+    return BoxFiller(sample_ids, box, holder).run()
@@ -0,0 +1,265 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, F
+
+from storage_module import locations, reference, slots, versions
+from storage_module.models import BoxPosition, ContainerOccupancy, DimBox
+
+# The counters follow model-level writes: the signal handlers in
+# storage_module.signals update them on save() and delete(), in the same
+# transaction as the row. Bulk writes (bulk_create, queryset update() and the
+# like) send no signals. The services that make them mute the handlers and
+# report their changes through record_sample_changes in their own
+# transaction, and box changes made by queryset go through update_boxes.
+# Anything else that writes in bulk leaves the counters behind until
+# rebuild_occupancy runs.
+
+_state = threading.local()
+
+
+@contextmanager
+def muted():
+    """
+    Silences the signal handlers while a bulk operation runs. The caller is
+    then responsible for reporting its changes through record_sample_changes.
+    """
+    previous = getattr(_state, 'muted', False)
+    _state.muted = True
+    try:
+        yield
+    finally:
+        _state.muted = previous
+
+
+def is_muted():
+    return getattr(_state, 'muted', False)
+
+
+def is_detached(box_id):
+    return box_id in detached_boxes()
+
+
+def detached_boxes():
+    """
+    The boxes detached by a container deletion that is still running. They
+    are forgotten once the atomic block the deletion runs in exits, whether
+    it committed, rolled back or raised into an outer transaction.
+    """
+    block, box_ids = getattr(_state, 'detached', (None, frozenset()))
+    if box_ids and all(open_block is not block
+                       for open_block in transaction.get_connection().atomic_blocks):
+        _state.detached = (None, frozenset())
+        return frozenset()
+    return box_ids
+
+
+def box_ancestors(box_ids):
+    """
+    Returns:
+        A dict of box id to a {level: container id or None} mapping, read from
+        BoxLocation and falling back to the foreign key chain for boxes not
+        yet recorded there.
+    """
+    box_ids = list(box_ids)
+    ancestors = locations.stored_ancestors(box_ids)
+    missing = [box_id for box_id in box_ids if box_id not in ancestors]
+    if missing:
+        ancestors.update(locations.resolve_chain(missing))
+    return ancestors
+
+
+def apply(changes):
+    """
+    Applies counter deltas to every container a box sits in.
+
+    Args:
+        changes: An iterable of (ancestors, stored_samples, capacity, box_count)
+            tuples, where ancestors is a mapping as returned by box_ancestors.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for ancestors, stored_samples, capacity, box_count in changes:
+        for level, container_id in ancestors.items():
+            if container_id is not None:
+                delta = deltas[(level, container_id)]
+                delta[0] += stored_samples
+                delta[1] += capacity
+                delta[2] += box_count
+
+    # Fragments list the counters of a container's children, so a container
+    # whose own totals cancel out (a move between two of its racks) changed too.
+    versions.bump(deltas.keys())
+
+    # Containers sharing the same delta are updated with a single statement.
+    grouped = defaultdict(list)
+    for (level, container_id), delta in deltas.items():
+        if any(delta):
+            grouped[(level, tuple(delta))].append(container_id)
+    if not grouped:
+        return
+
+    with transaction.atomic():
+        ContainerOccupancy.objects.bulk_create(
+            [ContainerOccupancy(container_type=level, container_id=container_id)
+             for (level, _), container_ids in grouped.items()
+             for container_id in container_ids],
+            ignore_conflicts=True)
+        for (level, delta), container_ids in grouped.items():
+            ContainerOccupancy.objects.filter(
+                container_type=level, container_id__in=container_ids).update(
+                stored_samples=F('stored_samples') + delta[0],
+                capacity=F('capacity') + delta[1],
+                box_count=F('box_count') + delta[2])
+
+
+def record_sample_changes(box_deltas):
+    """
+    Args:
+        box_deltas: A mapping of box id to the change in samples stored in it.
+    """
+    box_deltas = {box_id: delta for box_id, delta in box_deltas.items() if delta}
+    if not box_deltas:
+        return
+    ancestors = box_ancestors(box_deltas.keys())
+    apply((ancestors[box_id], delta, 0, 0) for box_id, delta in box_deltas.items()
+          if box_id in ancestors)
+
+
+def record_relocations(changes):
+    """
+    Moves the counters of boxes whose location changed from their old
+    containers to their new ones.
+
+    Args:
+        changes: (box_id, old ancestors or None, new ancestors) tuples, as
+            returned by locations.sync.
+    """
+    box_ids = [box_id for box_id, _, _ in changes]
+    counters = occupancy_map(ContainerOccupancy.BOX, box_ids)
+    capacities = dict(DimBox.objects.filter(id__in=box_ids).values_list(
+        'id', 'box_capacity'))
+    deltas = []
+    for box_id, old_ancestors, new_ancestors in changes:
+        current = counters.get(box_id)
+        if old_ancestors is None and current:
+            # Already counted without a location record; rebuild() reconciles.
+            continue
+        stored_samples = 0
+        if current:
+            stored_samples = current.stored_samples
+            deltas.append((old_ancestors, -stored_samples, -current.capacity,
+                           -current.box_count))
+        deltas.append((new_ancestors, stored_samples, capacities.get(box_id) or 0, 1))
+    apply(deltas)
+
+
+def record_capacity_change(box):
+    current = occupancy_map(ContainerOccupancy.BOX, [box.pk]).get(box.pk)
+    delta = (box.box_capacity or 0) - (current.capacity if current else 0)
+    if delta:
+        apply([(box_ancestors([box.pk])[box.pk], 0, delta, 0)])
+
+
+def update_boxes(box_ids, **fields):
+    """
+    QuerySet.update() for boxes that keeps the rollup, location records and
+    caches in step, as saving each box would, in a single transaction.
+
+    Args:
+        box_ids: The boxes to update.
+        fields: The field values, as passed to update().
+
+    Returns:
+        The number of boxes updated.
+    """
+    box_ids = list(box_ids)
+    with transaction.atomic():
+        versions.bump_ancestors(box_ancestors(box_ids).values())
+        updated = DimBox.objects.filter(id__in=box_ids).update(**fields)
+        changes = locations.sync(box_ids)
+        versions.bump_ancestors(locations.stored_ancestors(box_ids).values())
+        if changes:
+            record_relocations(changes)
+        relocated = {box_id for box_id, _, _ in changes}
+        record_capacity_changes([box_id for box_id in box_ids
+                                 if box_id not in relocated])
+    slots.invalidate(box_ids)
+    for name in reference.names_for_model(DimBox):
+        reference.invalidate(name)
+    return updated
+
+
+def record_capacity_changes(box_ids):
+    """Brings the capacity counters of boxes that stayed put in line with DimBox."""
+    counters = occupancy_map(ContainerOccupancy.BOX, box_ids)
+    capacities = dict(DimBox.objects.filter(id__in=box_ids).values_list(
+        'id', 'box_capacity'))
+    deltas = {box_id: (capacity or 0) - (counters[box_id].capacity
+                                         if box_id in counters else 0)
+              for box_id, capacity in capacities.items()}
+    deltas = {box_id: delta for box_id, delta in deltas.items() if delta}
+    if deltas:
+        ancestors = box_ancestors(deltas.keys())
+        apply((ancestors[box_id], 0, delta, 0) for box_id, delta in deltas.items())
+
+
+def detach_container(level, container_id):
+    """
+    Removes the counters of every box a container deletion will cascade to,
+    before the deletion runs. Those boxes are then ignored by the signal
+    handlers until the atomic block Django runs the deletion in exits,
+    because the cascade may remove the rows needed to resolve their location
+    before their own delete signals are sent.
+    """
+    box_ids = locations.boxes_for_containers(level, [container_id])
+    counters = occupancy_map(ContainerOccupancy.BOX, box_ids)
+    ancestors = box_ancestors(counters.keys())
+    apply((ancestors[box_id], -current.stored_samples, -current.capacity,
+           -current.box_count)
+          for box_id, current in counters.items() if box_id in ancestors)
+
+    detached = detached_boxes()
+    if detached:
+        # Another container of the same cascade; its block is still open.
+        block = _state.detached[0]
+    else:
+        atomic_blocks = transaction.get_connection().atomic_blocks
+        if not atomic_blocks:
+            return
+        block = atomic_blocks[-1]
+    _state.detached = (block, detached | frozenset(box_ids))
+
+
+def occupancy_map(level, container_ids):
+    return {
+        occupancy.container_id: occupancy
+        for occupancy in ContainerOccupancy.objects.filter(
+            container_type=level, container_id__in=list(container_ids))}
+
+
+def rebuild():
+    """Recomputes every counter from BoxPosition and DimBox."""
+    stored = dict(BoxPosition.objects.values_list('box_id').annotate(n=Count('id'))
+                  .order_by())
+    capacities = dict(DimBox.objects.values_list('id', 'box_capacity'))
+    totals = defaultdict(lambda: [0, 0, 0])
+    for box_id, ancestors in locations.resolve_chain().items():
+        for level, container_id in ancestors.items():
+            if container_id is not None:
+                total = totals[(level, container_id)]
+                total[0] += stored.get(box_id, 0)
+                total[1] += capacities[box_id] or 0
+                total[2] += 1
+
+    with transaction.atomic():
+        ContainerOccupancy.objects.all().delete()
+        ContainerOccupancy.objects.bulk_create(
+            [ContainerOccupancy(container_type=level, container_id=container_id,
+                                stored_samples=total[0], capacity=total[1],
+                                box_count=total[2])
+             for (level, container_id), total in totals.items()],
+            batch_size=1000)
+    versions.invalidate_all()
+    return len(totals)
@@ -0,0 +1,35 @@
+from storage_module.models import ContainerOccupancy, DimFacility
+from storage_module.occupancy import occupancy_map
+
+
+class StorageOverview:
+    """
+    Capacity, utilized storage and available capacity for every facility,
+    read from the facility counters of the occupancy rollup, so the cost
+    grows with the number of facilities rather than with the boxes or
+    samples stored in them.
+    """
+
+    def __init__(self, facilities=None):
+        self.facilities = (facilities if facilities is not None
+                           else DimFacility.objects.all())
+
+    def facility_data(self):
+        facilities = list(self.facilities)
+        counters = occupancy_map(ContainerOccupancy.FACILITY,
+                                 [facility.id for facility in facilities])
+
+        data = []
+        for facility in facilities:
+            current = counters.get(facility.id)
+            facility_capacity = current.capacity if current else 0
+            utilized_storage = current.stored_samples if current else 0
+            data.append({
+                'id': facility.id,
+                'facility_name': facility.facility_name,
+                'facility_capacity': facility_capacity,
+                'utilized_storage': utilized_storage,
+                'available_capacity': facility_capacity - utilized_storage,
+                'box_count': current.box_count if current else 0,
+            })
+        return data
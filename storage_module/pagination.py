@@ -0,0 +1,68 @@
+class KeysetPage:
+    """
+    One page of a keyset paginated queryset. Cursors are the sort key values
+    of the first and last rows, so following them is an indexed range scan
+    however deep the page is.
+    """
+
+    def __init__(self, object_list, key, has_next, has_previous):
+        self.object_list = object_list
+        self.key = key
+        self.has_next = has_next
+        self.has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _key_of(self, row):
+        return row[self.key] if isinstance(row, dict) else getattr(row, self.key)
+
+    @property
+    def next_cursor(self):
+        return self._key_of(self.object_list[-1]) if self.object_list else None
+
+    @property
+    def previous_cursor(self):
+        return self._key_of(self.object_list[0]) if self.object_list else None
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset by a unique, indexed key instead of OFFSET, so every
+    page costs the same single query.
+
+    Args:
+        queryset: The queryset (or values() queryset) to paginate.
+        per_page: Rows per page.
+        key: A unique field to order and seek by.
+    """
+
+    def __init__(self, queryset, per_page, key='sample_id'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.key = key
+
+    def page(self, after=None, before=None, last=False):
+        """
+        Returns the page following the after cursor, the page preceding the
+        before cursor, the last page, or the first page when none is given.
+        """
+        backwards = before is not None or last
+        queryset = self.queryset.order_by(f'-{self.key}' if backwards else self.key)
+        if after is not None:
+            queryset = queryset.filter(**{f'{self.key}__gt': after})
+        elif before is not None:
+            queryset = queryset.filter(**{f'{self.key}__lt': before})
+
+        # One extra row tells whether there is anything beyond this page.
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            return KeysetPage(rows, self.key, has_next=not last, has_previous=has_more)
+        return KeysetPage(rows, self.key, has_next=has_more,
+                          has_previous=after is not None)
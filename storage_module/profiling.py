@@ -0,0 +1,201 @@
+import cProfile
+import os
+import pstats
+import re
+from datetime import datetime
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from storage_module import async_db
+
+PROFILE_HEADER = 'HTTP_X_STORAGE_PROFILE'
+PROFILE_PARAMETER = 'profile'
+
+PROFILE_NAME = re.compile(r'^[\w.-]+\.prof$')
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def profile_dir():
+    return setting('STORAGE_PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def profile_path(name):
+    """The path of a stored profile, refusing names that could leave the directory."""
+    if not PROFILE_NAME.match(name):
+        raise FileNotFoundError(f'No profile named {name}')
+    path = os.path.join(profile_dir(), name)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f'No profile named {name}')
+    return path
+
+
+def save_profile(profiler, url_name):
+    """
+    Writes the stats of a profiler under the URL name and a timestamp and
+    prunes the oldest profiles beyond STORAGE_PROFILE_KEEP.
+
+    Returns:
+        The file name of the profile.
+    """
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    url_name = re.sub(r'[^\w-]', '_', url_name or 'unresolved')
+    name = f'{url_name}-{stamp}.prof'
+    profiler.dump_stats(os.path.join(directory, name))
+    for stale in list_profiles()[setting('STORAGE_PROFILE_KEEP', 200):]:
+        os.remove(os.path.join(directory, stale['name']))
+    return name
+
+
+def list_profiles():
+    """Stored profiles, newest first."""
+    directory = profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if not PROFILE_NAME.match(name):
+            continue
+        url_name, _, stamp = name[:-len('.prof')].rpartition('-')
+        profiles.append({
+            'name': name,
+            'url_name': url_name,
+            'created': datetime.strptime(stamp, '%Y%m%dT%H%M%S%f'),
+            'size': os.path.getsize(os.path.join(directory, name)),
+        })
+    profiles.sort(key=lambda profile: profile['created'], reverse=True)
+    return profiles
+
+
+def function_label(function):
+    filename, line, name = function
+    if filename == '~':
+        # Built-ins such as {method 'execute' of 'sqlite3.Cursor' objects}.
+        return name
+    base = str(settings.BASE_DIR)
+    if filename.startswith(base):
+        filename = os.path.relpath(filename, base)
+    elif 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[-1]
+    return f'{filename}:{line}({name})'
+
+
+def profile_rows(name):
+    """
+    Returns:
+        A dict of function label to (calls, own seconds, cumulative seconds).
+    """
+    stats = pstats.Stats(profile_path(name))
+    return {function_label(function): (calls, own, cumulative)
+            for function, (_, calls, own, cumulative, _) in stats.stats.items()}
+
+
+def top_functions(name, sort='cumulative', limit=50):
+    """The functions of a profile with the most cumulative or own time."""
+    column = 1 if sort == 'own' else 2
+    rows = sorted(profile_rows(name).items(), key=lambda row: row[1][column],
+                  reverse=True)
+    return [{'function': function, 'calls': calls, 'own': own, 'cumulative': cumulative}
+            for function, (calls, own, cumulative) in rows[:limit]]
+
+
+def diff_profiles(name, baseline, sort='cumulative', limit=50):
+    """
+    Compares a profile with a baseline profile function by function.
+
+    Returns:
+        The functions whose own or cumulative time changed the most, with the
+        values of both profiles and their difference.
+    """
+    column = 1 if sort == 'own' else 2
+    current, previous = profile_rows(name), profile_rows(baseline)
+    rows = []
+    for function in current.keys() | previous.keys():
+        calls, own, cumulative = current.get(function, (0, 0.0, 0.0))
+        old_calls, old_own, old_cumulative = previous.get(function, (0, 0.0, 0.0))
+        rows.append({
+            'function': function,
+            'calls': calls, 'old_calls': old_calls,
+            'own': own, 'old_own': old_own, 'own_delta': own - old_own,
+            'cumulative': cumulative, 'old_cumulative': old_cumulative,
+            'cumulative_delta': cumulative - old_cumulative,
+        })
+    key = 'own_delta' if column == 1 else 'cumulative_delta'
+    rows.sort(key=lambda row: abs(row[key]), reverse=True)
+    return rows[:limit]
+
+
+class ProfilingMiddleware:
+    """
+    Runs a request under cProfile when a staff user asks for it with an
+    X-Storage-Profile header or a ?profile= query parameter, and stores the
+    stats for the staff profile pages. The response names the stored profile
+    in its X-Storage-Profile header.
+
+    Sits after AuthenticationMiddleware, and profiles the view together with
+    template rendering and the middleware below it. Disabled by setting
+    STORAGE_PROFILING to False.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not setting('STORAGE_PROFILING', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.requested(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        match = getattr(request, 'resolver_match', None)
+        response['X-Storage-Profile'] = save_profile(
+            profiler, match.view_name if match else None)
+        return response
+
+    async def __acall__(self, request):
+        # The staff check may load the user, so the header is looked at first.
+        if not self.asked(request) or not await async_db.run(self.allowed, request):
+            return await self.get_response(request)
+
+        # On the event loop the profile also takes in other requests' coroutines
+        # that run meanwhile, and misses the queries run on the database pool.
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.disable()
+        match = getattr(request, 'resolver_match', None)
+        response['X-Storage-Profile'] = await async_db.run(
+            save_profile, profiler, match.view_name if match else None)
+        return response
+
+    @classmethod
+    def requested(cls, request):
+        return cls.asked(request) and cls.allowed(request)
+
+    @staticmethod
+    def asked(request):
+        return bool(request.META.get(PROFILE_HEADER) or PROFILE_PARAMETER in request.GET)
+
+    @staticmethod
+    def allowed(request):
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_staff)
@@ -0,0 +1,94 @@
+import threading
+import time
+
+from django.core.cache import cache
+
+from storage_module.models import DimBox, DimFacility, DimSampleStatus, DimSampleType, \
+    DimSourceFile
+from storage_module.routers import reading_from_primary
+
+CACHE_PREFIX = 'storage_module:reference'
+CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def distinct_names(model, field):
+    def load():
+        return list(model.objects.order_by(field).values_list(field, flat=True)
+                    .distinct())
+    return load
+
+
+# Small, rarely changing dimension data, keyed by name: (model, loader).
+REFERENCE_DATA = {
+    'sample_statuses': (DimSampleStatus,
+                        lambda: list(DimSampleStatus.objects.order_by('id'))),
+    'sample_types': (DimSampleType, distinct_names(DimSampleType, 'sample_type')),
+    'boxes': (DimBox, distinct_names(DimBox, 'box_name')),
+    'facilities': (DimFacility, distinct_names(DimFacility, 'facility_name')),
+    'source_files': (DimSourceFile, distinct_names(DimSourceFile, 'source_file_name')),
+}
+
+_local = {}
+_lock = threading.Lock()
+
+
+def version_key(name):
+    return f'{CACHE_PREFIX}:{name}:version'
+
+
+def current_version(name):
+    version = cache.get(version_key(name))
+    if version is None:
+        # Seeded from the clock so a counter lost from the cache never
+        # restarts at a version a process may still hold a stale copy for.
+        cache.add(version_key(name), time.time_ns(), None)
+        version = cache.get(version_key(name))
+    return version
+
+
+def get(name):
+    """
+    Returns the cached reference list, checking the shared version counter
+    so a change saved by any process is seen on the next read. The list is
+    held in-process and in the Django cache, and only loaded from the
+    database after its version moved on.
+    """
+    version = current_version(name)
+    local = _local.get(name)
+    if local and local[0] == version:
+        return local[1]
+
+    data_key = f'{CACHE_PREFIX}:{name}:{version}'
+    data = cache.get(data_key)
+    if data is None:
+        with reading_from_primary():
+            data = REFERENCE_DATA[name][1]()
+        cache.set(data_key, data, CACHE_TIMEOUT)
+    with _lock:
+        _local[name] = (version, data)
+    return data
+
+
+def invalidate(name):
+    """Moves the version of a reference list on, retiring every cached copy."""
+    try:
+        cache.incr(version_key(name))
+    except ValueError:
+        cache.add(version_key(name), time.time_ns(), None)
+
+
+def reset_state():
+    """Forgets the in-process copies, e.g. so the next read is a cold one."""
+    with _lock:
+        _local.clear()
+
+
+def names_for_model(model):
+    return [name for name, (reference_model, _) in REFERENCE_DATA.items()
+            if reference_model is model]
+
+
+def sample_status(status_id):
+    """The DimSampleStatus with the given id, or None."""
+    return next((status for status in get('sample_statuses')
+                 if str(status.id) == str(status_id)), None)
@@ -0,0 +1,95 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from storage_module import slots
+from storage_module.models import DimBox, SlotReservation
+from storage_module.moves import take_write_lock
+
+
+def wizard_holder(request):
+    """The reservation holder of the move wizard running in a request's session."""
+    if request.session.session_key is None:
+        request.session.save()
+    return f'wizard:{request.session.session_key}'
+
+
+def expiry():
+    return timezone.now() + timedelta(seconds=settings.STORAGE_RESERVATION_SECONDS)
+
+
+def hold(holder, box, count):
+    """
+    Reserves count free slots of a box for a holder until the reservation
+    timeout, for a move that is still being prepared. Slots the holder
+    already holds in the box are kept and renewed, and its reservations
+    anywhere else are released, so a holder only ever holds slots in the box
+    it is moving to.
+
+    Returns:
+        The held (x_position, y_position) slots in reading order. Fewer than
+        count when the box has no more room.
+    """
+    with transaction.atomic():
+        take_write_lock([box.pk])
+        box = DimBox.objects.select_for_update().filter(pk=box.pk).first()
+        if box is None:
+            return []
+        now = timezone.now()
+        SlotReservation.objects.filter(box=box, expires_at__lte=now).delete()
+        SlotReservation.objects.filter(holder=holder).exclude(box=box).delete()
+
+        taken = slots.load(box)
+        held = []
+        for reservation in SlotReservation.objects.filter(box=box).order_by(
+                'y_position', 'x_position'):
+            position = (reservation.x_position, reservation.y_position)
+            if reservation.holder != holder:
+                taken.mark([position])
+            elif len(held) < count and taken.is_free(*position):
+                held.append(reservation)
+            else:
+                # Filled by a move that ignored the reservation, or no longer needed.
+                reservation.delete()
+
+        kept = [(reservation.x_position, reservation.y_position) for reservation in held]
+        taken.mark(kept)
+        added = taken.free_slots()[:count - len(kept)]
+        expires_at = expiry()
+        SlotReservation.objects.filter(pk__in=[reservation.pk for reservation in held]
+                                       ).update(expires_at=expires_at)
+        SlotReservation.objects.bulk_create([
+            SlotReservation(box=box, x_position=x_position, y_position=y_position,
+                            holder=holder, expires_at=expires_at)
+            for x_position, y_position in added])
+        return sorted(kept + added, key=lambda position: taken.index(*position))
+
+
+def renew(holder):
+    """Pushes the expiry of a holder's live reservations back to the full timeout."""
+    return slots.live_reservations().filter(holder=holder).update(expires_at=expiry())
+
+
+def held_until(holder):
+    """When a holder's live reservations expire, or None if it holds none."""
+    return slots.live_reservations().filter(holder=holder).aggregate(
+        until=Max('expires_at'))['until']
+
+
+def release(holder):
+    """Releases every reservation of a holder."""
+    return SlotReservation.objects.filter(holder=holder).delete()[0]
+
+
+def sweep():
+    """
+    Deletes every expired reservation in one statement, found through the
+    index on expires_at.
+
+    Returns:
+        The number of reservations deleted.
+    """
+    return SlotReservation.objects.filter(expires_at__lte=timezone.now()).delete()[0]
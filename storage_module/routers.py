@@ -0,0 +1,151 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from storage_module import async_db
+
+REPLICA_DB_ALIAS = 'replica'
+
+STICKY_SESSION_KEY = 'storage_primary_until'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Per request (or reading_from block): where storage_module reads may go and
+# whether anything has been written since.
+_routing = ContextVar('storage_routing', default=None)
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def reading_from(alias):
+    """
+    Sends the storage_module reads inside the block to a database alias,
+    until the block writes something.
+
+    Yields:
+        The routing state; its 'wrote' key tells whether the block wrote.
+    """
+    state = {'read_alias': alias, 'wrote': False}
+    token = _routing.set(state)
+    try:
+        yield state
+    finally:
+        _routing.reset(token)
+
+
+def reading_from_primary():
+    """
+    Sends the reads inside the block to the primary. Anything cached across
+    requests is loaded this way, so a lagging replica cannot refill a cache
+    entry with rows older than the write that invalidated it.
+    """
+    return reading_from(None)
+
+
+def use_replica():
+    """Sends the storage_module reads inside the block to the replica, if there is one."""
+    return reading_from(REPLICA_DB_ALIAS if replica_configured() else None)
+
+
+class ReplicaRouter:
+    """
+    Routes reads of storage_module models to the replica while a request
+    (or a reading_from block) has opted in, and everything else, including
+    all writes and row locks, to the primary. Reads inside a transaction on
+    the primary stay on the primary, and once a request writes, its
+    remaining reads go there as well. Other apps, such as sessions
+    and auth, always use the primary so logins are never read back stale.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if not state or state['wrote'] or model._meta.app_label != 'storage_module':
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads that a transaction on the primary bases its writes on.
+            return None
+        return state['read_alias']
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state and model._meta.app_label == 'storage_module':
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Serves safe requests to the views named in STORAGE_REPLICA_VIEWS from
+    the replica.
+
+    A request that writes to storage_module, or may write because its
+    method is not GET, HEAD or OPTIONS, pins the session to the primary for
+    STORAGE_REPLICA_STICKY_SECONDS, so the user who moved a sample reads
+    their own write instead of a replica that has not caught up yet.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.views = set(getattr(settings, 'STORAGE_REPLICA_VIEWS', ()))
+        self.sticky_seconds = getattr(settings, 'STORAGE_REPLICA_STICKY_SECONDS', 10)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Scoped to the request, as server threads are reused between requests.
+        with reading_from(None) as state:
+            request.storage_routing = state
+            response = self.get_response(request)
+        if self.pins(request, state):
+            self.pin(request)
+        return response
+
+    async def __acall__(self, request):
+        # The routing state lives in the request's task context, which the
+        # async views copy to the threads running their queries.
+        with reading_from(None) as state:
+            request.storage_routing = state
+            response = await self.get_response(request)
+        if self.pins(request, state):
+            # Saving the session may load it from the database first.
+            await async_db.run(self.pin, request)
+        return response
+
+    @staticmethod
+    def pins(request, state):
+        return (state['wrote'] or request.method not in SAFE_METHODS) and \
+            hasattr(request, 'session')
+
+    def pin(self, request):
+        request.session[STICKY_SESSION_KEY] = time.time() + self.sticky_seconds
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not replica_configured() or request.method not in SAFE_METHODS:
+            return None
+        if request.resolver_match.view_name not in self.views:
+            return None
+        session = getattr(request, 'session', None)
+        if session and session.get(STICKY_SESSION_KEY, 0) > time.time():
+            return None
+        # Template responses are rendered before __call__ returns, so
+        # querysets evaluated in templates read from the replica too.
+        request.storage_routing['read_alias'] = REPLICA_DB_ALIAS
+        return None
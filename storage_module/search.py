@@ -0,0 +1,220 @@
+import re
+import time
+
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from storage_module.models import DimSample
+
+SEARCH_TABLE = 'samplesearch'
+
+SEARCH_FIELDS = ['sample_id', 'participant_id', 'requisition_id', 'protocol_number',
+                 'tid', 'visit_code']
+
+# Trigram and ngram indexes can only match terms at least this long.
+MIN_TERM_LENGTH = 3
+
+# How long a missing search table is taken to stay missing, so an index built
+# by rebuild_search_index in another process is picked up soon after.
+RECHECK_SECONDS = 60
+
+_state = {}
+
+
+class SqliteBackend:
+    """
+    An FTS5 virtual table with the trigram tokenizer, so substrings match.
+    Rows are keyed by rowid, which is set to the DimSample primary key.
+    """
+    key_column = 'rowid'
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+            f'{", ".join(SEARCH_FIELDS)}, tokenize="trigram")')
+
+    def match(self, terms):
+        expression = ' AND '.join('"{}"'.format(term.replace('"', '""'))
+                                  for term in terms)
+        return (f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+                [expression])
+
+    def ranked(self, terms, limit):
+        sql, params = self.match(terms)
+        return f'{sql} ORDER BY rank LIMIT %s', params + [limit]
+
+
+class MysqlBackend:
+    """An InnoDB table with an ngram FULLTEXT index over the searched fields."""
+    key_column = 'sample_pk'
+
+    def create(self, cursor):
+        columns = ', '.join(f'{field} VARCHAR(255) NULL' for field in SEARCH_FIELDS)
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+            f'sample_pk BIGINT PRIMARY KEY, {columns}, '
+            f'FULLTEXT KEY samplesearch_ft ({", ".join(SEARCH_FIELDS)}) WITH PARSER ngram'
+            f') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4')
+
+    def against(self, terms):
+        expression = ' '.join('+"{}"'.format(term.replace('"', '')) for term in terms)
+        return (f'MATCH ({", ".join(SEARCH_FIELDS)}) AGAINST (%s IN BOOLEAN MODE)',
+                [expression])
+
+    def match(self, terms):
+        clause, params = self.against(terms)
+        return f'SELECT sample_pk FROM {SEARCH_TABLE} WHERE {clause}', params
+
+    def ranked(self, terms, limit):
+        clause, params = self.against(terms)
+        return (f'SELECT sample_pk FROM {SEARCH_TABLE} WHERE {clause} '
+                f'ORDER BY {clause} DESC LIMIT %s', params + params + [limit])
+
+
+BACKENDS = {
+    'sqlite': SqliteBackend,
+    'mysql': MysqlBackend,
+}
+
+
+def get_backend():
+    backend = BACKENDS.get(connection.vendor)
+    return backend() if backend else None
+
+
+def index_available():
+    """
+    Whether the search table exists. Once found it is remembered for the
+    life of the process; while missing it is looked for again every
+    RECHECK_SECONDS.
+    """
+    if _state.get('available') or time.monotonic() < _state.get('recheck_at', 0):
+        return _state.get('available', False)
+    available = (get_backend() is not None and
+                 SEARCH_TABLE in connection.introspection.table_names())
+    _state.update(available=available, recheck_at=time.monotonic() + RECHECK_SECONDS)
+    return available
+
+
+def reset_state():
+    """
+    Forgets whether the search table exists, e.g. after the database was
+    swapped or the index rebuilt.
+    """
+    _state.clear()
+
+
+def split_terms(query):
+    return [term for term in re.split(r'\s+', (query or '').strip()) if term]
+
+
+def filter_samples(queryset, query):
+    """
+    Narrows a DimSample queryset to the samples matching every term of the
+    query in any of the searched fields. Uses the search index when every
+    term is long enough for it, and falls back to icontains lookups otherwise.
+    """
+    terms = split_terms(query)
+    if not terms:
+        return queryset
+    if index_available() and all(len(term) >= MIN_TERM_LENGTH for term in terms):
+        sql, params = get_backend().match(terms)
+        return queryset.filter(id__in=RawSQL(sql, params))
+    for term in terms:
+        condition = Q()
+        for field in SEARCH_FIELDS:
+            condition |= Q(**{f'{field}__icontains': term})
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def ranked_samples(query, limit=50):
+    """
+    Returns:
+        Up to limit DimSample objects matching the query, best match first.
+    """
+    terms = split_terms(query)
+    if not terms:
+        return []
+    if not (index_available() and all(len(term) >= MIN_TERM_LENGTH for term in terms)):
+        return list(filter_samples(DimSample.objects.all(), query).order_by(
+            'sample_id')[:limit])
+    sql, params = get_backend().ranked(terms, limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        pks = [row[0] for row in cursor.fetchall()]
+    samples = DimSample.objects.in_bulk(pks)
+    return [samples[pk] for pk in pks if pk in samples]
+
+
+def index_samples(sample_ids):
+    """
+    Re-indexes the given samples (by sample_id) with one delete and one
+    INSERT ... SELECT per 500 samples, so bulk writers can keep the index in
+    step with a couple of statements per chunk.
+    """
+    if not index_available():
+        return
+    sample_ids = list(sample_ids)
+    key = get_backend().key_column
+    columns = ', '.join(SEARCH_FIELDS)
+    for start in range(0, len(sample_ids), 500):
+        chunk = sample_ids[start:start + 500]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE {key} IN '
+                f'(SELECT id FROM dimsample WHERE sample_id IN ({placeholders}))', chunk)
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} ({key}, {columns}) '
+                f'SELECT id, {columns} FROM dimsample '
+                f'WHERE sample_id IN ({placeholders})', chunk)
+
+
+def index_pk_range(first_pk, last_pk):
+    """Indexes newly written samples whose primary keys fall in a range."""
+    if not index_available():
+        return
+    key = get_backend().key_column
+    columns = ', '.join(SEARCH_FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} ({key}, {columns}) '
+            f'SELECT id, {columns} FROM dimsample WHERE id BETWEEN %s AND %s',
+            [first_pk, last_pk])
+
+
+def remove_samples(pks):
+    if not index_available() or not pks:
+        return
+    pks = list(pks)
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {SEARCH_TABLE} WHERE {get_backend().key_column} IN '
+            f'({placeholders})', pks)
+
+
+def rebuild():
+    """
+    Creates the search table if needed and re-indexes every sample. Raises
+    CommandError on databases without a search backend, which the commands
+    that rebuild the index report as they are.
+    """
+    backend = get_backend()
+    if backend is None:
+        raise CommandError(
+            f'Sample search indexing is not supported on {connection.vendor}.')
+    columns = ', '.join(SEARCH_FIELDS)
+    with connection.cursor() as cursor:
+        backend.create(cursor)
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} ({backend.key_column}, {columns}) '
+            f'SELECT id, {columns} FROM dimsample')
+        cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE}')
+        count = cursor.fetchone()[0]
+    reset_state()
+    return count
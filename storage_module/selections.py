@@ -0,0 +1,164 @@
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from storage_module.models import DimSample, Note, SampleSelection, StorageJob
+from storage_module.transitions import transition_samples
+
+# Samples read or written per query when working through a selection.
+CHUNK_SIZE = 2000
+
+
+def pack(pks):
+    """
+    Packs primary keys as the gaps between them in sorted order, each a
+    varint, and compresses the result. Runs of consecutive keys, as left by
+    an import, cost a fraction of a byte per sample.
+    """
+    data = bytearray()
+    previous = 0
+    for pk in sorted(set(pks)):
+        gap = pk - previous
+        previous = pk
+        while gap >= 0x80:
+            data.append(gap & 0x7f | 0x80)
+            gap >>= 7
+        data.append(gap)
+    return zlib.compress(bytes(data))
+
+
+def unpack(data):
+    """The sorted primary keys packed by pack()."""
+    pks = []
+    previous = value = shift = 0
+    for byte in zlib.decompress(bytes(data)):
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += value
+        pks.append(previous)
+        value = shift = 0
+    return pks
+
+
+def create(samples, owner=None, description=''):
+    """
+    Saves a selection of samples.
+
+    Args:
+        samples: A DimSample queryset, such as the filtered samples table, or
+            an iterable of sample_id values. Unknown sample ids are left out.
+        owner: The user the selection was made by.
+        description: Shown to users in place of the sample count.
+
+    Returns:
+        The new SampleSelection.
+    """
+    if isinstance(samples, QuerySet):
+        pks = list(samples.order_by().values_list('pk', flat=True))
+    else:
+        sample_ids = list(dict.fromkeys(samples))
+        pks = []
+        for start in range(0, len(sample_ids), CHUNK_SIZE):
+            pks.extend(DimSample.objects.filter(
+                sample_id__in=sample_ids[start:start + CHUNK_SIZE]).values_list(
+                'pk', flat=True))
+    pks = set(pks)
+    return SampleSelection.objects.create(
+        owner=owner if getattr(owner, 'is_authenticated', False) else None,
+        description=description[:255], size=len(pks), sample_pks=pack(pks))
+
+
+def get(selection_id, user):
+    """
+    The selection with the given id, or None if the id names no selection
+    the user may use: only staff reach the selections of other users.
+    """
+    if not str(selection_id or '').isdigit():
+        return None
+    found = SampleSelection.objects.filter(pk=selection_id)
+    if not user.is_staff:
+        found = found.filter(owner=user.pk)
+    return found.first()
+
+
+def prune():
+    """
+    Deletes the selections saved more than STORAGE_SELECTION_SECONDS ago,
+    keeping those of jobs that are still queued or running.
+
+    Returns:
+        The number of selections deleted.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.STORAGE_SELECTION_SECONDS)
+    return SampleSelection.objects.filter(created_date__lt=stale).exclude(
+        pk__in=StorageJob.objects.exclude(status__in=StorageJob.FINISHED).filter(
+            selection__isnull=False).values('selection')).delete()[0]
+
+
+def chunks(selection, size=CHUNK_SIZE):
+    """Yields the primary keys of the selected samples, size at a time, in order."""
+    pks = unpack(selection.sample_pks)
+    for start in range(0, len(pks), size):
+        yield pks[start:start + size]
+
+
+def sample_id_chunks(selection, size=CHUNK_SIZE):
+    """
+    Yields the sample_id values of the selected samples, one list per chunk,
+    with the number of primary keys the chunk covered. Samples deleted since
+    the selection was saved drop out.
+    """
+    for pks in chunks(selection, size):
+        yield list(DimSample.objects.filter(pk__in=pks).order_by('pk').values_list(
+            'sample_id', flat=True)), len(pks)
+
+
+def sample_ids(selection):
+    """The sample_id values of every selected sample, in primary key order."""
+    return [sample_id for chunk, _ in sample_id_chunks(selection) for sample_id in chunk]
+
+
+def transition(selection, status, user=None, change_reason='', progress=None):
+    """
+    Moves the selected samples to a new status a chunk at a time, each chunk
+    in its own transaction, so a large selection never holds its locks or
+    its history rows all at once.
+
+    Args:
+        progress: Called with the number of samples in each chunk once it
+            is done.
+
+    Returns:
+        The number of samples whose status changed.
+    """
+    changed = 0
+    for sample_ids, count in sample_id_chunks(selection):
+        changed += transition_samples(sample_ids, status, user=user,
+                                      change_reason=change_reason)
+        if progress:
+            progress(count)
+    return changed
+
+
+def add_note(selection, text, author=None, progress=None):
+    """
+    Adds the same note to every selected sample, with one bulk insert per
+    chunk.
+
+    Returns:
+        The number of notes added.
+    """
+    added = 0
+    for pks in chunks(selection):
+        notes = Note.objects.bulk_create([
+            Note(sample_id=pk, author=author, text=text)
+            for pk in DimSample.objects.filter(pk__in=pks).values_list('pk', flat=True)])
+        added += len(notes)
+        if progress:
+            progress(len(pks))
+    return added
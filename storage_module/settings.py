@@ -53,11 +53,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'storage_module.instrumentation.SqlInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'simple_history.middleware.HistoryRequestMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'storage_module.profiling.ProfilingMiddleware',
+    'storage_module.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -84,14 +87,103 @@ WSGI_APPLICATION = 'storage_module.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
+# Tests get a file rather than SQLite's in-memory database, which threads
+# share without SQLite's locking, so the concurrent move tests see real locks.
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Read replica
+# Browse and report views read from a 'replica' database when one is
+# configured; writes, and reads by a session that has just written, stay on
+# the primary. Locally, point STORAGE_REPLICA_NAME at a second SQLite file
+# and keep it in step with `manage.py sync_replica --interval 5`.
+
+if os.environ.get('STORAGE_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['STORAGE_REPLICA_NAME'],
+        'HOST': os.environ.get('STORAGE_REPLICA_HOST',
+                               DATABASES['default'].get('HOST', '')),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['storage_module.routers.ReplicaRouter']
+
+STORAGE_REPLICA_VIEWS = [
+    'home_url', 'storage_view', 'facility_detail', 'freezer_detail', 'freezer_data',
+    'shelf_detail', 'rack_detail', 'samples_url', 'reports_url', 'dashboard_url',
+]
+STORAGE_REPLICA_STICKY_SECONDS = 10
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Reference data and slot maps are cached here. Point this at a shared
+# memcached (PyMemcacheCache) in deployments running several processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'STORAGE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('STORAGE_CACHE_LOCATION', 'storage_module'),
+    }
+}
+
+# SQL instrumentation
+# Records the SQL of a sampled share of requests, grouped by statement shape
+# and call site, to a rotating log readable by staff at /sql_reports/.
+
+STORAGE_SQL_INSTRUMENTATION = os.environ.get('STORAGE_SQL_INSTRUMENTATION') == '1'
+STORAGE_SQL_SAMPLE_RATE = float(os.environ.get('STORAGE_SQL_SAMPLE_RATE', '0.05'))
+STORAGE_SQL_REPEAT_THRESHOLD = 5
+STORAGE_SQL_LOG = os.path.join(BASE_DIR, 'logs', 'sql_reports.log')
+
+# Request profiling
+# Staff can profile a request with an X-Storage-Profile header or ?profile=1
+# and browse, diff and download the stored profiles at /profiles/.
+
+STORAGE_PROFILING = os.environ.get('STORAGE_PROFILING', '1') == '1'
+STORAGE_PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+STORAGE_PROFILE_KEEP = 200
+
+# Slot reservations
+# The move wizard holds the slots it offers for this long, renewed on every
+# step. Expired reservations are ignored, and removed in bulk by
+# `manage.py sweep_reservations --interval 60`.
+
+STORAGE_RESERVATION_SECONDS = 15 * 60
+
+# Sample selections
+# Every bulk action saves the samples it applies to as a selection. Selections
+# older than this that no unfinished job still needs are deleted alongside
+# expired reservations by `manage.py sweep_reservations`.
+
+STORAGE_SELECTION_SECONDS = 24 * 60 * 60
+
+# Background jobs
+# Bulk operations on more samples than this are queued instead of run inside
+# the request, and are picked up by `manage.py run_storage_jobs`. Export files
+# of the newest STORAGE_JOB_KEEP jobs are kept for download. Running jobs that
+# have not reported for STORAGE_JOB_STALE_SECONDS are taken to have died.
+
+STORAGE_JOB_THRESHOLD = int(os.environ.get('STORAGE_JOB_THRESHOLD', '1000'))
+STORAGE_JOB_DIR = os.path.join(BASE_DIR, 'jobs')
+STORAGE_JOB_KEEP = 50
+STORAGE_JOB_STALE_SECONDS = 10 * 60
+
+# Async endpoints
+# The async dashboard and storage tree endpoints under /async/ run their
+# queries on a pool of this many threads per process, each holding one
+# database connection. Serve them with an ASGI server, e.g.
+# `uvicorn storage_module.asgi:application`.
+
+STORAGE_ASYNC_DB_THREADS = int(os.environ.get('STORAGE_ASYNC_DB_THREADS', '8'))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,166 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from storage_module import locations, occupancy, reference, search, slots, versions
+from storage_module.models import BoxPosition, ContainerOccupancy, DimBox, DimFacility, \
+    DimFreezer, DimRack, DimSample, DimSampleStatus, DimSampleType, DimShelf, \
+    DimSourceFile
+
+CONTAINER_TYPES = {
+    DimRack: ContainerOccupancy.RACK,
+    DimShelf: ContainerOccupancy.SHELF,
+    DimFreezer: ContainerOccupancy.FREEZER,
+    DimFacility: ContainerOccupancy.FACILITY,
+}
+
+
+@receiver(pre_save, sender=BoxPosition)
+def box_position_pre_save(sender, instance, raw=False, **kwargs):
+    if raw or occupancy.is_muted():
+        return
+    instance._previous_box_id = BoxPosition.objects.filter(pk=instance.pk).values_list(
+        'box_id', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=BoxPosition)
+def box_position_post_save(sender, instance, created, raw=False, **kwargs):
+    previous_box_id = getattr(instance, '_previous_box_id', None)
+    slots.invalidate([instance.box_id, previous_box_id])
+    if raw or occupancy.is_muted():
+        return
+    if created or previous_box_id is None:
+        occupancy.record_sample_changes({instance.box_id: 1})
+    elif previous_box_id != instance.box_id:
+        occupancy.record_sample_changes({previous_box_id: -1, instance.box_id: 1})
+
+
+@receiver(post_delete, sender=BoxPosition)
+def box_position_post_delete(sender, instance, **kwargs):
+    slots.invalidate([instance.box_id])
+    if occupancy.is_muted() or occupancy.is_detached(instance.box_id):
+        return
+    occupancy.record_sample_changes({instance.box_id: -1})
+
+
+@receiver(post_save, sender=DimBox)
+def box_post_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    changes = locations.sync([instance.pk])
+    versions.bump_ancestors(locations.stored_ancestors([instance.pk]).values())
+    if occupancy.is_muted():
+        return
+    if changes:
+        occupancy.record_relocations(changes)
+    else:
+        occupancy.record_capacity_change(instance)
+
+
+@receiver(post_save, sender=DimRack)
+@receiver(post_save, sender=DimShelf)
+@receiver(post_save, sender=DimFreezer)
+def container_post_save(sender, instance, created, raw=False, **kwargs):
+    """Re-resolves the boxes beneath a rack, shelf or freezer that may have moved."""
+    if raw or created:
+        return
+    changes = locations.sync(locations.boxes_for_containers(
+        CONTAINER_TYPES[sender], [instance.pk]))
+    if changes and not occupancy.is_muted():
+        occupancy.record_relocations(changes)
+
+
+@receiver(pre_delete, sender=DimBox)
+def box_pre_delete(sender, instance, **kwargs):
+    instance._previous_ancestors = occupancy.box_ancestors([instance.pk]).get(
+        instance.pk)
+
+
+@receiver(post_delete, sender=DimBox)
+def box_post_delete(sender, instance, **kwargs):
+    ancestors = getattr(instance, '_previous_ancestors', None)
+    detached = occupancy.is_detached(instance.pk)
+    if ancestors and not occupancy.is_muted() and not detached:
+        occupancy.apply([(ancestors, 0, -(instance.box_capacity or 0), -1)])
+    if ancestors:
+        versions.bump_ancestors([ancestors])
+    slots.invalidate([instance.pk])
+    forget_container(ContainerOccupancy.BOX, instance.pk)
+
+
+@receiver(pre_delete, sender=DimRack)
+@receiver(pre_delete, sender=DimShelf)
+@receiver(pre_delete, sender=DimFreezer)
+@receiver(pre_delete, sender=DimFacility)
+def container_pre_delete(sender, instance, **kwargs):
+    if not occupancy.is_muted():
+        occupancy.detach_container(CONTAINER_TYPES[sender], instance.pk)
+
+
+@receiver(post_delete, sender=DimRack)
+@receiver(post_delete, sender=DimShelf)
+@receiver(post_delete, sender=DimFreezer)
+@receiver(post_delete, sender=DimFacility)
+def container_post_delete(sender, instance, **kwargs):
+    forget_container(CONTAINER_TYPES[sender], instance.pk)
+
+
+def forget_container(container_type, container_id):
+    # Deferred so counters decremented later in the same cascade do not
+    # recreate the row.
+    transaction.on_commit(lambda: ContainerOccupancy.objects.filter(
+        container_type=container_type, container_id=container_id).delete())
+
+
+@receiver(pre_save, sender=DimBox)
+def box_pre_save(sender, instance, raw=False, **kwargs):
+    """Retires the cached fragments of the containers a box sat in before a change."""
+    if not raw and instance.pk is not None:
+        versions.bump_ancestors(occupancy.box_ancestors([instance.pk]).values())
+
+
+@receiver(post_save, sender=DimRack)
+@receiver(post_save, sender=DimShelf)
+@receiver(post_save, sender=DimFreezer)
+@receiver(post_save, sender=DimFacility)
+@receiver(post_delete, sender=DimRack)
+@receiver(post_delete, sender=DimShelf)
+@receiver(post_delete, sender=DimFreezer)
+@receiver(post_delete, sender=DimFacility)
+def container_changed(sender, raw=False, **kwargs):
+    """
+    Renaming, moving or deleting a rack, shelf, freezer or facility changes
+    the pages of everything beneath it. Such edits are rare, so every
+    cached fragment is retired rather than working out which ones.
+    """
+    if not raw:
+        versions.invalidate_all()
+
+
+@receiver(post_save, sender=DimSampleStatus)
+@receiver(post_save, sender=DimSampleType)
+@receiver(post_save, sender=DimBox)
+@receiver(post_save, sender=DimFacility)
+@receiver(post_save, sender=DimSourceFile)
+@receiver(post_delete, sender=DimSampleStatus)
+@receiver(post_delete, sender=DimSampleType)
+@receiver(post_delete, sender=DimBox)
+@receiver(post_delete, sender=DimFacility)
+@receiver(post_delete, sender=DimSourceFile)
+def reference_data_changed(sender, **kwargs):
+    for name in reference.names_for_model(sender):
+        reference.invalidate(name)
+
+
+@receiver(post_save, sender=DimSample)
+def sample_post_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_samples([instance.sample_id])
+        versions.bump((ContainerOccupancy.BOX, box_id) for box_id in
+                      BoxPosition.objects.filter(sample_id=instance.sample_id)
+                      .values_list('box_id', flat=True))
+
+
+@receiver(post_delete, sender=DimSample)
+def sample_post_delete(sender, instance, **kwargs):
+    search.remove_samples([instance.pk])
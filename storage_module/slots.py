@@ -0,0 +1,199 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from storage_module import locations, versions
+from storage_module.models import BoxPosition, ContainerOccupancy, DimBox, \
+    SlotReservation
+from storage_module.routers import reading_from_primary
+
+CACHE_PREFIX = 'storage_module:slots'
+CACHE_TIMEOUT = 60 * 60
+
+
+class SlotMap:
+    """
+    Occupancy bitmap of one box over its real geometry. Slots are numbered in
+    reading order, so slot index = row * columns + x_position, and bit i of
+    occupied is set when that slot holds a sample.
+    """
+
+    def __init__(self, rows, columns, occupied=0):
+        self.rows = rows
+        self.columns = columns
+        self.occupied = occupied
+
+    @property
+    def size(self):
+        return self.rows * self.columns
+
+    @property
+    def free(self):
+        return ~self.occupied & ((1 << self.size) - 1)
+
+    @property
+    def free_count(self):
+        return bin(self.free).count('1')
+
+    def index(self, x_position, y_position):
+        """Slot index of a position, or None when it lies outside the grid."""
+        if not y_position or len(y_position) != 1:
+            return None
+        row = ord(y_position.upper()) - ord('A')
+        if not (0 <= row < self.rows and 0 <= x_position < self.columns):
+            return None
+        return row * self.columns + x_position
+
+    def position(self, index):
+        """(x_position, y_position) of a slot index."""
+        row, x_position = divmod(index, self.columns)
+        return x_position, chr(ord('A') + row)
+
+    def mark(self, positions):
+        """Marks (x_position, y_position) slots as taken, ignoring any off the grid."""
+        for x_position, y_position in positions:
+            index = self.index(x_position, y_position)
+            if index is not None:
+                self.occupied |= 1 << index
+
+    def is_free(self, x_position, y_position):
+        index = self.index(x_position, y_position)
+        return index is not None and not self.occupied >> index & 1
+
+    def free_slots(self):
+        return [self.position(index) for index in iter_bits(self.free)]
+
+    def first_free_run(self, count):
+        """
+        The first run of count consecutive free slots in reading order, which
+        may wrap from the end of one row onto the next.
+
+        Returns:
+            A list of (x_position, y_position) tuples, or None if no run fits.
+        """
+        if count < 1:
+            return []
+        # After the loop, bit i is set only if slots i .. i + count - 1 are free.
+        runs = self.free
+        for _ in range(count - 1):
+            runs &= runs >> 1
+            if not runs:
+                return None
+        if not runs:
+            return None
+        start = (runs & -runs).bit_length() - 1
+        return [self.position(index) for index in range(start, start + count)]
+
+
+def iter_bits(value):
+    while value:
+        lowest = value & -value
+        yield lowest.bit_length() - 1
+        value ^= lowest
+
+
+def cache_key(box_id):
+    return f'{CACHE_PREFIX}:{box_id}'
+
+
+def slot_map(box):
+    """
+    Returns the SlotMap of a box, built from its positions on first use and
+    cached until one of its positions or its capacity changes.
+    """
+    rows, columns = box.grid_dimensions
+    cached = cache.get(cache_key(box.pk))
+    if cached and cached[:2] == (rows, columns):
+        return SlotMap(*cached)
+
+    slots = load(box)
+    cache.set(cache_key(box.pk), (rows, columns, slots.occupied), CACHE_TIMEOUT)
+    return slots
+
+
+def load(box):
+    """
+    Builds the SlotMap of a box from its positions, bypassing the cache, for
+    callers that allocate slots while holding the box lock.
+    """
+    slots = SlotMap(*box.grid_dimensions)
+    with reading_from_primary():
+        slots.mark(BoxPosition.objects.filter(box_id=box.pk).values_list(
+            'x_position', 'y_position'))
+    return slots
+
+
+def live_reservations():
+    return SlotReservation.objects.filter(expires_at__gt=timezone.now())
+
+
+def reserved_slots(box_ids, holder=None):
+    """
+    Returns:
+        A set of (box_id, x_position, y_position) for every slot of the boxes
+        reserved by a live reservation of anyone but holder.
+    """
+    reservations = live_reservations().filter(box_id__in=list(box_ids))
+    if holder is not None:
+        reservations = reservations.exclude(holder=holder)
+    with reading_from_primary():
+        return set(reservations.values_list('box_id', 'x_position', 'y_position'))
+
+
+def available(box, holder=None):
+    """
+    The SlotMap of a box with the slots reserved by anyone but holder marked
+    as taken as well.
+    """
+    slots = slot_map(box)
+    slots.mark((x_position, y_position)
+               for _, x_position, y_position in reserved_slots([box.pk], holder))
+    return slots
+
+
+def invalidate(box_ids):
+    """
+    Drops the slot maps of boxes whose positions changed. Every writer of
+    positions calls this, so it also moves the versions of those boxes on.
+    """
+    box_ids = [box_id for box_id in box_ids if box_id is not None]
+    if box_ids:
+        keys = [cache_key(box_id) for box_id in box_ids]
+        cache.delete_many(keys)
+        # Again on commit, as a reader may have cached the old positions while
+        # the writing transaction was still open.
+        transaction.on_commit(lambda: cache.delete_many(keys))
+        versions.bump((ContainerOccupancy.BOX, box_id) for box_id in box_ids)
+
+
+def free_slots(box, holder=None):
+    """
+    All free (x_position, y_position) slots of a box, in reading order. Slots
+    reserved by anyone but holder are not free.
+    """
+    return available(box, holder).free_slots()
+
+
+def first_free_run(box, count, holder=None):
+    """The first count contiguous free slots of a box, or None, as for free_slots."""
+    return available(box, holder).first_free_run(count)
+
+
+def boxes_with_free_slots(container, count=1):
+    """
+    Boxes anywhere beneath a facility, freezer, shelf or rack with at least
+    count free slots, not counting slots reserved by live reservations.
+    Answered from the occupancy rollup in a single query, without reading any
+    BoxPosition rows.
+    """
+    reserved = live_reservations().filter(box_id=OuterRef('container_id')).order_by(
+        ).values('box_id').annotate(n=Count('id')).values('n')
+    enough_room = ContainerOccupancy.objects.filter(
+        container_type=ContainerOccupancy.BOX, container_id=OuterRef('pk'),
+        capacity__gte=F('stored_samples') + Coalesce(Subquery(reserved), Value(0))
+        + count)
+    boxes = locations.boxes_under(container) if container is not None \
+        else DimBox.objects.all()
+    return boxes.filter(Exists(enough_room))
@@ -0,0 +1,72 @@
+import os
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import connection, connections
+
+
+def snapshot_dir():
+    return getattr(settings, 'STORAGE_SNAPSHOT_DIR',
+                   os.path.join(settings.BASE_DIR, 'snapshots'))
+
+
+def snapshot_path(name, directory=None):
+    return os.path.join(directory or snapshot_dir(), f'{name}.sqlite3')
+
+
+def check_sqlite():
+    """Snapshots are SQLite files; elsewhere this raises CommandError."""
+    if connection.vendor != 'sqlite':
+        raise CommandError(
+            f'Snapshots are only supported on SQLite, not {connection.vendor}.')
+
+
+def save_snapshot(name, directory=None):
+    """
+    Copies the whole database into a named snapshot file with SQLite's online
+    backup API, so it is consistent even while the database is in use.
+
+    Returns:
+        The path of the snapshot file.
+    """
+    check_sqlite()
+    path = snapshot_path(name, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection.ensure_connection()
+    target = sqlite3.connect(path)
+    try:
+        connection.connection.backup(target)
+    finally:
+        target.close()
+    return path
+
+
+def restore_snapshot(name, directory=None):
+    """Replaces the contents of the database with a named snapshot."""
+    check_sqlite()
+    path = snapshot_path(name, directory)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f'No snapshot named {name} at {path}')
+    connection.ensure_connection()
+    source = sqlite3.connect(path)
+    try:
+        source.backup(connection.connection)
+    finally:
+        source.close()
+    return path
+
+
+def copy_database(source_alias, target_alias):
+    """
+    Copies one SQLite database over another with the online backup API, e.g.
+    to keep a local stand-in for a read replica in step with the primary.
+    """
+    source, target = connections[source_alias], connections[target_alias]
+    for database in (source, target):
+        if database.vendor != 'sqlite':
+            raise CommandError(
+                f'Database copies are only supported on SQLite, not {database.vendor}.')
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
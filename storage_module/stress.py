@@ -0,0 +1,161 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from django.db import connections
+
+from storage_module import moves
+from storage_module.models import BoxPosition, ContainerOccupancy, DimBox, DimFacility, \
+    DimFreezer, DimSample
+
+SAMPLE_PREFIX = 'STRESS'
+
+MODES = ('fill', 'random')
+
+
+def setup(samples, capacity):
+    """
+    Creates an empty box and loose samples for the workers to fight over.
+
+    Returns:
+        (box, sample_ids)
+    """
+    facility = DimFacility.objects.create(facility_name='Stress facility')
+    freezer = DimFreezer.objects.create(freezer_name='Stress freezer', facility=facility)
+    box = DimBox.objects.create(box_name='Stress box', box_capacity=capacity,
+                                freezer=freezer)
+    sample_ids = [f'{SAMPLE_PREFIX}{index:06d}' for index in range(samples)]
+    DimSample.objects.bulk_create([DimSample(sample_id=sample_id)
+                                   for sample_id in sample_ids])
+    return box, sample_ids
+
+
+class Worker(threading.Thread):
+    """
+    Places its share of the samples into the box, one batch at a time, and
+    records what the movers reported.
+
+    In 'fill' mode every batch goes to the first free slots, so all workers
+    race for the same slot. In 'random' mode each sample is sent to a random
+    slot of the grid, which may already be taken.
+    """
+
+    def __init__(self, box, sample_ids, batch, mode, start_gate):
+        super().__init__()
+        self.box = box
+        self.sample_ids = sample_ids
+        self.batch = batch
+        self.mode = mode
+        self.start_gate = start_gate
+        self.placed = []
+        self.rejected = Counter()
+        self.errors = []
+        self.attempts = Counter()
+
+    def run(self):
+        try:
+            self.start_gate.wait()
+            for start in range(0, len(self.sample_ids), self.batch):
+                self.move(self.sample_ids[start:start + self.batch])
+        finally:
+            connections.close_all()
+
+    def move(self, sample_ids):
+        if self.mode == 'fill':
+            mover = moves.BoxFiller(sample_ids, self.box)
+        else:
+            rows, columns = self.box.grid_dimensions
+            mover = moves.SampleMover(
+                (sample_id, self.box, random.randrange(columns),
+                 chr(ord('A') + random.randrange(rows)))
+                for sample_id in sample_ids)
+        try:
+            conflicts = mover.run()
+        except Exception as error:
+            self.errors.append(f'{type(error).__name__}: {error}')
+            return
+        self.attempts[mover.attempts] += 1
+        if conflicts:
+            self.rejected.update(reason(message) for message in conflicts.values())
+        else:
+            self.placed.extend(sample_ids)
+
+
+def reason(message):
+    """Groups conflict messages that differ only in the slot or sample named."""
+    if message == moves.BUSY_MESSAGE:
+        return 'busy'
+    if 'occupied' in message or 'more than one sample' in message:
+        return 'slot taken'
+    if 'free positions' in message:
+        return 'box full'
+    return message
+
+
+def run(workers=8, samples=120, capacity=100, batch=1, mode='fill'):
+    """
+    Hammers one box from many threads at once, then checks that every
+    placement the movers reported is in the database exactly once, that no
+    slot holds two samples, and that the occupancy counter agrees.
+
+    Returns:
+        A dict of results, with a 'problems' list that is empty on success.
+    """
+    box, sample_ids = setup(samples, capacity)
+    start_gate = threading.Barrier(workers)
+    threads = [Worker(box, sample_ids[index::workers], batch, mode, start_gate)
+               for index in range(workers)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    placed = [sample_id for thread in threads for sample_id in thread.placed]
+    rejected = sum((thread.rejected for thread in threads), Counter())
+    attempts = sum((thread.attempts for thread in threads), Counter())
+    errors = [error for thread in threads for error in thread.errors]
+    positions = list(BoxPosition.objects.filter(box=box).values_list(
+        'sample_id', 'x_position', 'y_position'))
+    stored = Counter(sample_id for sample_id, _, _ in positions)
+    slots_used = Counter((x_position, y_position) for _, x_position, y_position
+                         in positions)
+    counter = ContainerOccupancy.objects.filter(
+        container_type=ContainerOccupancy.BOX, container_id=box.pk).values_list(
+        'stored_samples', flat=True).first() or 0
+
+    problems = [f'Unexpected error: {error}' for error in errors]
+    lost = set(placed) - set(stored)
+    if lost:
+        problems.append(f'{len(lost)} placements reported but not stored, '
+                        f'e.g. {sorted(lost)[:5]}')
+    unreported = set(stored) - set(placed)
+    if unreported:
+        problems.append(f'{len(unreported)} samples stored but reported as conflicts, '
+                        f'e.g. {sorted(unreported)[:5]}')
+    duplicated = [sample_id for sample_id, count in stored.items() if count > 1]
+    if duplicated or len(placed) != len(set(placed)):
+        problems.append(f'Samples placed more than once: {duplicated[:5]}')
+    double_booked = [slot for slot, count in slots_used.items() if count > 1]
+    if double_booked:
+        problems.append(f'Slots holding more than one sample: {double_booked[:5]}')
+    if len(positions) > capacity:
+        problems.append(f'{len(positions)} samples stored in a box of {capacity}.')
+    if counter != len(positions):
+        problems.append(f'Occupancy counter says {counter} samples, the box holds '
+                        f'{len(positions)}.')
+
+    return {
+        'workers': workers,
+        'moves': sum(attempts.values()) + len(errors),
+        'placed': len(placed),
+        'rejected': dict(rejected),
+        'retried': sum(count for attempt, count in attempts.items() if attempt > 1),
+        'attempts': dict(sorted(attempts.items())),
+        'seconds': elapsed,
+        'placements_per_second': len(placed) / elapsed if elapsed else 0,
+        'free_slots': capacity - len(positions),
+        'problems': problems,
+    }
@@ -0,0 +1,48 @@
+import os
+
+from django.test import TestCase
+
+from storage_module import slots
+from storage_module.importers import LimsExportImporter
+from storage_module.models import BoxPosition, DimBox, DimSample, DimSampleStatus
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'lims_export.csv')
+
+
+class LimsExportImportTests(TestCase):
+    """Importing an export into the grid it uses, without displacing samples."""
+
+    def test_boxes_get_the_export_grid(self):
+        stats = LimsExportImporter(FIXTURE).run()
+        self.assertEqual(stats['positions'], 18)
+        box = DimBox.objects.get()
+        self.assertEqual(box.grid_dimensions, (9, 9))
+        free = slots.free_slots(box)
+        self.assertEqual(len(free), 81 - 18)
+        self.assertEqual({y_position for _, y_position in free} - set('ABCDEFGHI'),
+                         set())
+        self.assertTrue(all(0 <= x_position < 9 for x_position, _ in free))
+        self.assertEqual(BoxPosition.objects.filter(box=box).count(), 18)
+
+    def test_taken_slot_leaves_the_sample_alone(self):
+        LimsExportImporter(FIXTURE).run()
+        box = DimBox.objects.get()
+        elsewhere = DimBox.objects.create(box_name='Elsewhere', box_capacity=81)
+        archived = DimSampleStatus.objects.create(name='Archived')
+        sample = DimSample.objects.get(sample_id='08531ADY5807')
+        sample.sample_status = archived
+        sample.save()
+        BoxPosition.objects.filter(sample=sample).update(box=elsewhere)
+        intruder = DimSample.objects.create(sample_id='INTRUDER')
+        BoxPosition.objects.create(sample=intruder, box=box, x_position=0,
+                                   y_position='C')
+
+        importer = LimsExportImporter(FIXTURE)
+        stats = importer.run()
+        self.assertEqual(stats['conflicts'], 1)
+        self.assertEqual(stats['positions'], 17)
+        self.assertIn('INTRUDER', importer.conflicts['08531ADY5807'])
+        sample.refresh_from_db()
+        self.assertEqual(sample.sample_status, archived)
+        self.assertEqual(sample.box_position.box, elsewhere)
+        self.assertEqual(intruder.box_position.box, box)
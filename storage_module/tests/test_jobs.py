@@ -0,0 +1,92 @@
+from functools import partial
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from storage_module import jobs, moves, reservations
+from storage_module.models import BoxPosition, DimBox, DimFacility, DimFreezer, \
+    DimSample, SlotReservation, StorageJob
+
+
+class MoveJobTests(TestCase):
+    """A queued move runs a chunk at a time, reports progress and can be cancelled."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('mover')
+        facility = DimFacility.objects.create(facility_name='Facility')
+        freezer = DimFreezer.objects.create(freezer_name='Freezer', facility=facility)
+        cls.source = DimBox.objects.create(box_name='Source', box_capacity=81,
+                                           freezer=freezer)
+        cls.target = DimBox.objects.create(box_name='Target', box_capacity=81,
+                                           freezer=freezer)
+        cls.sample_ids = [f'S{index}' for index in range(5)]
+        for x_position, sample_id in enumerate(cls.sample_ids):
+            BoxPosition.objects.create(sample=DimSample.objects.create(
+                sample_id=sample_id), box=cls.source, x_position=x_position,
+                y_position='A')
+
+    def setUp(self):
+        # Two samples per chunk, so five samples take three. The jobs run in
+        # the test's thread, whose connection the worker must not close.
+        for patcher in (mock.patch.object(jobs, 'move_in_chunks',
+                                          partial(moves.move_in_chunks, size=2)),
+                        mock.patch.object(jobs.connections, 'close_all')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def enqueue(self, holder='wizard:test'):
+        held = reservations.hold(holder, self.target, len(self.sample_ids))
+        targets = [(sample_id, self.target.id, x_position, y_position)
+                   for sample_id, (x_position, y_position) in zip(self.sample_ids, held)]
+        jobs.enqueue('move', owner=self.user, description='Move', targets=targets,
+                     holder=holder, box_id=self.target.id)
+        return jobs.claim('test')
+
+    def in_target(self):
+        return set(BoxPosition.objects.filter(box=self.target).values_list(
+            'sample_id', flat=True))
+
+    def test_move_advances_a_chunk_at_a_time(self):
+        job = self.enqueue()
+        with mock.patch.object(jobs.Progress, 'advance', autospec=True,
+                               side_effect=jobs.Progress.advance) as advance:
+            jobs.run(job)
+        self.assertEqual([call.args[1] for call in advance.call_args_list], [2, 2, 1])
+        job.refresh_from_db()
+        self.assertEqual(job.status, StorageJob.DONE)
+        self.assertEqual((job.done, job.total), (5, 5))
+        self.assertEqual(job.message, 'Moved 5 samples.')
+        self.assertEqual(self.in_target(), set(self.sample_ids))
+        self.assertFalse(SlotReservation.objects.exists())
+
+    def test_cancelled_move_keeps_the_chunks_moved(self):
+        job = self.enqueue()
+        jobs.cancel(job)
+        jobs.run(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, StorageJob.CANCELLED)
+        self.assertEqual(job.message, 'Cancelled after 2 of 5.')
+        self.assertEqual(self.in_target(), set(self.sample_ids[:2]))
+        self.assertFalse(SlotReservation.objects.exists())
+
+    def test_conflicting_move_moves_nothing(self):
+        job = self.enqueue()
+        BoxPosition.objects.create(sample=DimSample.objects.create(sample_id='BLOCKER'),
+                                   box=self.target, x_position=4, y_position='A')
+        jobs.run(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, StorageJob.FAILED)
+        self.assertTrue(job.message.startswith('Nothing was moved:'))
+        self.assertIn('S4: ', job.message)
+        self.assertEqual(self.in_target(), {'BLOCKER'})
+
+    def test_swapped_samples_share_a_chunk(self):
+        targets = [('S0', self.source.id, 1, 'A'), ('S1', self.source.id, 0, 'A'),
+                   ('S2', self.target.id, 0, 'A')]
+        self.assertEqual([[target[0] for target in chunk]
+                          for chunk in moves.chunk_targets(targets, size=1)],
+                         [['S0', 'S1'], ['S2']])
+        self.assertEqual(moves.move_in_chunks(targets, size=1), (3, {}))
+        self.assertEqual(BoxPosition.objects.get(sample_id='S0').x_position, 1)
@@ -0,0 +1,69 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from storage_module.models import BoxPosition, DimBox, DimFacility, DimFreezer, \
+    DimSample
+
+STEP = 'sample_move_wizard-current_step'
+
+
+class MoveWizardTests(TestCase):
+    """A move the wizard cannot make is shown again, not started over."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('wizard')
+        cls.facility = DimFacility.objects.create(facility_name='Facility')
+        cls.freezer = DimFreezer.objects.create(freezer_name='Freezer',
+                                                facility=cls.facility)
+        source = DimBox.objects.create(box_name='Source', box_capacity=81,
+                                       freezer=cls.freezer)
+        cls.target = DimBox.objects.create(box_name='Target', box_capacity=81,
+                                           freezer=cls.freezer)
+        cls.sample_ids = ['S1', 'S2']
+        for x_position, sample_id in enumerate(cls.sample_ids):
+            BoxPosition.objects.create(sample=DimSample.objects.create(
+                sample_id=sample_id), box=source, x_position=x_position, y_position='A')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('move_samples') + '?sample_ids=' + ','.join(self.sample_ids)
+
+    def walk_to_positions(self):
+        self.client.get(self.url)
+        self.client.post(self.url, {STEP: '0', '0-facility': self.facility.id})
+        self.client.post(self.url, {STEP: '1', '1-freezer': self.freezer.id})
+        return self.client.post(self.url, {STEP: '2', '2-box': self.target.id})
+
+    def positions(self, *slots):
+        data = {STEP: '3', 'form-TOTAL_FORMS': len(slots),
+                'form-INITIAL_FORMS': len(slots)}
+        for index, (column, row) in enumerate(slots):
+            data[f'form-{index}-new_x_position'] = column
+            data[f'form-{index}-new_y_position'] = row
+        return data
+
+    def test_conflict_keeps_the_wizard_going(self):
+        self.walk_to_positions()
+        blocker = DimSample.objects.create(sample_id='BLOCKER')
+        BoxPosition.objects.create(sample=blocker, box=self.target, x_position=4,
+                                   y_position='E')
+
+        response = self.client.post(self.url, self.positions((5, 'E'), (6, 'E')))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'already occupied by BLOCKER')
+        self.assertEqual(BoxPosition.objects.filter(box=self.target).count(), 1)
+
+        response = self.client.post(self.url, self.positions((7, 'E'), (6, 'E')))
+        self.assertRedirects(response, reverse('box_detail', args=[self.target.id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(set(BoxPosition.objects.filter(box=self.target).values_list(
+            'sample_id', flat=True)), {'BLOCKER', *self.sample_ids})
+
+    def test_missing_position_is_reported_on_its_sample(self):
+        self.walk_to_positions()
+        response = self.client.post(self.url, self.positions((1, 'B'), ('', '')))
+        self.assertContains(response, 'Please choose a position for this sample.')
+        self.assertFalse(BoxPosition.objects.filter(box=self.target).exists())
+        self.assertEqual(response.context['wizard']['steps'].current, '3')
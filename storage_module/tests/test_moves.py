@@ -0,0 +1,101 @@
+from django.test import TestCase
+
+from storage_module import occupancy
+from storage_module.models import BoxPosition, ContainerOccupancy, DimBox, DimFacility, \
+    DimFreezer, DimSample, DimSampleStatus
+from storage_module.moves import move_samples, move_samples_to_box
+
+
+def rollup():
+    return {(row.container_type, row.container_id):
+            (row.stored_samples, row.capacity, row.box_count)
+            for row in ContainerOccupancy.objects.all()
+            if row.stored_samples or row.capacity or row.box_count}
+
+
+class MoveTests(TestCase):
+    """Moves are all or nothing and keep the rollup and the samples' history."""
+
+    @classmethod
+    def setUpTestData(cls):
+        facility = DimFacility.objects.create(facility_name='Facility')
+        freezer = DimFreezer.objects.create(freezer_name='Freezer', facility=facility)
+        other_freezer = DimFreezer.objects.create(freezer_name='Other',
+                                                  facility=facility)
+        cls.source = DimBox.objects.create(box_name='Source', box_capacity=81,
+                                           freezer=freezer)
+        cls.target = DimBox.objects.create(box_name='Target', box_capacity=81,
+                                           freezer=other_freezer)
+        cls.status = DimSampleStatus.objects.create(name='In Storage')
+        cls.sample_ids = ['S1', 'S2', 'S3']
+        for x_position, sample_id in enumerate(cls.sample_ids):
+            BoxPosition.objects.create(
+                sample=DimSample.objects.create(sample_id=sample_id,
+                                                sample_status=cls.status),
+                box=cls.source, x_position=x_position, y_position='A')
+        BoxPosition.objects.create(sample=DimSample.objects.create(sample_id='BLOCKER'),
+                                   box=cls.target, x_position=1, y_position='A')
+
+    def slots(self):
+        return {sample_id: (box_id, x_position, y_position)
+                for sample_id, box_id, x_position, y_position
+                in BoxPosition.objects.values_list('sample_id', 'box_id', 'x_position',
+                                                   'y_position')}
+
+    def assertRollupMatchesRebuild(self):
+        counters = rollup()
+        occupancy.rebuild()
+        self.assertEqual(counters, rollup())
+
+    def test_conflict_moves_nothing(self):
+        before = self.slots()
+        conflicts = move_samples([('S1', self.target, 0, 'A'),
+                                  ('S2', self.target, 1, 'A'),
+                                  ('S3', self.target, 9, 'A')])
+        self.assertEqual(set(conflicts), {'S2', 'S3'})
+        self.assertIn('occupied by BLOCKER', conflicts['S2'])
+        self.assertIn('outside the grid', conflicts['S3'])
+        self.assertEqual(self.slots(), before)
+        self.assertRollupMatchesRebuild()
+
+    def test_samples_swap_slots(self):
+        conflicts = move_samples([('S1', self.source, 1, 'A'),
+                                  ('S2', self.source, 0, 'A'),
+                                  ('S3', self.target, 2, 'A')])
+        self.assertEqual(conflicts, {})
+        slots = self.slots()
+        self.assertEqual(slots['S1'], (self.source.id, 1, 'A'))
+        self.assertEqual(slots['S2'], (self.source.id, 0, 'A'))
+        self.assertEqual(slots['S3'], (self.target.id, 2, 'A'))
+        self.assertRollupMatchesRebuild()
+
+    def test_box_filler_takes_the_first_free_slots(self):
+        self.assertEqual(move_samples_to_box(self.sample_ids, self.target), {})
+        slots = self.slots()
+        self.assertEqual([slots[sample_id] for sample_id in self.sample_ids],
+                         [(self.target.id, 0, 'A'), (self.target.id, 2, 'A'),
+                          (self.target.id, 3, 'A')])
+        self.assertRollupMatchesRebuild()
+
+    def test_box_filler_refuses_a_box_without_room(self):
+        small = DimBox.objects.create(box_name='Small', box_capacity=2,
+                                      freezer=self.target.freezer)
+        before = self.slots()
+        conflicts = move_samples_to_box(self.sample_ids, small)
+        self.assertEqual(set(conflicts), set(self.sample_ids))
+        self.assertEqual(self.slots(), before)
+        self.assertRollupMatchesRebuild()
+
+    def test_history_is_kept(self):
+        sample = DimSample.objects.get(sample_id='S1')
+        sample.sample_condition = 'Thawed once'
+        sample.save()
+        history = list(sample.history.values_list('history_id', flat=True))
+
+        self.assertEqual(move_samples([('S1', self.target, 0, 'B')]), {})
+        sample.refresh_from_db()
+        self.assertEqual(list(sample.history.values_list('history_id', flat=True)),
+                         history)
+        self.assertEqual(sample.sample_status, self.status)
+        self.assertEqual(sample.sample_condition, 'Thawed once')
+        self.assertEqual(sample.box_position.box, self.target)
@@ -0,0 +1,90 @@
+from django.db import transaction
+from django.test import TestCase
+
+from storage_module import occupancy
+from storage_module.models import BoxPosition, ContainerOccupancy, DimBox, DimFacility, \
+    DimFreezer, DimRack, DimSample, DimShelf
+
+
+def rollup():
+    return {(row.container_type, row.container_id):
+            (row.stored_samples, row.capacity, row.box_count)
+            for row in ContainerOccupancy.objects.all()
+            if row.stored_samples or row.capacity or row.box_count}
+
+
+class OccupancyTests(TestCase):
+    """The counters kept by the signal handlers agree with a full rebuild."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.facility = DimFacility.objects.create(facility_name='Facility')
+        cls.freezer = DimFreezer.objects.create(freezer_name='Freezer',
+                                                facility=cls.facility)
+        cls.other_freezer = DimFreezer.objects.create(freezer_name='Other',
+                                                      facility=cls.facility)
+        cls.shelf = DimShelf.objects.create(shelf_name='Shelf', shelf_description='',
+                                            freezer=cls.freezer)
+        cls.rack = DimRack.objects.create(rack_name='Rack', shelf=cls.shelf)
+        cls.rack_box = DimBox.objects.create(box_name='In rack', box_capacity=81,
+                                             rack=cls.rack)
+        cls.shelf_box = DimBox.objects.create(box_name='On shelf', box_capacity=100,
+                                              shelf=cls.shelf)
+        cls.freezer_box = DimBox.objects.create(box_name='In other', box_capacity=81,
+                                                freezer=cls.other_freezer)
+        for index in range(6):
+            box = (cls.rack_box, cls.shelf_box, cls.freezer_box)[index % 3]
+            BoxPosition.objects.create(
+                sample=DimSample.objects.create(sample_id=f'S{index}'), box=box,
+                x_position=index, y_position='A')
+
+    def assertRollupMatchesRebuild(self):
+        counters = rollup()
+        occupancy.rebuild()
+        self.assertEqual(counters, rollup())
+
+    def test_created_rows_are_counted(self):
+        self.assertEqual(rollup()[(ContainerOccupancy.FACILITY, self.facility.id)],
+                         (6, 262, 3))
+        self.assertRollupMatchesRebuild()
+
+    def test_sample_moves(self):
+        position = BoxPosition.objects.get(sample_id='S0')
+        position.box = self.freezer_box
+        position.save()
+        BoxPosition.objects.get(sample_id='S1').delete()
+        self.assertRollupMatchesRebuild()
+
+    def test_reparenting(self):
+        self.rack.shelf = None
+        self.rack.freezer = self.other_freezer
+        self.rack.save()
+        self.assertRollupMatchesRebuild()
+
+        self.shelf_box.shelf = None
+        self.shelf_box.freezer = self.other_freezer
+        self.shelf_box.box_capacity = 81
+        self.shelf_box.save()
+        self.assertRollupMatchesRebuild()
+
+        occupancy.update_boxes([self.freezer_box.id], freezer=self.freezer,
+                               box_capacity=100)
+        self.assertRollupMatchesRebuild()
+
+    def test_deletes(self):
+        for instance in (self.freezer_box, self.rack, self.freezer):
+            with self.captureOnCommitCallbacks(execute=True):
+                instance.delete()
+            self.assertRollupMatchesRebuild()
+        self.assertEqual(rollup(), {})
+
+    def test_rolled_back_delete_leaves_no_boxes_detached(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.freezer.delete()
+            raise RuntimeError
+        self.assertEqual(occupancy.detached_boxes(), frozenset())
+        self.assertRollupMatchesRebuild()
+
+        BoxPosition.objects.get(sample_id='S0').delete()
+        self.rack_box.delete()
+        self.assertRollupMatchesRebuild()
@@ -0,0 +1,51 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Sum
+from django.test import TestCase
+from django.urls import reverse
+
+from storage_module.generators import StorageDataGenerator
+from storage_module.models import BoxPosition, DimBox
+from storage_module.overview import StorageOverview
+
+# (facilities, samples) of the datasets compared; the second is several times
+# the size of the first at every level of the hierarchy.
+DATASET_SIZES = [(1, 300), (3, 3000)]
+
+
+class StorageOverviewQueryTests(TestCase):
+    """The facility overview costs the same number of queries at any size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('overview', password='overview')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def grow(self, facilities, samples):
+        StorageDataGenerator(facilities=facilities, samples=samples, history=False,
+                             note_ratio=0, seed=facilities).run()
+        # Measure the cold path, not pages or reference data cached earlier.
+        cache.clear()
+
+    def test_overview_query_count_is_fixed(self):
+        for facilities, samples in DATASET_SIZES:
+            self.grow(facilities, samples)
+            with self.subTest(facilities=facilities, samples=samples):
+                with self.assertNumQueries(2):
+                    data = StorageOverview().facility_data()
+                self.assertTrue(all(row['utilized_storage'] for row in data))
+                self.assertEqual(sum(row['utilized_storage'] for row in data),
+                                 BoxPosition.objects.count())
+                self.assertEqual(sum(row['facility_capacity'] for row in data),
+                                 DimBox.objects.aggregate(
+                                     capacity=Sum('box_capacity'))['capacity'])
+
+    def test_facility_list_query_count_is_fixed(self):
+        for facilities, samples in DATASET_SIZES:
+            self.grow(facilities, samples)
+            with self.subTest(facilities=facilities, samples=samples):
+                with self.assertNumQueries(4):
+                    response = self.client.get(reverse('storage_view'))
+                self.assertEqual(response.status_code, 200)
@@ -0,0 +1,52 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from storage_module import search
+from storage_module.models import DimSample
+
+
+class SearchIndexTests(TestCase):
+    """The samples page ranks search matches and finds an index built later."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('search')
+        for sample_id, participant_id in [('085ADY5807', 'P-1'), ('085ADY5808', 'P-2'),
+                                          ('CSF0001', '085ADY')]:
+            DimSample.objects.create(sample_id=sample_id, participant_id=participant_id)
+
+    def setUp(self):
+        search.reset_state()
+        self.addCleanup(search.reset_state)
+        self.client.force_login(self.user)
+
+    def test_index_built_elsewhere_is_picked_up(self):
+        self.assertFalse(search.index_available())
+        with connection.cursor() as cursor:
+            search.get_backend().create(cursor)
+        self.assertFalse(search.index_available())
+        later = search.time.monotonic() + search.RECHECK_SECONDS
+        with mock.patch.object(search.time, 'monotonic', return_value=later):
+            self.assertTrue(search.index_available())
+
+    def test_rebuild_makes_the_index_available(self):
+        self.assertFalse(search.index_available())
+        self.assertEqual(search.rebuild(), 3)
+        self.assertTrue(search.index_available())
+
+    def test_samples_page_shows_ranked_matches(self):
+        search.rebuild()
+        response = self.client.get(reverse('samples_url') + '?search=ADY580')
+        best_matches = response.context['best_matches']
+        self.assertEqual([sample.sample_id for sample in best_matches],
+                         ['085ADY5807', '085ADY5808'])
+        self.assertContains(response, reverse('sample_detail', args=['085ADY5807']))
+
+        response = self.client.get(reverse('samples_url') + '?search=085ADY')
+        self.assertEqual(len(response.context['best_matches']), 3)
+        response = self.client.get(reverse('samples_url') + '?search=085ADY&last=1')
+        self.assertEqual(response.context['best_matches'], [])
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from storage_module import selections
+from storage_module.models import SampleSelection, StorageJob
+
+
+class SelectionAccessTests(TestCase):
+    """A selection is only reached by its owner, or by staff."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('owner')
+        cls.other = User.objects.create_user('other')
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+        cls.selection = selections.create([], owner=cls.owner)
+
+    def test_owner_gets_selection(self):
+        self.assertEqual(selections.get(self.selection.pk, self.owner), self.selection)
+
+    def test_other_user_does_not(self):
+        self.assertIsNone(selections.get(self.selection.pk, self.other))
+
+    def test_staff_gets_any_selection(self):
+        self.assertEqual(selections.get(self.selection.pk, self.staff), self.selection)
+
+    def test_non_numeric_id_names_no_selection(self):
+        self.assertIsNone(selections.get('matching', self.staff))
+
+
+@override_settings(STORAGE_SELECTION_SECONDS=60 * 60)
+class SelectionPruneTests(TestCase):
+    """Old selections are deleted unless an unfinished job still needs them."""
+
+    def saved(self, hours_ago):
+        selection = selections.create([])
+        SampleSelection.objects.filter(pk=selection.pk).update(
+            created_date=timezone.now() - timedelta(hours=hours_ago))
+        return selection
+
+    def test_prunes_old_selections_only(self):
+        old, recent = self.saved(2), self.saved(0)
+        self.assertEqual(selections.prune(), 1)
+        self.assertQuerysetEqual(SampleSelection.objects.all(), [recent])
+        self.assertFalse(SampleSelection.objects.filter(pk=old.pk).exists())
+
+    def test_keeps_selections_of_unfinished_jobs(self):
+        queued, finished = self.saved(2), self.saved(2)
+        StorageJob.objects.create(kind='note', selection=queued)
+        job = StorageJob.objects.create(kind='note', selection=finished,
+                                        status=StorageJob.DONE)
+        self.assertEqual(selections.prune(), 1)
+        self.assertQuerysetEqual(SampleSelection.objects.all(), [queued])
+        job.refresh_from_db()
+        self.assertIsNone(job.selection)
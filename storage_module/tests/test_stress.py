@@ -0,0 +1,28 @@
+from django.db import connection
+from django.test import TransactionTestCase
+
+from storage_module import stress
+
+
+class ConcurrentMoveTests(TransactionTestCase):
+    """
+    Many threads moving samples into one box at once never lose, duplicate
+    or double-book a placement, and the occupancy counter keeps up.
+    """
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Threads share an in-memory SQLite database without '
+                          'locking; set a TEST NAME for the database.')
+
+    def test_racing_for_the_first_free_slot(self):
+        result = stress.run(workers=8, samples=100, capacity=81, mode='fill')
+        self.assertEqual(result['problems'], [])
+        self.assertEqual(result['placed'], 81)
+        self.assertEqual(result['free_slots'], 0)
+
+    def test_batches_to_random_slots(self):
+        result = stress.run(workers=8, samples=60, capacity=100, batch=3,
+                            mode='random')
+        self.assertEqual(result['problems'], [])
+        self.assertTrue(result['placed'])
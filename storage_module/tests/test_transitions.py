@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from storage_module import occupancy, selections
+from storage_module.models import BoxPosition, ContainerOccupancy, DimBox, DimFacility, \
+    DimFreezer, DimSample, DimSampleStatus
+from storage_module.transitions import transition_samples
+
+
+class TransitionTests(TestCase):
+    """Bulk status changes write history and free the slots of samples leaving."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('lab')
+        cls.stored = DimSampleStatus.objects.create(name='In Storage')
+        cls.archived = DimSampleStatus.objects.create(name='Archived')
+        cls.shipped = DimSampleStatus.objects.create(name='Shipped')
+        facility = DimFacility.objects.create(facility_name='Facility')
+        freezer = DimFreezer.objects.create(freezer_name='Freezer', facility=facility)
+        cls.box = DimBox.objects.create(box_name='Box', box_capacity=81, freezer=freezer)
+        cls.sample_ids = [f'S{index}' for index in range(8)]
+        for index, sample_id in enumerate(cls.sample_ids):
+            BoxPosition.objects.create(
+                sample=DimSample.objects.create(sample_id=sample_id,
+                                                sample_status=cls.stored),
+                box=cls.box, x_position=index, y_position='A')
+
+    def stored_in_box(self):
+        return occupancy.occupancy_map(ContainerOccupancy.BOX, [self.box.id])[
+            self.box.id].stored_samples
+
+    def test_history_rows_record_the_change(self):
+        changed = transition_samples(self.sample_ids[:3], self.archived, user=self.user,
+                                     change_reason='Archived for audit')
+        self.assertEqual(changed, 3)
+        for sample in DimSample.objects.filter(sample_id__in=self.sample_ids[:3]):
+            latest = sample.history.first()
+            self.assertEqual(latest.sample_status_id, self.archived.id)
+            self.assertEqual(latest.history_type, '~')
+            self.assertEqual(latest.history_user, self.user)
+            self.assertEqual(latest.history_change_reason, 'Archived for audit')
+        self.assertEqual(BoxPosition.objects.filter(box=self.box).count(), 8)
+
+    def test_samples_already_in_the_status_are_left_alone(self):
+        transition_samples(self.sample_ids[:2], self.archived)
+        history = DimSample.history.count()
+        self.assertEqual(transition_samples(self.sample_ids[:4], self.archived), 2)
+        self.assertEqual(DimSample.history.count(), history + 2)
+
+    def test_leaving_storage_frees_the_slots(self):
+        self.assertEqual(transition_samples(self.sample_ids[:5], self.shipped), 5)
+        self.assertEqual(BoxPosition.objects.filter(box=self.box).count(), 3)
+        self.assertEqual(self.stored_in_box(), 3)
+        occupancy.rebuild()
+        self.assertEqual(self.stored_in_box(), 3)
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        with CaptureQueriesContext(connection) as small:
+            transition_samples(self.sample_ids[:2], self.shipped)
+        with CaptureQueriesContext(connection) as large:
+            transition_samples(self.sample_ids[2:], self.shipped)
+        self.assertEqual(len(small), len(large))
+
+    def test_selection_reports_its_progress(self):
+        selection = selections.create(self.sample_ids)
+        progress = mock.Mock()
+        changed = selections.transition(selection, self.archived, user=self.user,
+                                        progress=progress)
+        self.assertEqual(changed, 8)
+        progress.assert_called_once_with(8)
+        self.assertEqual(DimSample.objects.filter(sample_status=self.archived).count(), 8)
@@ -0,0 +1,61 @@
+from collections import Counter
+
+from django.db import transaction
+
+from storage_module import occupancy, slots, versions
+from storage_module.models import BoxPosition, ContainerOccupancy, DimSample, \
+    STORAGE_STATUSES
+
+
+def transition_samples(sample_ids, status, user=None, change_reason=''):
+    """
+    Moves a batch of samples to a new status with a fixed number of queries:
+    one UPDATE for the status, one SELECT for the boxes whose pages change,
+    one DELETE for the box positions of samples leaving storage, and one
+    bulk insert for their history rows. Samples already in the status are
+    left alone.
+
+    Args:
+        sample_ids: The sample_id values of the samples to transition.
+        status: The DimSampleStatus to move them to.
+        user: The user recorded on the history rows.
+        change_reason: The change reason recorded on the history rows.
+
+    Returns:
+        The number of samples whose status changed.
+    """
+    with transaction.atomic():
+        samples = list(DimSample.objects.filter(sample_id__in=list(sample_ids)).exclude(
+            sample_status=status))
+        if not samples:
+            return 0
+        pks = [sample.pk for sample in samples]
+        DimSample.objects.filter(pk__in=pks).update(sample_status=status)
+        # Box pages show the status of every sample in the box.
+        box_ids = BoxPosition.objects.filter(
+            sample_id__in=[sample.sample_id for sample in samples]).values_list(
+            'box_id', flat=True)
+        versions.bump((ContainerOccupancy.BOX, box_id) for box_id in set(box_ids))
+
+        if status.name not in STORAGE_STATUSES:
+            release_positions([sample.sample_id for sample in samples])
+
+        for sample in samples:
+            sample.sample_status = status
+        DimSample.history.bulk_history_create(
+            samples, update=True, default_user=user,
+            default_change_reason=change_reason)
+    return len(samples)
+
+
+def release_positions(sample_ids):
+    """Frees the box positions of samples that have left storage."""
+    positions = BoxPosition.objects.filter(sample_id__in=sample_ids)
+    box_deltas = Counter()
+    box_deltas.subtract(positions.values_list('box_id', flat=True))
+    if not box_deltas:
+        return
+    with occupancy.muted():
+        positions.delete()
+    slots.invalidate(box_deltas.keys())
+    occupancy.record_sample_changes(box_deltas)
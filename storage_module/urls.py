@@ -20,8 +20,10 @@ from django.urls.conf import include
 
 from storage_module import views
 from storage_module.views import BoxDetailView, FacilityDetailView, FacilityListView, \
-    FreezerDetailView, HomeView, RackDetailView, SampleDetailView, SamplesView, \
-    ShelfDetailView, SampleMoveWizard
+    FreezerDetailView, HomeView, JobDetailView, JobListView, ProfileDetailView, \
+    ProfileListView, RackDetailView, SampleDetailView, SamplesView, ShelfDetailView, \
+    SampleMoveWizard
+from storage_module.views import async_views
 
 urlpatterns = [
     path('accounts/', include('edc_base.auth.urls')),
@@ -37,9 +39,25 @@ urlpatterns = [
     path('shelf/<str:shelf_id>/', ShelfDetailView.as_view(), name='shelf_detail'),
     path('freezer/<str:freezer_id>/', FreezerDetailView.as_view(), name='freezer_detail'),
     path('freezer_data/<int:freezer_id>/', views.freezer_data, name='freezer_data'),
+    path('async/home/', async_views.home, name='async_home'),
+    path('async/get_shelves/', async_views.get_shelves, name='async_get_shelves'),
+    path('async/get_racks/', async_views.get_racks, name='async_get_racks'),
+    path('async/freezer_data/<int:freezer_id>/', async_views.freezer_data,
+         name='async_freezer_data'),
     path('facility/<str:facility_id>/', FacilityDetailView.as_view(),
          name='facility_detail'),
     path('move_samples/', SampleMoveWizard.as_view(), name='move_samples'),
+    path('jobs/', JobListView.as_view(), name='jobs'),
+    path('jobs/<int:job_id>/', JobDetailView.as_view(), name='job_detail'),
+    path('jobs/<int:job_id>/status/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/cancel/', views.cancel_job, name='cancel_job'),
+    path('jobs/<int:job_id>/download/', views.download_job_result,
+         name='download_job_result'),
+    path('sql_reports/', views.sql_reports, name='sql_reports'),
+    path('profiles/', ProfileListView.as_view(), name='profiles'),
+    path('profiles/<str:name>/', ProfileDetailView.as_view(), name='profile_detail'),
+    path('profiles/<str:name>/download/', views.download_profile,
+         name='download_profile'),
     path('reports/', HomeView.as_view(), name='reports_url'),
     path('dashboard/', HomeView.as_view(), name='dashboard_url'),
     path('storage_view/', FacilityListView.as_view(), name='storage_view'),
@@ -1,4 +1,5 @@
-from storage_module.models import BoxPosition
+from storage_module.occupancy import occupancy_map
+from storage_module.slots import free_slots
 
 
 def get_available_positions(box):
@@ -9,28 +10,72 @@ def get_available_positions(box):
           box: A DimBox object representing the box to check for available positions.
 
       Returns:
-          A list of tuples representing available (x, y) positions within the box.
+          A list of (x_position, y_position) tuples for every free slot of the box
+          grid, in reading order, e.g. [(0, 'A'), (1, 'A'), ...].
       """
-    occupied_positions = set(BoxPosition.objects.filter(box=box).
-                             values_list('x_position', 'y_position'))
-    max_position = box.box_capacity or 91
-    all_positions = range(1, max_position + 1)
-    free_positions = [(p, p) for p in all_positions if (p, p) not in occupied_positions]
-    return free_positions
+    return free_slots(box)
 
 
-def get_data(input_list, url, icon, name, capacity, filter_obj):
+def row_label(index):
+    return chr(ord('A') + index)
+
+
+def build_box_grid(box):
+    """
+    Lays a box's positions out as a dense matrix in a single query.
+
+    Args:
+        box: A DimBox object.
+
+    Returns:
+        A (rows, x_labels, unplaced) tuple, where rows is a list of
+        {'label': 'A', 'cells': [BoxPosition or None, ...]} dicts with samples
+        and their statuses already loaded, and unplaced lists the positions
+        that fall outside the box geometry.
+    """
+    row_count, column_count = box.grid_dimensions
+    labels = [row_label(i) for i in range(row_count)]
+    rows = [{'label': label, 'cells': [None] * column_count} for label in labels]
+    row_index = {label: i for i, label in enumerate(labels)}
+
+    unplaced = []
+    positions = box.boxposition_set.select_related(
+        'sample__sample_status', 'sample__sample_type').order_by(
+        'y_position', 'x_position')
+    for position in positions:
+        row = row_index.get(position.y_position)
+        if row is None or not 0 <= position.x_position < column_count:
+            unplaced.append(position)
+        else:
+            rows[row]['cells'][position.x_position] = position
+    return rows, list(range(1, column_count + 1)), unplaced
+
+
+def get_data(input_list, url, icon, name, container_type):
+    """
+    Builds the tree rows for containers holding at least one sample, reading
+    the counts from the occupancy rollup.
+
+    Args:
+        input_list: The containers to describe.
+        url: Name of the detail url for the containers.
+        icon: Icon class shown next to each container.
+        name: A callable returning the display name of a container.
+        container_type: The ContainerOccupancy level of the containers.
+    """
+    input_list = list(input_list)
+    occupancy = occupancy_map(container_type, [item.id for item in input_list])
     data_list = []
     for item in input_list:
-        item_samples = filter_obj.filter(box=item).count()
-        if item_samples > 0:
+        counters = occupancy.get(item.id)
+        if counters and counters.stored_samples > 0:
             data = {
                 'id': item.id,
                 'url': url,
                 'icon': icon,
-                'name': name,
-                'capacity': capacity,
-                'stored_samples': item_samples,
+                'name': name(item),
+                'capacity': counters.capacity,
+                'stored_samples': counters.stored_samples,
             }
             data_list.append(data)
-    return data_list
\ No newline at end of file
+    return data_list
@@ -0,0 +1,76 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+CACHE_PREFIX = 'storage_module:versions'
+
+# Moves on with every change anywhere, for pages summarising all storage.
+GLOBAL_KEY = f'{CACHE_PREFIX}:global'
+
+# Moves on when every container version should be retired at once.
+GENERATION_KEY = f'{CACHE_PREFIX}:generation'
+
+
+def version_key(level, container_id):
+    return f'{CACHE_PREFIX}:{level}:{container_id}'
+
+
+def read(keys):
+    """
+    Returns:
+        A dict of key to version. A version is the time in nanoseconds of the
+        last change, so it doubles as a modification time. Versions missing
+        from the cache start at the current time, which never repeats one a
+        page or fragment may still be cached under.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def container_version(level, container_id):
+    """
+    Returns:
+        (version, modified) of a container: an opaque string that changes
+        whenever anything in the container changes, and the time in
+        nanoseconds of that change.
+    """
+    versions = read([GENERATION_KEY, version_key(level, container_id)])
+    return '.'.join(map(str, versions.values())), max(versions.values())
+
+
+def global_version():
+    """(version, modified) of all storage data, as for container_version."""
+    versions = read([GENERATION_KEY, GLOBAL_KEY])
+    return '.'.join(map(str, versions.values())), max(versions.values())
+
+
+def bump(containers):
+    """
+    Moves the versions of (level, container id) pairs, and the global
+    version, on once the current transaction commits, so no reader can
+    cache the old rows under the new version.
+    """
+    keys = {version_key(level, container_id) for level, container_id in containers
+            if container_id is not None}
+    if keys:
+        transaction.on_commit(lambda: touch(keys | {GLOBAL_KEY}))
+
+
+def bump_ancestors(ancestors):
+    """Bumps every container in {level: container id} mappings of boxes."""
+    bump(container for mapping in ancestors for container in mapping.items())
+
+
+def invalidate_all():
+    """Retires every container version, e.g. after the counters were rebuilt."""
+    transaction.on_commit(lambda: touch({GENERATION_KEY, GLOBAL_KEY}))
+
+
+def touch(keys):
+    now = time.time_ns()
+    cache.set_many({key: now for key in keys}, None)
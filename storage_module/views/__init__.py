@@ -2,9 +2,14 @@ from .box_detail_view import BoxDetailView
 from .facility_detail_view import FacilityDetailView
 from .facility_list_view import FacilityListView
 from .freezer_detail_view import FreezerDetailView
+from .job_detail_view import JobDetailView
+from .job_list_view import JobListView
+from .profile_detail_view import ProfileDetailView
+from .profile_list_view import ProfileListView
 from .rack_detail_view import RackDetailView
 from .sample_detail_view import SampleDetailView
 from .sample_move_wizard import SampleMoveWizard
 from .samples_view import SamplesView
 from .shelf_detail_view import ShelfDetailView
-from .views import freezer_data, get_racks, get_shelves, HomeView
+from .views import cancel_job, download_job_result, download_profile, freezer_data, \
+    get_racks, get_shelves, HomeView, job_status, sql_reports
@@ -0,0 +1,56 @@
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+
+from storage_module import async_db, fragments
+from storage_module.conditional import async_container_condition
+from storage_module.models import ContainerOccupancy, DimFreezer, DimRack, DimShelf
+from storage_module.views.views import dashboard_counts, freezer_children, \
+    render_freezer_children
+
+# Async variants of the dashboard and storage tree endpoints, for ASGI
+# deployments serving many clients at once. Their queries run on the bounded
+# pool of storage_module.async_db, side by side where they are independent,
+# and the event loop serves other requests while they do.
+
+
+async def home(request):
+    """HomeView, with its four counts run concurrently."""
+    counts = dashboard_counts()
+    values = await async_db.gather(*counts.values())
+    context = dict(zip(counts, values))
+    # Rendering reads the user and messages, which may still hit the database.
+    return await async_db.run(render, request, 'storage_module/home.html', context)
+
+
+@async_db.login_required
+async def get_shelves(request):
+    freezer_id = request.GET.get('freezer_id')
+    shelves = await async_db.run(
+        lambda: list(DimShelf.objects.filter(freezer_id=freezer_id).values()))
+    return JsonResponse(shelves, safe=False)
+
+
+@async_db.login_required
+async def get_racks(request):
+    freezer_id = request.GET.get('freezer_id')
+    racks = await async_db.run(
+        lambda: list(DimRack.objects.filter(freezer_id=freezer_id).values()))
+    return JsonResponse(racks, safe=False)
+
+
+@async_db.login_required
+@async_container_condition(ContainerOccupancy.FREEZER, 'freezer_id')
+async def freezer_data(request, freezer_id):
+    """freezer_data, with the freezer lookup and its three levels read concurrently."""
+    async def build():
+        exists, *rows = await async_db.gather(
+            DimFreezer.objects.filter(id=freezer_id).exists,
+            *freezer_children(freezer_id))
+        if not exists:
+            raise Http404('No DimFreezer matches the given query.')
+        return await async_db.run(render_freezer_children,
+                                  [row for part in rows for row in part])
+
+    html = await fragments.acached(ContainerOccupancy.FREEZER, freezer_id,
+                                   'freezer_data', build)
+    return JsonResponse({'html': html})
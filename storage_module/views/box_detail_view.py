@@ -1,21 +1,28 @@
 from urllib.parse import urlencode
 
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse
 from django.views.generic import DetailView
 
-from storage_module.forms import MoveBoxForm
-from storage_module.models import DimBox, DimSampleStatus
+from storage_module import reference, selections
+from storage_module.conditional import conditional_view, container_condition
+from storage_module.forms import MoveBoxForm, SampleTransferForm
+from storage_module.models import ContainerOccupancy, DimBox
+from storage_module.moves import move_samples_to_box
+from storage_module.util import build_box_grid
 
 
+@conditional_view(container_condition(
+    ContainerOccupancy.BOX, 'box_id', reference_names=('boxes', 'sample_statuses')))
 class BoxDetailView(LoginRequiredMixin, DetailView):
     model = DimBox
     template_name = 'storage_module/box_detail.html'
 
     def get_object(self, queryset=None):
         box_id = self.kwargs.get('box_id')
-        return get_object_or_404(DimBox, id=box_id)
+        return get_object_or_404(DimBox.objects.with_location(), id=box_id)
 
     def post(self, request, *args, **kwargs):
         form = MoveBoxForm(request.POST)
@@ -23,8 +30,14 @@ class BoxDetailView(LoginRequiredMixin, DetailView):
         action = request.POST.get('action')
         if action == 'move':
             selected_samples = request.POST.getlist('sample_ids')
+            transfer_form = SampleTransferForm(request.POST)
+            target_box = (transfer_form.cleaned_data.get('target_box')
+                          if transfer_form.is_valid() else None)
+            if target_box and selected_samples:
+                return self.move_to_box(selected_samples, target_box)
+            selection = selections.create(selected_samples, owner=request.user)
             base_url = reverse('move_samples')
-            query_string = urlencode({'sample_ids': ','.join(selected_samples)})
+            query_string = urlencode({'selection': selection.pk})
             url = '{}?{}'.format(base_url, query_string)
             return redirect(url)
 
@@ -36,11 +49,22 @@ class BoxDetailView(LoginRequiredMixin, DetailView):
             box.save()
         return super().get(request, *args, **kwargs)
 
+    def move_to_box(self, sample_ids, target_box):
+        """Moves the selected samples straight into the free slots of a box."""
+        conflicts = move_samples_to_box(sample_ids, target_box)
+        if conflicts:
+            for sample_id, message in conflicts.items():
+                messages.error(self.request, f'{sample_id}: {message}')
+            return redirect('box_detail', box_id=self.kwargs.get('box_id'))
+        messages.success(self.request, f'Moved {len(sample_ids)} samples to '
+                                       f'{target_box.box_name}.')
+        return redirect('box_detail', box_id=target_box.id)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
 
         box = self.object
-        positions = box.positions.order_by('x_position', 'y_position')
+        grid, x_labels, unplaced_positions = build_box_grid(box)
 
         location = getattr(box, 'location', None)
 
@@ -60,19 +84,17 @@ class BoxDetailView(LoginRequiredMixin, DetailView):
             initial=initial
         )
 
-        x_labels = [int(i) for i in range(1, 10)]
-        y_labels = [chr(i) for i in range(ord('A'), ord('J'))]
-
         context.update(
             box=box,
-            positions=positions,
+            grid=grid,
+            unplaced_positions=unplaced_positions,
             rack=rack,
             shelf=shelf,
             freezer=freezer,
             facility=facility,
             move_box_form=move_box_form,
+            transfer_form=SampleTransferForm(),
             x_labels=x_labels,
-            y_labels=y_labels,
             sample_statuses=self.sample_statuses,
         )
 
@@ -80,4 +102,4 @@ class BoxDetailView(LoginRequiredMixin, DetailView):
 
     @property
     def sample_statuses(self):
-        return DimSampleStatus.objects.all()
+        return reference.get('sample_statuses')
@@ -1,10 +1,12 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q
 from django.views.generic import ListView
 
-from ..models import DimBox, DimFacility
+from ..conditional import conditional_view, global_condition
+from ..models import DimFacility
+from ..overview import StorageOverview
 
 
+@conditional_view(global_condition())
 class FacilityListView(LoginRequiredMixin, ListView):
     model = DimFacility
     template_name = "storage_module/storage_view.html"
@@ -18,34 +20,4 @@ class FacilityListView(LoginRequiredMixin, ListView):
 
     @property
     def get_facilities(self):
-        facilities = self.get_queryset()
-
-        data = []
-        for facility in facilities:
-            freezers = facility.dimfreezer_set.all()
-
-            facility_capacity = 0
-            utilized_storage = 0
-
-            for freezer in freezers:
-                boxes = DimBox.objects.filter(
-                    Q(shelf__freezer=freezer) |
-                    Q(rack__shelf__freezer=freezer) |
-                    Q(rack__freezer=freezer) |
-                    Q(freezer=freezer)
-                )
-
-                freezer_capacity = sum(box.box_capacity for box in boxes)
-                facility_capacity += freezer_capacity
-
-                for box in boxes:
-                    utilized_storage += len(box.get_samples())
-
-            data.append({
-                'id': facility.id,
-                'facility_name': facility.facility_name,
-                'facility_capacity': facility_capacity,
-                'utilized_storage': utilized_storage,
-                'available_capacity': facility_capacity - utilized_storage
-            })
-        return data
+        return StorageOverview(self.get_queryset()).facility_data()
@@ -1,12 +1,15 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Sum
 from django.shortcuts import get_object_or_404
 from django.views.generic import DetailView
 
+from .. import fragments
+from ..conditional import conditional_view, container_condition
 from ..forms import MoveBoxForm
-from ..models import (BoxPosition, DimBox, DimFreezer, DimRack, DimShelf)
+from ..models import ContainerOccupancy, DimFreezer
+from ..occupancy import occupancy_map
 
 
+@conditional_view(container_condition(ContainerOccupancy.FREEZER, 'freezer_id'))
 class FreezerDetailView(LoginRequiredMixin, DetailView):
     model = DimFreezer
     template_name = 'storage_module/freezer_detail.html'
@@ -31,43 +34,43 @@ class FreezerDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         freezer = self.object
 
-        context['inside_freezer'] = self.get_container_data('box', 'boxes', 'fas fa-cube')
-        context['inside_freezer'].extend(
-            self.get_container_data('shelf', 'shelves', 'fas fa-layer-group'))
-        context['inside_freezer'].extend(
-            self.get_container_data('rack', 'racks', 'fas fa-box-open'))
+        context.update(fragments.cached(
+            ContainerOccupancy.FREEZER, freezer.pk, 'detail', self.get_contents))
 
         context['type'] = 'Freezer'
         context['name'] = freezer.freezer_name
         context['obj'] = freezer
         context['icon'] = 'fas fa-snowflake'
-        context['facility'] = freezer.facility
 
         return context
 
+    def get_contents(self):
+        inside_freezer = self.get_container_data('box', 'boxes', 'fas fa-cube')
+        inside_freezer.extend(
+            self.get_container_data('shelf', 'shelves', 'fas fa-layer-group'))
+        inside_freezer.extend(
+            self.get_container_data('rack', 'racks', 'fas fa-box-open'))
+        return {'inside_freezer': inside_freezer, 'facility': self.object.facility}
+
     def get_container_data(self, container_type, queryset_method, icon, ):
         container_data = []
         freezer = self.object
-        for container in getattr(freezer, queryset_method).all():
-            if isinstance(container, DimBox):
-                capacity = container.box_capacity
-                samples_in_container = {'box': container}
-            else:
-                capacity = container.boxes.aggregate(total_capacity=Sum('box_capacity'))[
-                    'total_capacity']
-                if isinstance(container, DimRack):
-                    samples_in_container = {'box__rack': container}
-                if isinstance(container, DimShelf):
-                    samples_in_container = {'box__shelf': container}
-            samples = BoxPosition.objects.filter(**samples_in_container).count()
-            if samples > 0:
+        queryset = getattr(freezer, queryset_method)
+        if container_type == 'box':
+            queryset = queryset.filter(shelf=None, rack=None)
+        containers = list(queryset.all())
+        occupancy = occupancy_map(container_type,
+                                  [container.id for container in containers])
+        for container in containers:
+            counters = occupancy.get(container.id)
+            if counters and counters.stored_samples > 0:
                 name_field = f"{container_type}_name"
                 container_data.append({
                     'id': container.id,
                     'url': f'{container_type}_detail',
                     'icon': icon,
                     'name': getattr(container, name_field),  # Dynamic attribute access
-                    'capacity': capacity,
-                    'stored_samples': samples
+                    'capacity': counters.capacity,
+                    'stored_samples': counters.stored_samples
                 })
         return container_data
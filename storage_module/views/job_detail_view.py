@@ -0,0 +1,21 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.views.generic import DetailView
+
+from storage_module import jobs
+from storage_module.models import StorageJob
+
+
+class JobDetailView(LoginRequiredMixin, DetailView):
+    """The progress of a background job, polled from job_status until it finishes."""
+    model = StorageJob
+    template_name = 'storage_module/job_detail.html'
+    pk_url_kwarg = 'job_id'
+    context_object_name = 'job'
+
+    def get_queryset(self):
+        return jobs.visible_to(self.request.user)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['state'] = jobs.state(self.object)
+        return context
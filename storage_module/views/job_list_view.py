@@ -0,0 +1,14 @@
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.views.generic import ListView
+
+from storage_module import jobs
+
+
+class JobListView(LoginRequiredMixin, ListView):
+    """The latest background jobs of the user, or of everyone for staff."""
+    template_name = 'storage_module/jobs.html'
+    context_object_name = 'jobs'
+    paginate_by = 50
+
+    def get_queryset(self):
+        return jobs.visible_to(self.request.user).select_related('owner').order_by('-id')
@@ -0,0 +1,37 @@
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import Http404
+from django.views.generic import TemplateView
+
+from storage_module.profiling import diff_profiles, list_profiles, top_functions
+
+
+class ProfileDetailView(UserPassesTestMixin, TemplateView):
+    """
+    The slowest functions of a stored profile, or with ?against= the
+    functions whose time changed most compared with another profile.
+    """
+    template_name = 'storage_module/profile_detail.html'
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        name = self.kwargs['name']
+        against = self.request.GET.get('against', '')
+        sort = 'own' if self.request.GET.get('sort') == 'own' else 'cumulative'
+        try:
+            if against:
+                rows = diff_profiles(name, against, sort)
+            else:
+                rows = top_functions(name, sort)
+        except FileNotFoundError as e:
+            raise Http404(str(e))
+        context.update(
+            name=name,
+            against=against,
+            sort=sort,
+            rows=rows,
+            profiles=[profile for profile in list_profiles() if profile['name'] != name],
+        )
+        return context
@@ -0,0 +1,29 @@
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.views.generic import TemplateView
+
+from storage_module.profiling import list_profiles
+
+
+class ProfileListView(UserPassesTestMixin, TemplateView):
+    """Lists the stored request profiles, newest first, for staff."""
+    template_name = 'storage_module/profiles.html'
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        url_name = self.request.GET.get('url_name', '')
+        profiles = list_profiles()
+        # Link each profile to the previous one of the same view for diffing.
+        latest = {}
+        for profile in reversed(profiles):
+            profile['previous'] = latest.get(profile['url_name'])
+            latest[profile['url_name']] = profile['name']
+        context.update(
+            profiles=[profile for profile in profiles
+                      if not url_name or profile['url_name'] == url_name],
+            url_names=sorted({profile['url_name'] for profile in profiles}),
+            url_name=url_name,
+        )
+        return context
@@ -2,10 +2,14 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import get_object_or_404
 from django.views.generic import DetailView
 
+from storage_module import fragments
+from storage_module.conditional import conditional_view, container_condition
 from storage_module.forms import MoveBoxForm
-from storage_module.models import BoxPosition, DimRack
+from storage_module.models import ContainerOccupancy, DimRack
+from storage_module.occupancy import occupancy_map
 
 
+@conditional_view(container_condition(ContainerOccupancy.RACK, 'rack_id'))
 class RackDetailView(LoginRequiredMixin, DetailView):
     model = DimRack
     template_name = 'storage_module/freezer_detail.html'
@@ -31,29 +35,35 @@ class RackDetailView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         rack = self.object
-        boxes = rack.boxes.all()
-        context['inside_freezer'] = self.build_box_data(boxes)
+        context.update(fragments.cached(
+            ContainerOccupancy.RACK, rack.pk, 'detail', self.get_contents))
         context.update({
             'type': 'rack',
             'name': rack.rack_name,
             'obj': rack,
             'icon': 'fas fa-box-open',
-            'facility': self.get_facility(rack, boxes)
         })
         return context
 
+    def get_contents(self):
+        rack = self.object
+        boxes = rack.boxes.with_location()
+        return {'inside_freezer': self.build_box_data(boxes),
+                'facility': self.get_facility(rack, boxes)}
+
     def build_box_data(self, boxes):
         box_data = []
+        occupancy = occupancy_map(ContainerOccupancy.BOX, [box.id for box in boxes])
         for box in boxes:
-            samples_in_box = BoxPosition.objects.filter(box=box).count()
-            if samples_in_box > 0:
+            counters = occupancy.get(box.id)
+            if counters and counters.stored_samples > 0:
                 _box = {
                     'id': box.id,
                     'url': 'box_detail',
                     'icon': 'fas fa-cube',
                     'name': box.box_name,
-                    'capacity': box.box_capacity,
-                    'stored_samples': samples_in_box,
+                    'capacity': counters.capacity,
+                    'stored_samples': counters.stored_samples,
                 }
                 box_data.append(_box)
         return box_data
@@ -65,5 +75,5 @@ class RackDetailView(LoginRequiredMixin, DetailView):
         elif rack.shelf:
             facility = getattr(rack, 'shelf').freezer.facility
         elif boxes:
-            facility = boxes[0].facility
+            facility = boxes[0].location['facility']
         return facility
@@ -1,10 +1,12 @@
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from django.views.generic import DetailView
 
 from storage_module.forms import MoveSampleForm
-from storage_module.models import BoxPosition, DimBox, DimSample, Note
+from storage_module.models import DimSample, Note
+from storage_module.moves import move_samples
 
 
 class SampleDetailView(LoginRequiredMixin, DetailView):
@@ -15,24 +17,42 @@ class SampleDetailView(LoginRequiredMixin, DetailView):
 
     def get_object(self, queryset=None):
         sample_id = self.kwargs.get('sample_id')
-        return get_object_or_404(DimSample, sample_id=sample_id)
+        return get_object_or_404(DimSample.objects.with_location(), sample_id=sample_id)
 
     def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
         form = MoveSampleForm(request.POST)
-        if form.is_valid():
-            sample_box_position = self.sample_position
-            sample_box_position.box = form.cleaned_data['box']
-            sample_box_position.x_position = form.cleaned_data['x_position']
-            sample_box_position.y_position = form.cleaned_data['y_position']
-            sample_box_position.save()
+        if any(name in request.POST for name in form.fields):
+            if form.is_valid():
+                self.move(form.cleaned_data)
+            else:
+                for errors in form.errors.values():
+                    for error in errors:
+                        messages.error(request, error)
 
         note_content = request.POST.get('note')
         if note_content:
             user = request.user if request.user.is_authenticated else User.objects.get(
                 username='Guest')
-            Note.objects.create(sample=self.get_object(), author=user, text=note_content)
+            Note.objects.create(sample=self.object, author=user, text=note_content)
         return super().get(request, *args, **kwargs)
 
+    def move(self, cleaned_data):
+        """
+        Moves the sample, placed or not, through the move engine, which locks
+        the boxes and refuses an occupied or reserved slot.
+        """
+        box = cleaned_data['box']
+        # The form takes 1-based columns; positions store 0-based ones.
+        conflicts = move_samples([(self.object.sample_id, box,
+                                   cleaned_data['x_position'] - 1,
+                                   cleaned_data['y_position'])])
+        for message in conflicts.values():
+            messages.error(self.request, message)
+        if not conflicts:
+            messages.success(self.request, f'Moved {self.object.sample_id} to '
+                                           f'{box.box_name}.')
+
     def get_location(self, loc):
         return self.box.location.get(loc, None) if self.box else None
 
@@ -59,18 +79,8 @@ class SampleDetailView(LoginRequiredMixin, DetailView):
 
     @property
     def sample_position(self):
-        try:
-            sample_position = BoxPosition.objects.get(sample_id=self.object.sample_id)
-        except BoxPosition.DoesNotExist:
-            sample_position = None
-        return sample_position
+        return self.object.position
 
     @property
     def box(self):
-        box = None
-        if self.sample_position:
-            try:
-                box = DimBox.objects.get(boxposition=self.sample_position)
-            except DimBox.DoesNotExist:
-                box = None
-        return box
+        return self.object.box
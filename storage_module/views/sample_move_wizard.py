@@ -1,24 +1,109 @@
+from collections import OrderedDict
+
 from django import forms
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect
 from django.urls import reverse
 from formtools.wizard.views import SessionWizardView
 
-from storage_module.forms import (BoxForm, FacilityForm, FreezerForm, SampleMoveForm)
-from storage_module.models import BoxPosition, DimBox, DimSample
+from storage_module import jobs, reservations, selections
+from storage_module.forms import BoxForm, FacilityForm, FreezerForm, SampleMoveForm, \
+    position_choices
+from storage_module.locations import boxes_under
+from storage_module.models import DimBox
+from storage_module.moves import move_samples
 
 
 class SampleMoveWizard(LoginRequiredMixin, SessionWizardView):
     form_list = [FacilityForm, FreezerForm, BoxForm, SampleMoveForm]
     template_name = 'storage_module/wizard/wizard_form.html'
 
+    @property
+    def sample_ids(self):
+        """
+        The samples being moved: those of the saved selection named by the
+        selection parameter, or the comma-separated sample_ids, which only
+        suit a handful of samples. They are resolved when the wizard starts
+        and kept in its storage, so the selection is unpacked once per run of
+        the wizard rather than on every step.
+        """
+        requested = (self.request.GET.get('selection', ''),
+                     self.request.GET.get('sample_ids', ''))
+        extra_data = self.storage.extra_data
+        if extra_data.get('samples_for') != list(requested):
+            extra_data = {'samples_for': list(requested),
+                          'sample_ids': self.resolve_sample_ids(*requested)}
+            self.storage.extra_data = extra_data
+        return extra_data['sample_ids']
+
+    def resolve_sample_ids(self, selection_id, sample_ids):
+        if selection_id:
+            selection = selections.get(selection_id, self.request.user)
+            if selection is None:
+                raise Http404('No such selection.')
+            return selections.sample_ids(selection)
+        return [sample_id for sample_id in sample_ids.split(',') if sample_id]
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        # Starting over has reset the storage. Resolve the samples for this run
+        # now, which also turns away an unknown selection on the first page.
+        self.sample_ids
+        return response
+
+    def validated_form(self, step):
+        """
+        The form of a completed step, bound to its stored data and validated
+        once per request. formtools rebuilds and revalidates a step every
+        time its cleaned data is asked for, which costs the queries of its
+        choice fields each time.
+        """
+        validated = self.__dict__.setdefault('_validated_forms', {})
+        data = self.storage.get_step_data(step)
+        if step not in validated or validated[step][0] != data:
+            form = self.get_form(step=step, data=data,
+                                 files=self.storage.get_step_files(step))
+            form.is_valid()
+            validated[step] = (data, form)
+        return validated[step][1]
+
+    def get_cleaned_data_for_step(self, step):
+        if step not in self.form_list:
+            return None
+        form = self.validated_form(step)
+        return form.cleaned_data if form.is_valid() else None
+
+    def render_done(self, form, **kwargs):
+        """
+        Revalidates the earlier steps as formtools does, but through
+        validated_form, and takes the final step as the formset just posted
+        and validated rather than validating its samples a second time. The
+        wizard starts over only once done() has made or queued the move.
+        """
+        final_forms = OrderedDict()
+        for step in self.get_form_list():
+            form_obj = form if step == self.steps.current else self.validated_form(step)
+            if not form_obj.is_valid():
+                return self.render_revalidation_failure(step, form_obj, **kwargs)
+            final_forms[step] = form_obj
+        self.keep_storage = False
+        done_response = self.done(list(final_forms.values()), form_dict=final_forms,
+                                  **kwargs)
+        if not self.keep_storage:
+            self.storage.reset()
+        return done_response
+
+    def render_again(self, formset):
+        """
+        Shows the positions step again with its errors, keeping the wizard's
+        state and reservations so the user only has to fix the positions.
+        """
+        self.keep_storage = True
+        return self.render(formset)
+
     def get_form_kwargs(self, step=None):
         kwargs = super(SampleMoveWizard, self).get_form_kwargs(step=step)
-        sample_ids = self.request.GET.get('sample_ids', '')
-        if sample_ids:
-            kwargs.update({'sample_ids': sample_ids.split(',')})
         if step == '1':
             selected_facility = self.get_cleaned_data_for_step('0')['facility']
             kwargs.update({'facility': selected_facility})
@@ -27,93 +112,104 @@ class SampleMoveWizard(LoginRequiredMixin, SessionWizardView):
             kwargs.update({'freezer': selected_freezer})
         elif step == '3':
             selected_box = self.get_cleaned_data_for_step('2')['box']
-            kwargs.update({'box': selected_box})
+            # Only the positions step lists the samples.
+            kwargs.update({'box': selected_box, 'sample_ids': self.sample_ids})
         return kwargs
 
     def get_form(self, step=None, data=None, files=None):
+        # post() asks for the current step's form without naming the step.
+        step = self.steps.current if step is None else step
         form_kwargs = self.get_form_kwargs(step)
         form = super().get_form(step, data, files)
 
         if step == '1':
             selected_facility = self.get_cleaned_data_for_step('0')['facility']
-            freezer_queryset = list(selected_facility.dimfreezer_set.all())
             form.fields['freezer'].queryset = selected_facility.dimfreezer_set.all()
 
         elif step == '2':
             selected_freezer = self.get_cleaned_data_for_step('1')['freezer']
-            all_shelves = selected_freezer.shelves.all()
-            all_boxes = DimBox.objects.filter(
-                Q(shelf__freezer=selected_freezer) |
-                Q(rack__shelf__freezer=selected_freezer) |
-                Q(rack__freezer=selected_freezer) |
-                Q(freezer=selected_freezer)
-            )
             if selected_freezer:
-                form.fields['box'].queryset = all_boxes
+                form.fields['box'].queryset = boxes_under(selected_freezer)
 
         if step == '3':
             sample_ids = form_kwargs.get('sample_ids', [])
             selected_box = self.get_cleaned_data_for_step('2')['box']
             SampleMoveFormSet = forms.formset_factory(SampleMoveForm, extra=0,
                                                       can_delete=False)
+            # Every form offers the grid of the same box; work it out once.
+            form_kwargs = {'choices': position_choices(selected_box or DimBox())}
             if data is not None:
-                form = SampleMoveFormSet(data=data, initial=[
+                form = SampleMoveFormSet(data=data, form_kwargs=form_kwargs, initial=[
                     {'sample_id': sample_id, 'box': selected_box} for sample_id in
                     sample_ids])
             else:
                 form = SampleMoveFormSet(
-                    initial=[{'sample_id': sample_id, 'box': selected_box} for sample_id
-                             in sample_ids])
+                    form_kwargs=form_kwargs,
+                    initial=self.held_initial(sample_ids, selected_box))
 
         return form
 
-    def validate_position(self, box, x_position, y_position):
-        """Validates if a BoxPosition is occupied."""
-        return BoxPosition.objects.filter(box=box, x_position=x_position,
-                                          y_position=y_position).exists()
-
-    def create_box_position(self, sample, box, x_position, y_position):
-        """Creates or updates a BoxPosition."""
-        try:
-            box_position = BoxPosition.objects.get(
-                sample=sample)
-        except BoxPosition.DoesNotExist:
-            BoxPosition.objects.create(sample=sample, box=box, x_position=x_position,
-                                       y_position=y_position)
-        else:
-            box_position.box = box
-            box_position.x_position = x_position
-            box_position.y_position = y_position
-            box_position.save()
+    def held_initial(self, sample_ids, box):
+        """
+        Reserves free slots of the chosen box for the samples, so they are
+        still free when the wizard is done, and suggests them in the forms.
+        """
+        initial = [{'sample_id': sample_id, 'box': box} for sample_id in sample_ids]
+        if box is None:
+            return initial
+        held = reservations.hold(reservations.wizard_holder(self.request), box,
+                                 len(sample_ids))
+        for form_initial, (x_position, y_position) in zip(initial, held):
+            # The form offers 1-based columns; positions are 0-based.
+            form_initial.update(new_x_position=x_position + 1, new_y_position=y_position)
+        return initial
+
+    def get_context_data(self, form, **kwargs):
+        context = super().get_context_data(form=form, **kwargs)
+        if self.steps.current == self.steps.last:
+            context['reserved_until'] = reservations.held_until(
+                reservations.wizard_holder(self.request))
+        return context
 
     def done(self, form_list, **kwargs):
-        new_positions = []
-        box = form_list[-1][0].box if len(form_list[-1]) > 0 else None
-        for form in form_list[-1]:
-            if form.is_valid():
-                cleaned_data = form.cleaned_data
-                box = form.initial.get('box')
-                sample_id = form.initial.get('sample_id')
-
-                new_x_position = int(cleaned_data["new_x_position"]) - 1
-
-                if self.validate_position(box, cleaned_data["new_x_position"],
-                                          cleaned_data["new_y_position"]):
-                    messages.error(self.request,
-                                   "The chosen position is already occupied. Please "
-                                   "choose a different position.")
-                    return self.render(form_list[-1])
-
-                sample = DimSample.objects.get(sample_id=sample_id)
-                new_positions.append({
-                    'sample': sample,
-                    'box': box,
-                    'x_position': cleaned_data.get("new_x_position"),
-                    'y_position': cleaned_data.get("new_y_position")
-                })
-
-        for position in new_positions:
-            self.create_box_position(position["sample"], position["box"],
-                                     position["x_position"], position["y_position"])
-
+        formset = form_list[-1]
+        box = self.get_cleaned_data_for_step('2')['box']
+        targets = []
+        for form in formset:
+            if not form.is_valid():
+                # Its errors are shown when the step is rendered again below.
+                continue
+            x_position = form.cleaned_data.get('new_x_position')
+            y_position = form.cleaned_data.get('new_y_position')
+            if not x_position or not y_position:
+                form.add_error(None, 'Please choose a position for this sample.')
+                continue
+            # The form offers 1-based columns; positions store 0-based ones.
+            targets.append((form.initial.get('sample_id'), form.initial.get('box', box),
+                            int(x_position) - 1, y_position))
+        if not formset.is_valid():
+            return self.render_again(formset)
+
+        holder = reservations.wizard_holder(self.request)
+        if jobs.should_queue(len(targets)):
+            # The reservations stay held for the job, which releases them.
+            job = jobs.enqueue(
+                'move', owner=self.request.user,
+                description=f'Move {len(targets)} samples to {box.box_name}',
+                targets=[(sample_id, getattr(target_box, 'pk', target_box), x_position,
+                          y_position)
+                         for sample_id, target_box, x_position, y_position in targets],
+                holder=holder, box_id=box.id)
+            return HttpResponseRedirect(jobs.job_url(job))
+        conflicts = move_samples(targets, holder)
+        if conflicts:
+            forms_by_sample = {form.initial.get('sample_id'): form for form in formset}
+            for sample_id, message in conflicts.items():
+                if sample_id in forms_by_sample:
+                    forms_by_sample[sample_id].add_error(None, message)
+                else:
+                    messages.error(self.request, f'{sample_id}: {message}')
+            return self.render_again(formset)
+
+        reservations.release(holder)
         return HttpResponseRedirect(reverse('box_detail', args=[box.id]))
@@ -1,106 +1,192 @@
+from urllib.parse import urlencode
+
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.paginator import Paginator
-from django.shortcuts import get_object_or_404
+from django.http import Http404
+from django.shortcuts import get_object_or_404, redirect
+from django.urls import reverse
 from django.views.generic import TemplateView
 
-from storage_module.models import DimBox, DimFacility, DimSample, DimSampleStatus, \
-    DimSampleType, DimSourceFile
+from storage_module import jobs, reference, search, selections
+from storage_module.models import DimSample
+from storage_module.pagination import KeysetPaginator
+from storage_module.transitions import transition_samples
 from storage_module.views.view_mixin import ViewMixin
 
 
 class SamplesView(LoginRequiredMixin, ViewMixin, TemplateView):
     template_name = 'storage_module/samples.html'
 
+    rows_options = [10, 25, 50, 100, 1000, 10000]
+
+    # Best matches of a search, shown above the first page of the table.
+    best_matches_count = 5
+
+    # The selection the last action worked on, offered again as a scope.
+    selection = None
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         query = self.request.GET.get('search')
         sample_type = self.request.GET.get('sample_type')
         box = self.request.GET.get('box')
         facility = self.request.GET.get('facility')
-        row_number = int(self.request.POST.get('rows', 10))
-        samples_list = self.get_samples_from_db(
-            query=None, sample_type=None, box=None, facility=None)
-        total_samples = len(samples_list)
+        row_number = self.get_row_number()
         samples_list = self.get_samples_from_db(query, sample_type, box, facility)
-        page_number = self.request.GET.get('page')
-        paginator = Paginator(samples_list, row_number)
+        paginator = KeysetPaginator(samples_list, row_number, key='sample_id')
+        samples = paginator.page(after=self.request.GET.get('after'),
+                                 before=self.request.GET.get('before'),
+                                 last=self.request.GET.get('last') == '1')
+
+        # The table stays in sample_id order so it can be paged by key; the
+        # ranked matches lead the first page instead.
+        best_matches = []
+        if query and not any(self.request.GET.get(cursor)
+                             for cursor in ('after', 'before', 'last')):
+            best_matches = search.ranked_samples(query, limit=self.best_matches_count)
+
+        filters = self.request.GET.copy()
+        for cursor in ('after', 'before', 'last', 'page'):
+            filters.pop(cursor, None)
+        filters['rows'] = row_number
 
         context.update(
-            samples=paginator.get_page(page_number),
+            samples=samples,
             sample_statuses=self.sample_statuses,
             sample_types=self.sample_types,
             boxes=self.boxes,
             facilities=self.facilities,
             source_files=self.source_files,
-            total_samples=total_samples,
-            rows_options=[10, 25, 50, 100, 1000, 10000],
+            total_samples=DimSample.objects.count(),
+            matching_samples=samples_list.order_by().count(),
+            page_query=filters.urlencode(),
+            row_number=row_number,
+            rows_options=self.rows_options,
+            selection=self.selection,
+            best_matches=best_matches,
         )
         return context
 
+    def get_row_number(self):
+        rows = self.request.GET.get('rows') or self.request.POST.get('rows')
+        return int(rows) if rows in map(str, self.rows_options) else self.rows_options[0]
+
     @property
     def sample_statuses(self):
-        return DimSampleStatus.objects.all()
+        return reference.get('sample_statuses')
 
     @property
     def sample_types(self):
-        return list(set(DimSampleType.objects.values_list('sample_type', flat=True)))
+        return reference.get('sample_types')
 
     @property
     def boxes(self):
-        return list(set(DimBox.objects.values_list('box_name', flat=True)))
+        return reference.get('boxes')
 
     @property
     def facilities(self):
-        return list(set(DimFacility.objects.values_list('facility_name', flat=True)))
+        return reference.get('facilities')
 
     @property
     def source_files(self):
-        return list(set(DimSourceFile.objects.values_list('source_file_name', flat=True)))
+        return reference.get('source_files')
 
     def post(self, request, *args, **kwargs):
-        sample_ids = request.POST.getlist('sample_id')
         action = request.POST.get('action')
-        if action == "export":
-            return self.export_samples_as_csv(sample_ids)
-        elif action and int(action) in self.sample_statuses.values_list('id', flat=True):
-            for sample_id in sample_ids:
-                sample = get_object_or_404(DimSample, sample_id=sample_id)
-                new_status = get_object_or_404(DimSampleStatus, id=action)
-                sample.sample_status = new_status
-                sample.save()
+        if not action:
+            return self.get(request, *args, **kwargs)
+        self.selection = selection = self.get_selection(action)
+        if action == 'move':
+            return redirect('{}?{}'.format(reverse('move_samples'),
+                                           urlencode({'selection': selection.pk})))
+        if action.startswith('export'):
+            file_format = 'xlsx' if action.endswith('xlsx') else 'csv'
+            if jobs.should_queue(selection.size):
+                return self.queue(selection, 'export', f'Export {selection}',
+                                  file_format=file_format)
+            return self.export_samples(selection, file_format)
+        elif action == 'note':
+            text = request.POST.get('note', '').strip()
+            if not text:
+                messages.error(request, 'Please write the note to add.')
+            elif jobs.should_queue(selection.size):
+                return self.queue(selection, 'note', f'Add a note to {selection}',
+                                  text=text)
+            else:
+                added = selections.add_note(selection, text, author=request.user)
+                messages.success(request, f'Added the note to {added} samples.')
+        elif reference.sample_status(action):
+            new_status = reference.sample_status(action)
+            if jobs.should_queue(selection.size):
+                return self.queue(selection, 'transition',
+                                  f'Set {selection} to {new_status.name}',
+                                  status=new_status.pk)
+            changed = selections.transition(selection, new_status, user=request.user)
+            messages.success(request, f'{changed} samples are now {new_status.name}.')
         return self.get(request, *args, **kwargs)
 
+    def queue(self, selection, kind, description, **params):
+        """Hands an action on a large selection to the job runner."""
+        job = jobs.enqueue(kind, owner=self.request.user, selection=selection,
+                           description=description, **params)
+        return redirect(jobs.job_url(job))
+
+    def get_selection(self, action):
+        """
+        Saves the samples an action applies to as a selection, which the
+        action then works through a chunk at a time: every sample matching
+        the filters for the "all matching" scope and actions, or the checked
+        samples. A scope naming an earlier selection reuses it, so a
+        follow-up action reaches the same samples even once they no longer
+        match the filters.
+        """
+        request = self.request
+        scope = request.POST.get('scope', '')
+        selection = selections.get(scope, request.user)
+        if selection is not None:
+            return selection
+        if scope == 'matching' or action.startswith('export_all'):
+            return selections.create(
+                self.get_samples_from_db(
+                    request.GET.get('search'), request.GET.get('sample_type'),
+                    request.GET.get('box'), request.GET.get('facility')),
+                owner=request.user,
+                description=(f'samples matching {request.GET.urlencode()}'
+                             if request.GET else 'all samples'))
+        return selections.create(request.POST.getlist('sample_id'), owner=request.user)
+
     def get(self, request, *args, **kwargs):
         context = self.get_context_data(**kwargs)
         sample_id = request.GET.get('sample_id', None)
         new_status_id = request.GET.get('sample_status', None)
         if sample_id and new_status_id:
-            sample = get_object_or_404(DimSample, sample_id=sample_id)
-            new_status = get_object_or_404(DimSampleStatus, id=new_status_id)
-            sample.sample_status = new_status
-            sample.save()
+            get_object_or_404(DimSample, sample_id=sample_id)
+            new_status = reference.sample_status(new_status_id)
+            if new_status is None:
+                raise Http404('No such sample status.')
+            transition_samples([sample_id], new_status, user=request.user)
         return self.render_to_response(context)
 
     @staticmethod
     def get_samples_from_db(query=None, sample_type=None, box=None, facility=None):
-        queryset = DimSample.objects.values(
+        queryset = DimSample.objects.with_location(
+            'facility_id', 'facility_name', 'box_id', 'box_name').values(
             'sample_id',
             'sample_type__sample_type',
-            'box_position__box__freezer__facility__facility_name',
-            'box_position__box__freezer__facility__id',
+            'facility_name',
+            'facility_id',
             'source_file__source_file_name',
-            'box_position__box__box_name',
-            'box_position__box__id',
+            'box_name',
+            'box_id',
             'date_sampled',
             'sample_status__name'
         )
         if query:
-            queryset = queryset.filter(sample_id__icontains=query)
+            queryset = search.filter_samples(queryset, query)
         if sample_type and sample_type != 'all':
             queryset = queryset.filter(sample_type__sample_type=sample_type)
         if box and box != 'all':
-            queryset = queryset.filter(box_position__box__box_name=box)
+            queryset = queryset.filter(box_name=box)
         if facility and facility != 'all':
-            queryset = queryset.filter(
-                box_position__box__freezer__facility__facility_name=facility)
+            queryset = queryset.filter(facility_name=facility)
         return queryset
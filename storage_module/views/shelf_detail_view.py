@@ -2,10 +2,14 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import get_object_or_404
 from django.views.generic import DetailView
 
+from .. import fragments
+from ..conditional import conditional_view, container_condition
 from ..forms import MoveBoxForm
-from ..models import (BoxPosition, DimShelf)
+from ..models import ContainerOccupancy, DimShelf
+from ..occupancy import occupancy_map
 
 
+@conditional_view(container_condition(ContainerOccupancy.SHELF, 'shelf_id'))
 class ShelfDetailView(LoginRequiredMixin, DetailView):
     model = DimShelf
     template_name = 'storage_module/freezer_detail.html'
@@ -29,46 +33,47 @@ class ShelfDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
 
         shelf = self.object
-        boxes = shelf.boxes.all()
-        move_box_form = MoveBoxForm()
+        context.update(fragments.cached(
+            ContainerOccupancy.SHELF, shelf.pk, 'detail', self.get_contents))
+        context['type'] = 'Shelf'
+        context['name'] = shelf.shelf_name
+        context['obj'] = shelf
+        context['icon'] = 'fas fa-layer-group'
 
+        return context
+
+    def get_contents(self):
+        shelf = self.object
         box_n_shelves_n_racks_data = []
-        for box in shelf.boxes.filter(rack=None):
-            samples_in_box = BoxPosition.objects.filter(box=box).count()
-            if samples_in_box > 0:
+        boxes = list(shelf.boxes.filter(rack=None))
+        box_occupancy = occupancy_map(ContainerOccupancy.BOX, [box.id for box in boxes])
+        for box in boxes:
+            counters = box_occupancy.get(box.id)
+            if counters and counters.stored_samples > 0:
                 _box = {
                     'id': box.id,
                     'url': 'box_detail',
                     'icon': 'fas fa-cube',
                     'name': box.box_name,
-                    'capacity': box.box_capacity,
-                    'stored_samples': samples_in_box,
+                    'capacity': counters.capacity,
+                    'stored_samples': counters.stored_samples,
                 }
                 box_n_shelves_n_racks_data.append(_box)
 
-        for rack in shelf.racks.all():
-            boxes_on_rack = rack.boxes.all()
-            capacity = 0
-            boxes_on_rack_samples = 0
-            for box in boxes_on_rack:
-                boxes_on_rack_samples = BoxPosition.objects.filter(box=box).count()
-                if boxes_on_rack_samples > 0:
-                    capacity += box.box_capacity
+        racks = list(shelf.racks.all())
+        rack_occupancy = occupancy_map(ContainerOccupancy.RACK,
+                                       [rack.id for rack in racks])
+        for rack in racks:
+            counters = rack_occupancy.get(rack.id)
             _rack = {
                 'id': rack.id,
                 'url': 'rack_detail',
                 'icon': 'fas fa-box-open',
                 'name': rack.rack_name,
-                'capacity': capacity,
-                'stored_samples': boxes_on_rack_samples
+                'capacity': counters.capacity if counters else 0,
+                'stored_samples': counters.stored_samples if counters else 0
             }
             box_n_shelves_n_racks_data.append(_rack)
 
-        context['inside_freezer'] = box_n_shelves_n_racks_data
-        context['type'] = 'Shelf'
-        context['name'] = shelf.shelf_name
-        context['obj'] = shelf
-        context['icon'] = 'fas fa-layer-group'
-        context['facility'] = shelf.freezer.facility
-
-        return context
+        return {'inside_freezer': box_n_shelves_n_racks_data,
+                'facility': shelf.freezer.facility}
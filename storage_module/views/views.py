@@ -1,26 +1,40 @@
+import os
+from functools import partial
+
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
+from django.http import FileResponse, Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect
 from django.template.loader import render_to_string
+from django.views.decorators.http import require_POST
 from django.views.generic import TemplateView
 
-from storage_module.models import (BoxPosition, DimFreezer, DimRack,
+from storage_module import fragments, jobs
+from storage_module.conditional import container_condition
+from storage_module.models import (ContainerOccupancy, DimBox, DimFreezer, DimRack,
                                    DimSample, DimSampleType, DimShelf)
+from storage_module.instrumentation import read_reports
+from storage_module.profiling import profile_path
 from storage_module.util import get_data
 
 
+def dashboard_counts():
+    """The figures of the home page, as independent queries keyed by name."""
+    return {
+        'total_specimen': DimSample.objects.count,
+        'specimen_types': DimSampleType.objects.count,
+        'unique_participants': DimSample.objects.values(
+            'participant_id').distinct().count,
+        'studies': DimSample.objects.values('protocol_number').distinct().count,
+    }
+
+
 class HomeView(TemplateView):
     template_name = 'storage_module/home.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['total_specimen'] = DimSample.objects.all().count()
-        context['specimen_types'] = DimSampleType.objects.all().count()
-        context['unique_participants'] = DimSample.objects.values(
-            'participant_id').distinct().count()
-        context['studies'] = DimSample.objects.values(
-            'protocol_number').distinct().count()
-
+        context.update({name: count() for name, count in dashboard_counts().items()})
         return context
 
 
@@ -38,32 +52,95 @@ def get_racks(request):
     return JsonResponse(list(racks), safe=False)
 
 
+def freezer_children(freezer_id):
+    """
+    The tree rows of a freezer's loose boxes, shelves and racks, as three
+    independent builders.
+    """
+    return [
+        partial(get_data, DimBox.objects.filter(freezer_id=freezer_id, shelf=None,
+                                                rack=None),
+                'box_detail', 'fas fa-cube', lambda box: box.box_name,
+                ContainerOccupancy.BOX),
+        partial(get_data, DimShelf.objects.filter(freezer_id=freezer_id),
+                'shelf_detail', 'fas fa-layer-group', lambda shelf: shelf.shelf_name,
+                ContainerOccupancy.SHELF),
+        partial(get_data, DimRack.objects.filter(freezer_id=freezer_id),
+                'rack_detail', 'fas fa-box-open', lambda rack: rack.rack_name,
+                ContainerOccupancy.RACK),
+    ]
+
+
+def render_freezer_children(rows):
+    return render_to_string("storage_module/child_box_detail.html",
+                            {'inside_freezer': rows})
+
+
 @login_required
+@container_condition(ContainerOccupancy.FREEZER, 'freezer_id')
 def freezer_data(request, freezer_id):
-    freezer = get_object_or_404(DimFreezer, id=freezer_id)
-    box_n_shelves_n_racks_data = []
-
-    box_n_shelves_n_racks_data += get_data(freezer.boxes.filter(shelf=None, rack=None),
-                                           'box_detail', 'fas fa-cube',
-                                           lambda box: box.box_name,
-                                           lambda box: box.box_capacity,
-                                           BoxPosition.objects)
-    box_n_shelves_n_racks_data += get_data(freezer.shelves.all(), 'shelf_detail',
-                                           'fas fa-layer-group',
-                                           lambda shelf: shelf.shelf_name,
-                                           sum([box.box_capacity for box in
-                                                shelf.boxes.all() if
-                                                BoxPosition.objects.filter(
-                                                    box=box).count() > 0]),
-                                           BoxPosition.objects)
-    box_n_shelves_n_racks_data += get_data(freezer.racks.all(), 'rack_detail',
-                                           'fas fa-box-open', lambda rack: rack.rack_name,
-                                           sum([box.box_capacity for box in
-                                                rack.boxes.all() if
-                                                BoxPosition.objects.filter(
-                                                    box=box).count() > 0]),
-                                           BoxPosition.objects)
-
-    html = render_to_string("storage_module/child_box_detail.html",
-                            {'inside_freezer': box_n_shelves_n_racks_data})
+    def render():
+        get_object_or_404(DimFreezer, id=freezer_id)
+        return render_freezer_children(
+            [row for build in freezer_children(freezer_id) for row in build()])
+
+    html = fragments.cached(ContainerOccupancy.FREEZER, freezer_id, 'freezer_data',
+                            render)
     return JsonResponse({'html': html})
+
+
+@staff_member_required
+def sql_reports(request):
+    """
+    The latest SQL reports written by SqlInstrumentationMiddleware, newest
+    first. ?n_plus_one=1 keeps only requests with suspected N+1 queries and
+    ?path= those whose path starts with the given prefix.
+    """
+    try:
+        limit = min(int(request.GET.get('limit', 50)), 1000)
+    except ValueError:
+        limit = 50
+    reports = read_reports(limit)
+    if request.GET.get('n_plus_one'):
+        reports = [report for report in reports if report['n_plus_one']]
+    if request.GET.get('path'):
+        reports = [report for report in reports
+                   if report['path'].startswith(request.GET['path'])]
+    return JsonResponse({'reports': reports})
+
+
+@staff_member_required
+def download_profile(request, name):
+    """A stored profile as a file for pstats, snakeviz and similar tools."""
+    try:
+        path = profile_path(name)
+    except FileNotFoundError as e:
+        raise Http404(str(e))
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name)
+
+
+@login_required
+def job_status(request, job_id):
+    """The progress of a background job, as polled by its page."""
+    job = get_object_or_404(jobs.visible_to(request.user), pk=job_id)
+    return JsonResponse(jobs.state(job))
+
+
+@login_required
+@require_POST
+def cancel_job(request, job_id):
+    job = get_object_or_404(jobs.visible_to(request.user), pk=job_id)
+    jobs.cancel(job)
+    return redirect('job_detail', job_id=job.pk)
+
+
+@login_required
+def download_job_result(request, job_id):
+    """The file written by a finished export job."""
+    job = get_object_or_404(jobs.visible_to(request.user), pk=job_id)
+    if not job.result_path or not os.path.isfile(job.result_path):
+        raise Http404('This job has no file to download.')
+    stamp = job.finished_date.strftime('%Y-%m-%d_%H-%M-%S')
+    extension = os.path.splitext(job.result_path)[1]
+    return FileResponse(open(job.result_path, 'rb'), as_attachment=True,
+                        filename=f'samples_{stamp}{extension}')